@@ -0,0 +1,264 @@
+"""amqp_publisher.py
+Publisher AMQP de larga vida con un pool de conexiones persistentes.
+
+Cada worker del pool es un hilo dueño de su propia `BlockingConnection` (pika no es
+thread-safe), declara la topología una sola vez por conexión y reconecta solo con
+backoff cuando el broker se cae. Los productores (por ejemplo un endpoint `async def`)
+solo encolan el mensaje: `publish()` no hace I/O y retorna en microsegundos.
+
+Con `confirm=True` cada canal usa publisher confirms: el Future de `publish()` se resuelve
+recién cuando el broker confirma (basic.ack); un basic.nack lo resuelve con excepción.
+"""
+
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import pika
+
+logger = logging.getLogger(__name__)
+
+
+def get_connection_params(default_host: str = 'localhost') -> pika.ConnectionParameters:
+    """ConnectionParameters desde variables de entorno (mismas credenciales que el resto del proyecto)."""
+    return pika.ConnectionParameters(
+        host=os.environ.get('RABBIT_HOST', default_host),
+        port=int(os.environ.get('RABBIT_PORT', '5672')),
+        credentials=pika.PlainCredentials(
+            os.environ.get('RABBIT_USER', 'ecomarket_user'),
+            os.environ.get('RABBIT_PASS', 'ecomarket_password'),
+        ),
+        heartbeat=600,
+        blocked_connection_timeout=300
+    )
+
+
+class _Envelope:
+    __slots__ = ('exchange', 'routing_key', 'body', 'properties', 'future')
+
+    def __init__(self, exchange, routing_key, body, properties, future):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.future = future
+
+
+_STOP = object()
+
+
+class PooledPublisher:
+    """Pool de hilos publicadores con conexión persistente y reconexión automática.
+
+    `setup_topology(channel)` se llama en cada (re)conexión para declarar exchanges y colas;
+    en el camino normal eso ocurre una sola vez al arrancar.
+    """
+
+    def __init__(
+        self,
+        params_factory: Callable[[], pika.ConnectionParameters] = get_connection_params,
+        setup_topology: Optional[Callable[[object], None]] = None,
+        pool_size: int = 2,
+        max_queue: int = 10000,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        name: str = 'amqp-publisher',
+        confirm: bool = False,
+    ):
+        self._params_factory = params_factory
+        self._setup_topology = setup_topology
+        self._pool_size = max(1, pool_size)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._name = name
+        self._confirm = confirm
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._lock = threading.Lock()
+        self.published = 0
+        self.failed = 0
+        self.reconnects = 0
+        self.connected_workers = 0
+
+    # ===== CICLO DE VIDA =====
+
+    def start(self) -> None:
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self._pool_size):
+                t = threading.Thread(target=self._worker, name=f"{self._name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info("🔌 %s iniciado con %d conexiones persistentes", self._name, self._pool_size)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene los workers después de vaciar lo que ya estaba encolado."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        logger.info("🔌 %s detenido", self._name)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    # ===== API =====
+
+    def publish(self, exchange: str, routing_key: str, body: bytes,
+                properties: Optional[pika.BasicProperties] = None) -> Future:
+        """Encola un mensaje y retorna un Future que se resuelve cuando el worker lo publica.
+
+        No bloquea: si la cola local está llena o el publisher no está corriendo,
+        el Future se resuelve con excepción de inmediato.
+        """
+        future: Future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError(f"{self._name} no está iniciado"))
+            return future
+        try:
+            self._queue.put_nowait(_Envelope(exchange, routing_key, body, properties, future))
+        except queue.Full:
+            self.failed += 1
+            future.set_exception(RuntimeError(f"{self._name}: cola local llena"))
+        return future
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "pool_size": self._pool_size,
+            "connected_workers": self.connected_workers,
+            "queued": self._queue.qsize(),
+            "published": self.published,
+            "failed": self.failed,
+            "reconnects": self.reconnects,
+        }
+
+    # ===== WORKERS =====
+
+    def _connect(self):
+        connection = pika.BlockingConnection(self._params_factory())
+        channel = connection.channel()
+        if self._confirm:
+            channel.confirm_delivery()
+        if self._setup_topology is not None:
+            self._setup_topology(channel)
+        return connection, channel
+
+    def _worker(self) -> None:
+        connection = channel = None
+        pending: Optional[_Envelope] = None
+        delay = self._reconnect_delay
+        connected = False
+        try:
+            while True:
+                if channel is None or not channel.is_open:
+                    if connected:
+                        connected = False
+                        self._add_connected(-1)
+                    if not self._running and pending is None and self._queue.empty():
+                        break
+                    try:
+                        connection, channel = self._connect()
+                        connected = True
+                        self._add_connected(1)
+                        delay = self._reconnect_delay
+                    except Exception as e:
+                        self.reconnects += 1
+                        logger.error("❌ %s sin conexión a RabbitMQ (reintento en %.1fs): %s",
+                                     self._name, delay, e)
+                        if not self._running:
+                            self._fail_pending(pending, e)
+                            pending = None
+                            self._drain_with_error(e)
+                            break
+                        time.sleep(delay)
+                        delay = min(delay * 2, self._max_reconnect_delay)
+                        continue
+
+                if pending is None:
+                    try:
+                        item = self._queue.get(timeout=1.0)
+                    except queue.Empty:
+                        # Mantener heartbeats vivos mientras no hay tráfico
+                        try:
+                            connection.process_data_events(time_limit=0)
+                        except Exception:
+                            channel = None
+                        continue
+                    if item is _STOP:
+                        break
+                    pending = item
+
+                try:
+                    channel.basic_publish(
+                        exchange=pending.exchange,
+                        routing_key=pending.routing_key,
+                        body=pending.body,
+                        properties=pending.properties
+                    )
+                except (pika.exceptions.NackError, pika.exceptions.UnroutableError) as e:
+                    # El broker rechazó el mensaje: el canal sigue sano, no reintentar a ciegas
+                    self._fail_pending(pending, e)
+                    pending = None
+                    continue
+                except Exception as e:
+                    # El mensaje se conserva y se reintenta tras reconectar
+                    logger.warning("⚠️ %s: fallo publicando, reconectando: %s", self._name, e)
+                    self._close_quietly(connection)
+                    channel = None
+                    continue
+
+                self.published += 1
+                if not pending.future.done():
+                    pending.future.set_result(True)
+                pending = None
+        finally:
+            if connected:
+                self._add_connected(-1)
+            self._close_quietly(connection)
+
+    def _add_connected(self, delta: int) -> None:
+        with self._lock:
+            self.connected_workers += delta
+
+    def _fail_pending(self, envelope: Optional[_Envelope], error: Exception) -> None:
+        if envelope is not None and not envelope.future.done():
+            self.failed += 1
+            envelope.future.set_exception(error)
+
+    def _drain_with_error(self, error: Exception) -> None:
+        stops = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stops += 1
+            else:
+                self._fail_pending(item, error)
+        # Los _STOP son de los demás workers: devolverlos para que también terminen
+        for _ in range(stops):
+            self._queue.put(_STOP)
+
+    @staticmethod
+    def _close_quietly(connection) -> None:
+        try:
+            if connection is not None and connection.is_open:
+                connection.close()
+        except Exception:
+            pass
@@ -1,31 +1,34 @@
 """
 analytics_consumer.py
 Consumer simple que registra los eventos (y sirve como ejemplo para procesamiento adicional).
+Procesa en micro-lotes (por defecto hasta 100 mensajes o 200 ms) con un solo ack por lote.
 """
-import json
 import logging
+from collections import Counter
 from events import get_connection_params
-import pika
+from consumer_base import BatchingConsumer
+import codec
 
 logging.basicConfig(level=logging.INFO)
 
 
-def process_user_created_analytics(ch, method, props, body):
-    try:
-        message = json.loads(body)
-    except Exception:
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
+def process_user_created_analytics(ch, deliveries):
+    results = []
+    event_types = Counter()
+    for delivery in deliveries:
+        try:
+            message = codec.decode(delivery.body, delivery.properties.content_type)
+        except Exception:
+            results.append(False)
+            continue
+        event_types[message.get('event_type')] += 1
+        logging.debug(f"📊 Analytics: evento recibido: {message.get('event_type')} id={message.get('event_id')}")
+        results.append(True)
+    logging.info(f"📊 Analytics: {sum(event_types.values())} eventos en el lote {dict(event_types)}")
+    return results
 
-    logging.info(f"📊 Analytics: evento recibido: {message.get('event_type')} id={message.get('event_id')}")
-    ch.basic_ack(delivery_tag=method.delivery_tag)
-
-
-def start_analytics_consumer():
-    params = get_connection_params()
-    conn = pika.BlockingConnection(params)
-    ch = conn.channel()
 
+def setup_analytics_queue(ch):
     # Declarar exchange fanout
     ch.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
 
@@ -36,11 +39,16 @@ def start_analytics_consumer():
     ch.queue_declare(queue='analytics_queue', durable=True, arguments=args)
     ch.queue_bind(exchange='user_events', queue='analytics_queue')
 
-    ch.basic_qos(prefetch_count=1)
-    ch.basic_consume(queue='analytics_queue', on_message_callback=process_user_created_analytics)
 
-    logging.info('🎧 Analytics consumer esperando en queue analytics_queue...')
-    ch.start_consuming()
+def start_analytics_consumer():
+    BatchingConsumer.from_env(
+        get_connection_params(),
+        'analytics_queue',
+        process_user_created_analytics,
+        setup=setup_analytics_queue,
+        default_batch_size=100,
+        name='Analytics consumer'
+    ).run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,159 @@
+"""branch_overview.py
+Vista consolidada de todas las sucursales para el dashboard central.
+
+- Las sucursales salen del registro (branch_registry.py): las muertas no se consultan
+  (aparecen como `offline` con `skipped`) y el documento lista primero las más rápidas.
+- Todas las sucursales y todos sus endpoints (`/health`, `/api`, `/inventory`,
+  `/sales/stats`) se consultan en paralelo con un `httpx.AsyncClient` compartido
+  (keep-alive): la latencia total es la de la sucursal más lenta, no la suma.
+- Timeout por petición: una sucursal caída no retrasa a las demás más de `timeout`.
+- Peticiones cubiertas (hedged): si una respuesta tarda más de `hedge_after`, se lanza
+  una segunda petición idéntica y gana la primera que responda (solo GET idempotentes).
+  Con latencia conocida, el umbral es 3x la EWMA de esa sucursal (acotado por `hedge_after`).
+  Un error inmediato (conexión rechazada) no se cubre: la sucursal está caída.
+- El documento se guarda `ttl` segundos y las consultas simultáneas comparten la misma
+  ronda en curso (varios dashboards abiertos = una sola ronda por ventana).
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+
+import httpx
+
+from branch_registry import BranchRegistry
+
+ENDPOINTS = {
+    "health": "/health",
+    "info": "/api",
+    "inventory": "/inventory",
+    "sales_stats": "/sales/stats",
+}
+
+
+class BranchOverview:
+    def __init__(self, registry: BranchRegistry, timeout: float = 2.0,
+                 hedge_after: float = 0.25, ttl: float = 2.0):
+        self.registry = registry
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.ttl = ttl
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cached: Optional[dict] = None
+        self._cached_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+        self.rounds = 0
+        self.cache_hits = 0
+        self.hedges = 0
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+
+    async def close(self) -> None:
+        if self._inflight is not None:
+            self._inflight.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _hedged_get(self, url: str, hedge_after: float) -> httpx.Response:
+        first = asyncio.ensure_future(self._client.get(url))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(self._client.get(url)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _get_json(self, url: str, hedge_after: float):
+        response = await asyncio.wait_for(self._hedged_get(url, hedge_after), self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def _branch(self, branch_id: str, url: str) -> dict:
+        latency = self.registry.latency(branch_id)
+        hedge_after = self.hedge_after if latency is None else max(0.02, min(self.hedge_after, 3 * latency))
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._get_json(f"{url}{path}", hedge_after) for path in ENDPOINTS.values()),
+            return_exceptions=True
+        )
+        branch = {"url": url, "latency_ms": round((time.perf_counter() - started) * 1000, 2), "errors": {}}
+        for name, result in zip(ENDPOINTS, results):
+            if isinstance(result, BaseException):
+                branch[name] = None
+                branch["errors"][name] = repr(result)
+            else:
+                branch[name] = result
+        if not branch["errors"]:
+            branch["status"] = "online"
+        elif len(branch["errors"]) < len(ENDPOINTS):
+            branch["status"] = "degraded"
+        else:
+            branch["status"] = "offline"
+        # La latencia del más lento de los endpoints paralelos: es la que ve el dashboard
+        self.registry.observe(
+            branch_id, time.perf_counter() - started, ok=branch["status"] != "offline",
+            error=None if branch["status"] != "offline" else branch["errors"].get("health")
+        )
+        return branch
+
+    async def _round(self) -> dict:
+        started = time.perf_counter()
+        items = list(self.registry.ranked().items())
+        results = await asyncio.gather(*(self._branch(branch_id, url) for branch_id, url in items))
+        branches = {branch_id: result for (branch_id, _), result in zip(items, results)}
+        for record in self.registry.snapshot():
+            if record["branch_id"] not in branches:
+                branches[record["branch_id"]] = {
+                    "url": record["url"], "status": "offline", "skipped": True, "latency_ms": None,
+                    "errors": {"registry": f"sucursal {record['status']} (circuito {record['circuit']})"},
+                    **{name: None for name in ENDPOINTS},
+                }
+        online = [b for b in branches.values() if b["status"] != "offline"]
+        document = {
+            "generated_at": datetime.now().isoformat(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "summary": {
+                "total": len(branches),
+                "online": sum(1 for b in branches.values() if b["status"] == "online"),
+                "degraded": sum(1 for b in branches.values() if b["status"] == "degraded"),
+                "offline": len(branches) - len(online),
+                "total_stock": sum(p["stock"] for b in online for p in (b["inventory"] or [])),
+                "total_revenue": round(sum((b["sales_stats"] or {}).get("total_revenue", 0) for b in online), 2),
+            },
+            "branches": branches,
+        }
+        self.rounds += 1
+        self._cached, self._cached_at = document, time.monotonic()
+        return document
+
+    async def overview(self, refresh: bool = False) -> dict:
+        await self.start()
+        if not refresh and self._cached is not None and time.monotonic() - self._cached_at < self.ttl:
+            self.cache_hits += 1
+            return {**self._cached, "cached": True}
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._round())
+        # shield: si un cliente se desconecta, la ronda sigue para los demás
+        document = await asyncio.shield(self._inflight)
+        return {**document, "cached": False}
+
+    def stats(self) -> dict:
+        return {"rounds": self.rounds, "cache_hits": self.cache_hits, "hedges": self.hedges}
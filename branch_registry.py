@@ -0,0 +1,253 @@
+"""branch_registry.py
+Registro de sucursales del central: dónde está cada una, si está viva y qué tan rápido responde.
+
+- Las sucursales se registran solas (`POST /branches/register`) y envían latidos
+  periódicos (`POST /branches/{id}/heartbeat`, ver HeartbeatSender). BRANCH_URLS solo
+  siembra el registro al arrancar.
+- Vida: una sucursal con latido vencido (más de `heartbeat_ttl` segundos) está muerta;
+  además cada sucursal tiene un CircuitBreaker (retry_engine): tras varias llamadas
+  fallidas del central se deja de llamarla hasta `reset_timeout` y luego se deja pasar
+  una sola prueba. Un latido nuevo la revive de inmediato.
+- Latencia: EWMA de las llamadas exitosas del central a cada sucursal.
+- Las llamadas del central (sync, overview) usan `routable()` / `ranked()`: omiten las
+  sucursales muertas en lugar de esperar su timeout en cada operación.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from retry_engine import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BRANCH_URLS = {
+    "sucursal-001": "http://localhost:8001",
+    "sucursal-002": "http://localhost:8002",
+    "sucursal-003": "http://localhost:8003",
+}
+
+ALIVE = "alive"
+DEAD = "dead"
+UNKNOWN = "unknown"  # sembrada por configuración, todavía sin latidos
+
+
+def branch_urls_from_env(var: str = 'BRANCH_URLS') -> Dict[str, str]:
+    """BRANCH_URLS="sucursal-001=http://host:8001,sucursal-002=http://host:8002"."""
+    raw = os.environ.get(var)
+    if not raw:
+        return dict(DEFAULT_BRANCH_URLS)
+    branches = {}
+    for item in raw.split(','):
+        branch_id, _, url = item.strip().partition('=')
+        if not url:
+            raise ValueError(f"{var}: se esperaba <sucursal>=<url>, se recibió {item!r}")
+        branches[branch_id.strip()] = url.strip().rstrip('/')
+    return branches
+
+
+class BranchRecord:
+    __slots__ = ('branch_id', 'url', 'registered_at', 'last_heartbeat', 'ewma_ms',
+                 'calls', 'failures', 'last_error', 'breaker')
+
+    def __init__(self, branch_id: str, url: str, breaker: CircuitBreaker):
+        self.branch_id = branch_id
+        self.url = url
+        self.registered_at = time.time()
+        self.last_heartbeat: Optional[float] = None  # time.monotonic()
+        self.ewma_ms: Optional[float] = None
+        self.calls = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.breaker = breaker
+
+
+class BranchRegistry:
+    def __init__(self, seeds: Optional[Dict[str, str]] = None, heartbeat_ttl: float = 15.0,
+                 alpha: float = 0.3, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.heartbeat_ttl = heartbeat_ttl
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._branches: Dict[str, BranchRecord] = {}
+        for branch_id, url in (seeds or {}).items():
+            self.register(branch_id, url)
+
+    def register(self, branch_id: str, url: str) -> BranchRecord:
+        url = url.rstrip('/')
+        record = self._branches.get(branch_id)
+        if record is None or record.url != url:
+            if record is not None:
+                logger.info(f"🏪 Sucursal {branch_id} cambió de URL: {record.url} -> {url}")
+            record = BranchRecord(branch_id, url, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+            self._branches[branch_id] = record
+        return record
+
+    def heartbeat(self, branch_id: str, url: Optional[str] = None) -> BranchRecord:
+        """Registra un latido; con `url` registra la sucursal si no existía. KeyError si es desconocida."""
+        if url is not None:
+            record = self.register(branch_id, url)
+        else:
+            record = self._branches[branch_id]
+        if record.last_heartbeat is None or self.status(record) == DEAD:
+            logger.info(f"💓 Sucursal {branch_id} en línea ({record.url})")
+        record.last_heartbeat = time.monotonic()
+        record.breaker.record_success()
+        return record
+
+    def observe(self, branch_id: str, latency: float, ok: bool, error: Optional[str] = None) -> None:
+        """Resultado de una llamada del central a la sucursal (latencia en segundos)."""
+        record = self._branches.get(branch_id)
+        if record is None:
+            return
+        record.calls += 1
+        if ok:
+            latency_ms = latency * 1000
+            record.ewma_ms = latency_ms if record.ewma_ms is None else (
+                self.alpha * latency_ms + (1 - self.alpha) * record.ewma_ms)
+            record.breaker.record_success()
+        else:
+            record.failures += 1
+            record.last_error = error
+            record.breaker.record_failure()
+
+    def status(self, record: BranchRecord) -> str:
+        if record.breaker.state != CircuitBreaker.CLOSED:
+            return DEAD
+        if record.last_heartbeat is None:
+            return UNKNOWN
+        if time.monotonic() - record.last_heartbeat > self.heartbeat_ttl:
+            return DEAD
+        return ALIVE
+
+    def routable(self) -> Dict[str, str]:
+        """Sucursales a las que vale la pena llamar, en orden de registro."""
+        result = {}
+        for branch_id, record in self._branches.items():
+            if record.breaker.state != CircuitBreaker.CLOSED:
+                # allow() deja pasar una sola prueba cuando vence reset_timeout
+                if record.breaker.allow():
+                    result[branch_id] = record.url
+                continue
+            if self.status(record) != DEAD:
+                result[branch_id] = record.url
+        return result
+
+    def ranked(self) -> Dict[str, str]:
+        """Como `routable`, pero las vivas primero y de la más rápida a la más lenta."""
+        routable = self.routable()
+        order = {ALIVE: 0, UNKNOWN: 1, DEAD: 2}
+
+        def key(branch_id: str):
+            record = self._branches[branch_id]
+            ewma = record.ewma_ms if record.ewma_ms is not None else float('inf')
+            return order[self.status(record)], ewma
+
+        return {branch_id: routable[branch_id] for branch_id in sorted(routable, key=key)}
+
+    def latency(self, branch_id: str) -> Optional[float]:
+        """EWMA de latencia en segundos (None si todavía no hay mediciones)."""
+        record = self._branches.get(branch_id)
+        if record is None or record.ewma_ms is None:
+            return None
+        return record.ewma_ms / 1000
+
+    def ids(self) -> List[str]:
+        return list(self._branches)
+
+    def __contains__(self, branch_id: str) -> bool:
+        return branch_id in self._branches
+
+    def describe(self, record: BranchRecord) -> dict:
+        now = time.monotonic()
+        return {
+            "branch_id": record.branch_id,
+            "url": record.url,
+            "status": self.status(record),
+            "last_heartbeat_s": round(now - record.last_heartbeat, 1) if record.last_heartbeat is not None else None,
+            "latency_ewma_ms": round(record.ewma_ms, 2) if record.ewma_ms is not None else None,
+            "calls": record.calls,
+            "failures": record.failures,
+            "circuit": record.breaker.state,
+            "last_error": record.last_error,
+        }
+
+    def snapshot(self) -> List[dict]:
+        return [self.describe(record) for record in self._branches.values()]
+
+
+class HeartbeatSender:
+    """Lado sucursal: se registra en el central y envía un latido cada `interval` segundos."""
+
+    def __init__(self, central_url: str, branch_id: str, public_url: str,
+                 interval: float = 5.0, timeout: float = 2.0):
+        self.central_url = central_url.rstrip('/')
+        self.branch_id = branch_id
+        self.public_url = public_url
+        self.interval = interval
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._registered = False
+        self.sent = 0
+        self.failed = 0
+
+    async def _beat(self) -> None:
+        if not self._registered:
+            response = await self._client.post(
+                f"{self.central_url}/branches/register",
+                json={"branch_id": self.branch_id, "url": self.public_url}
+            )
+            response.raise_for_status()
+            self._registered = True
+            logger.info(f"🏪 Registrada en el central como {self.branch_id} ({self.public_url})")
+        response = await self._client.post(
+            f"{self.central_url}/branches/{self.branch_id}/heartbeat",
+            json={"url": self.public_url}
+        )
+        if response.status_code == 404:
+            self._registered = False  # el central se reinició: volver a registrarse
+        response.raise_for_status()
+
+    async def _run(self) -> None:
+        reachable = True
+        while True:
+            try:
+                await self._beat()
+                self.sent += 1
+                if not reachable:
+                    logger.info("💓 Central alcanzable de nuevo")
+                reachable = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                if reachable:  # registrar solo el inicio de cada caída
+                    logger.warning(f"⚠️ Latido al central falló: {e!r}")
+                reachable = False
+                self._registered = False
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {"central": self.central_url, "sent": self.sent, "failed": self.failed, "interval": self.interval}
@@ -0,0 +1,115 @@
+"""branch_sync.py
+Sincronización por deltas del inventario de las sucursales hacia el central.
+
+Cada sucursal publica un feed de cambios (`GET /inventory/changes?since=<versión>`); el
+central recuerda por sucursal la última versión recibida (y la época de esa sucursal) y
+en cada sync pide solo lo cambiado desde entonces, a todas las sucursales en paralelo.
+Los cambios se aplican juntos con `InventoryEngine.upsert_many` (un solo lote; lo que no
+cambió no genera versión ni escritura a disco).
+
+Las sucursales salen del registro (branch_registry.py): las muertas se omiten y cada
+llamada alimenta su latencia y su circuit breaker.
+
+Semántica: igual que la sincronización anterior del dashboard, las sucursales solo crean
+o actualizan productos en el central; nunca los borran. Si dos sucursales reportan el
+mismo producto, gana la última en el orden de registro.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from branch_registry import BranchRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class BranchSync:
+    def __init__(self, engine, registry: BranchRegistry, timeout: float = 5.0):
+        self.engine = engine
+        self.registry = registry
+        self.timeout = timeout
+        # sucursal -> (época, versión) de la última respuesta aplicada
+        self.cursors: Dict[str, Tuple[str, int]] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = asyncio.Lock()
+        self.syncs = 0
+        self.rows_received = 0
+        self.rows_applied = 0
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _pull(self, branch_id: str, url: str, full: bool) -> dict:
+        epoch, since = (None, 0) if full else self.cursors.get(branch_id, (None, 0))
+        params = {"since": since}
+        if epoch:
+            params["epoch"] = epoch
+        started = time.perf_counter()
+        try:
+            response = await self._client.get(f"{url}/inventory/changes", params=params)
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            self.registry.observe(branch_id, time.perf_counter() - started, ok=False, error=repr(e))
+            raise
+        self.registry.observe(branch_id, time.perf_counter() - started, ok=True)
+        return result
+
+    async def sync(self, full: bool = False) -> dict:
+        """Trae los deltas de todas las sucursales en paralelo y los aplica en un lote."""
+        await self.start()
+        async with self._lock:  # dos sync simultáneos pisarían los cursores
+            started = time.perf_counter()
+            routable = self.registry.routable()
+            results = await asyncio.gather(
+                *(self._pull(branch_id, url, full) for branch_id, url in routable.items()),
+                return_exceptions=True
+            )
+            report, batch = {}, []
+            for branch_id in self.registry.ids():
+                if branch_id not in routable:
+                    report[branch_id] = {"status": "skipped", "error": "sucursal sin latido o con circuito abierto"}
+            for branch_id, result in zip(routable, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"⚠️ Sync de {branch_id} falló: {result!r}")
+                    report[branch_id] = {"status": "error", "error": repr(result)}
+                    continue
+                batch.extend(result["changes"])
+                report[branch_id] = {
+                    "status": "ok",
+                    "changes": len(result["changes"]),
+                    "full": result["full"],
+                    "version": result["version"],
+                }
+            applied = self.engine.upsert_many(batch)
+            # Avanzar cursores solo después de aplicar el lote
+            for branch_id, result in zip(routable, results):
+                if not isinstance(result, Exception):
+                    self.cursors[branch_id] = (result["epoch"], result["version"])
+            self.syncs += 1
+            self.rows_received += len(batch)
+            self.rows_applied += applied
+            return {
+                "branches": report,
+                "received": len(batch),
+                "applied": applied,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+
+    def stats(self) -> dict:
+        return {
+            "syncs": self.syncs,
+            "rows_received": self.rows_received,
+            "rows_applied": self.rows_applied,
+            "cursors": {branch_id: version for branch_id, (_, version) in self.cursors.items()},
+        }
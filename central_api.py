@@ -1,18 +1,47 @@
 ﻿# -*- coding: utf-8 -*-
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional
 from datetime import datetime
+from contextlib import asynccontextmanager
 import logging
-import pika
+import os
 import json
 
+from notification_store import SaleNotificationStore
+from dedup_store import build_dedup_store
+from inventory_engine import InventoryEngine, UnknownProduct
+from inventory_store import InventoryStore, WriteBehind
+from response_cache import VersionedResponseCache, inventario_rows
+from branch_registry import BranchRegistry, branch_urls_from_env
+from branch_sync import BranchSync
+from branch_overview import BranchOverview
+from live_events import EventBroadcaster, InventoryFeed
+from exports import export_response
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    inventory_writer.start()
+    await branch_sync.start()
+    await branch_overview.start()
+    live_events.start()
+    try:
+        yield
+    finally:
+        await branch_overview.close()
+        await branch_sync.close()
+        # Vaciar la cola de escritura antes de cerrar la base
+        inventory_writer.stop()
+        inventory_store.close()
+        sale_notifications.close()
+        applied_sales.close()
+
 app = FastAPI(
     # title="🌱 EcoMarket Central API",
     # description="""
@@ -32,7 +61,8 @@ app = FastAPI(
     # """,
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Bootstrap configuration
@@ -52,18 +82,72 @@ class SaleNotification(BaseModel):
     quantity_sold: int
     timestamp: datetime
     sale_price: float
+    message_id: Optional[str] = None
+
+class BranchRegistration(BaseModel):
+    """Alta de una sucursal en el registro del central"""
+    branch_id: str
+    url: str
+
+class BranchHeartbeat(BaseModel):
+    url: Optional[str] = None
+
+SEED_INVENTORY = [
+    Product(id=1, name="Manzanas Organicas", price=2.50, stock=100),
+    Product(id=2, name="Pan Integral", price=1.80, stock=50),
+    Product(id=3, name="Leche Deslactosada", price=3.20, stock=30),
+    Product(id=4, name="Cafe Premium", price=8.90, stock=25),
+    Product(id=5, name="Quinoa", price=12.50, stock=15)
+]
 
-central_inventory: Dict[int, Product] = {
-    1: Product(id=1, name="Manzanas Organicas", price=2.50, stock=100),
-    2: Product(id=2, name="Pan Integral", price=1.80, stock=50),
-    3: Product(id=3, name="Leche Deslactosada", price=3.20, stock=30),
-    4: Product(id=4, name="Cafe Premium", price=8.90, stock=25),
-    5: Product(id=5, name="Quinoa", price=12.50, stock=15)
-}
+# Persistencia: SQLite (WAL) cargado al iniciar; la semilla solo se usa si está vacío
+inventory_store = InventoryStore(os.environ.get("CENTRAL_DB_PATH", "central_inventory.db"))
+_stored_inventory = inventory_store.load()
+if not _stored_inventory:
+    _stored_inventory = [p.model_dump() for p in SEED_INVENTORY]
+    inventory_store.write(_stored_inventory, [])
+
+# Stock con operaciones atómicas por producto (seguro con varios hilos/workers).
+# Las lecturas salen de memoria; los cambios se escriben a disco en lotes (write-behind)
+central_inventory = InventoryEngine(_stored_inventory)
+inventory_writer = WriteBehind(central_inventory, inventory_store)
+# Catálogo serializado una vez por versión del inventario (ETag / 304)
+catalog_cache = VersionedResponseCache(central_inventory, {
+    "products": list,
+    "inventario": inventario_rows,
+})
+# Registro de sucursales: se registran solas y envían latidos; BRANCH_URLS solo siembra
+# ("sucursal-001=http://...,..."). Las llamadas a sucursales omiten las muertas
+branch_registry = BranchRegistry(
+    branch_urls_from_env(),
+    heartbeat_ttl=float(os.environ.get("BRANCH_HEARTBEAT_TTL", "15"))
+)
+# Sincronización por deltas con las sucursales
+branch_sync = BranchSync(central_inventory, branch_registry)
+# Vista consolidada de sucursales: consultas en paralelo, cubiertas y cacheadas brevemente
+branch_overview = BranchOverview(
+    branch_registry,
+    timeout=float(os.environ.get("BRANCH_TIMEOUT", "2.0")),
+    ttl=float(os.environ.get("BRANCH_OVERVIEW_TTL", "2.0"))
+)
+# Cambios de inventario y ventas empujados a los dashboards conectados (GET /events)
+live_events = EventBroadcaster()
+inventory_feed = InventoryFeed(central_inventory, live_events)
 
 # ===== HISTORIAL DE NOTIFICACIONES DE VENTA =====
+# Ventana caliente acotada e indexada; lo más antiguo se vuelca a disco (NDJSON)
+sale_notifications = SaleNotificationStore(
+    capacity=int(os.environ.get("NOTIFICATIONS_CAPACITY", "10000")),
+    archive_path=os.environ.get("NOTIFICATIONS_ARCHIVE", "sale_notifications_archive.ndjson")
+)
+# message_id de las ventas ya aplicadas: el outbox y los reintentos HTTP reenvían lotes
+# completos tras un timeout, y una venta repetida no debe descontar stock dos veces
+applied_sales = build_dedup_store("central_dedup.db", path_var="CENTRAL_DEDUP_PATH")
+
+EXPORT_FIELDS = ["seq", "branch_id", "product_id", "quantity_sold", "timestamp", "sale_price"]
+
 # Agregar algunas ventas de muestra para demostración
-sale_notifications: List[SaleNotification] = [
+sale_notifications.extend([
     SaleNotification(
         branch_id="Sucursal 001",
         product_id=1,
@@ -85,18 +169,29 @@ sale_notifications: List[SaleNotification] = [
         timestamp=datetime.now(),
         sale_price=6.40
     )
-]
+])
+
+def inventory_products() -> List[Product]:
+    return [Product(**record) for record in central_inventory.snapshot()]
+
+def recent_notifications(n: int = 10) -> List[SaleNotification]:
+    return [SaleNotification(**row) for row in sale_notifications.latest(n)]
 
 @app.get("/", response_class=HTMLResponse, tags=["General"])
 async def dashboard(request: Request):
     return templates.TemplateResponse("central_dashboard.html", {
         "request": request,
-        "inventory": list(central_inventory.values()),
+        "inventory": inventory_products(),
         "total_products": len(central_inventory),
-        "notifications": sale_notifications[-10:],
+        "notifications": recent_notifications(10),
         "timestamp": datetime.now()
     })
 
+@app.get("/events", tags=["General"])
+async def dashboard_events(request: Request):
+    """Stream SSE para el dashboard: eventos `inventory` (cambios de producto) y `sales` (notificaciones)"""
+    return live_events.response(request)
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     """Servir favicon para evitar errores 404"""
@@ -108,7 +203,13 @@ async def api_status():
         "service": "EcoMarket Central API",
         "status": "operational",
         "timestamp": datetime.now(),
-        "total_products": len(central_inventory)
+        "total_products": len(central_inventory),
+        "persistence": inventory_writer.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "branches": branch_registry.snapshot(),
+        "branch_sync": branch_sync.stats(),
+        "branch_overview": branch_overview.stats(),
+        "live_events": live_events.stats()
     }
 
 # ===== ENDPOINTS CRUD PARA PRODUCTOS =====
@@ -118,10 +219,6 @@ async def api_status():
 async def create_product(product: Product):
     """Crear un nuevo producto en el inventario central"""
     try:
-        if product.id in central_inventory:
-            logger.warning(f"Intento de crear producto con ID existente: {product.id}")
-            raise HTTPException(status_code=400, detail=f"ID de producto {product.id} ya existe")
-        
         # Validaciones adicionales
         if product.price <= 0:
             raise HTTPException(status_code=400, detail="El precio debe ser mayor que 0")
@@ -130,7 +227,11 @@ async def create_product(product: Product):
         if not product.name.strip():
             raise HTTPException(status_code=400, detail="El nombre del producto es requerido")
             
-        central_inventory[product.id] = product
+        try:
+            central_inventory.add(product.id, product.name, product.price, product.stock)
+        except ValueError:
+            logger.warning(f"Intento de crear producto con ID existente: {product.id}")
+            raise HTTPException(status_code=400, detail=f"ID de producto {product.id} ya existe")
         logger.info(f"Producto creado: {product.name} (ID: {product.id})")
         return product
         
@@ -142,26 +243,28 @@ async def create_product(product: Product):
 
 # Leer todos los productos
 @app.get("/products", response_model=List[Product], tags=["Inventario"])
-async def get_all_products():
+async def get_all_products(request: Request):
     """Obtiene todos los productos del inventario central"""
     logger.info("Solicitud de productos recibida")
-    return list(central_inventory.values())
+    return catalog_cache.response("products", request)
 
 # Leer producto por ID
 @app.get("/products/{product_id}", response_model=Product, tags=["Inventario"])
 async def get_product(product_id: int):
     """Obtiene un producto específico por su ID"""
-    if product_id not in central_inventory:
+    record = central_inventory.get(product_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return central_inventory[product_id]
+    return record
 
 # Actualizar producto
 @app.put("/products/{product_id}", response_model=Product, tags=["Inventario"])
 async def update_product(product_id: int, updated: Product):
     """Actualiza un producto existente"""
-    if product_id not in central_inventory:
+    try:
+        central_inventory.update(product_id, updated.name, updated.price, updated.stock)
+    except UnknownProduct:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    central_inventory[product_id] = updated
     logger.info(f"Producto actualizado: {updated.name} (ID: {product_id})")
     return updated
 
@@ -169,32 +272,57 @@ async def update_product(product_id: int, updated: Product):
 @app.delete("/products/{product_id}", tags=["Inventario"])
 async def delete_product(product_id: int):
     """Elimina un producto del inventario"""
-    if product_id not in central_inventory:
+    try:
+        product_name = central_inventory.remove(product_id)["name"]
+    except UnknownProduct:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    product_name = central_inventory[product_id].name
-    del central_inventory[product_id]
     logger.info(f"Producto eliminado: {product_name} (ID: {product_id})")
     return {"detail": "Producto eliminado"}
 
 @app.get("/inventory", response_model=List[Product], tags=["Inventario"])
-async def get_full_inventory():
+async def get_full_inventory(request: Request):
     """Obtiene todo el inventario central (alias de /products)"""
     logger.info("Solicitud de inventario completo recibida")
-    return list(central_inventory.values())
+    return catalog_cache.response("products", request)
 
 @app.get("/inventario", tags=["Inventario"])
-async def get_inventario():
+async def get_inventario(request: Request):
     """Obtiene todo el inventario central (endpoint en español)"""
     logger.info("Solicitud de inventario en español recibida")
-    products = []
-    for product in central_inventory.values():
-        products.append({
-            "id": product.id,
-            "nombre": product.name,  # Convertir name a nombre
-            "precio": product.price,  # Convertir price a precio
-            "stock": product.stock
-        })
-    return products
+    return catalog_cache.response("inventario", request)
+
+@app.post("/sync/branches", tags=["Inventario"])
+async def sync_branches(full: bool = Query(False, description="Ignorar cursores y traer todo")):
+    """Trae de todas las sucursales (en paralelo) solo los productos cambiados y los aplica en bloque"""
+    result = await branch_sync.sync(full=full)
+    logger.info(f"🔄 Sync de sucursales: {result['received']} cambios recibidos, {result['applied']} aplicados")
+    return result
+
+@app.post("/branches/register", tags=["Sucursales"])
+async def register_branch(registration: BranchRegistration):
+    """Registra (o actualiza la URL de) una sucursal"""
+    record = branch_registry.register(registration.branch_id, registration.url)
+    logger.info(f"🏪 Sucursal registrada: {registration.branch_id} ({record.url})")
+    return branch_registry.describe(record)
+
+@app.post("/branches/{branch_id}/heartbeat", tags=["Sucursales"])
+async def branch_heartbeat(branch_id: str, heartbeat: Optional[BranchHeartbeat] = None):
+    """Latido periódico de una sucursal (con `url` también la registra)"""
+    try:
+        record = branch_registry.heartbeat(branch_id, heartbeat.url if heartbeat else None)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Sucursal {branch_id} no registrada")
+    return branch_registry.describe(record)
+
+@app.get("/branches", tags=["Sucursales"])
+async def list_branches():
+    """Sucursales registradas con su estado (alive/dead/unknown) y latencia EWMA"""
+    return branch_registry.snapshot()
+
+@app.get("/branches/overview", tags=["Sucursales"])
+async def get_branches_overview(refresh: bool = Query(False, description="Ignorar la cache")):
+    """Salud, info, inventario y estadísticas de todas las sucursales en un solo documento"""
+    return await branch_overview.overview(refresh=refresh)
 
 @app.get("/api-docs", response_class=HTMLResponse, include_in_schema=False)
 async def custom_api_docs():
@@ -270,31 +398,162 @@ async def custom_api_docs():
 @app.post("/sale-notification", include_in_schema=False)
 async def receive_sale_notification(notification: SaleNotification):
     logger.info(f"Notificacion de venta recibida: {notification}")
+    if notification.message_id in applied_sales:
+        return {"status": "duplicate", "message": f"Venta {notification.message_id} ya registrada"}
     sale_notifications.append(notification)
     
-    if notification.product_id not in central_inventory:
+    try:
+        old_stock, new_stock = central_inventory.decrement_clamped(notification.product_id, notification.quantity_sold)
+    except UnknownProduct:
         raise HTTPException(status_code=404, detail=f"Producto {notification.product_id} no encontrado")
+    applied_sales.add(notification.message_id)
     
-    product = central_inventory[notification.product_id]
-    old_stock = product.stock
-    product.stock = max(0, product.stock - notification.quantity_sold)
-    
-    logger.info(f"Inventario actualizado - {product.name}: {old_stock} -> {product.stock}")
+    logger.info(f"Inventario actualizado - producto {notification.product_id}: {old_stock} -> {new_stock}")
+    if live_events.has_clients:
+        live_events.publish('sales', {
+            "notifications": [notification.model_dump(mode='json')],
+            "total": len(sale_notifications)
+        })
 
         # Ya no se reenvía la notificación a RabbitMQ
     
     return {
         "status": "received",
         "message": f"Venta registrada para {notification.quantity_sold} unidades",
-        "updated_central_stock": product.stock
+        "updated_central_stock": new_stock
+    }
+
+def _parse_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """Acepta un arreglo JSON, {"notifications": [...]} o un stream NDJSON (una venta por línea)."""
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items: List[Any] = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                # La línea se reporta como inválida sin descartar el resto del lote
+                items.append(e)
+        return items
+    try:
+        parsed = json.loads(body)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    if isinstance(parsed, dict) and isinstance(parsed.get("notifications"), list):
+        parsed = parsed["notifications"]
+    if not isinstance(parsed, list):
+        raise HTTPException(status_code=400, detail="Se esperaba un arreglo de notificaciones")
+    return parsed
+
+@app.post("/sale-notifications/batch", tags=["Comunicación"])
+async def receive_sale_notifications_batch(request: Request):
+    """
+    Recibe muchas notificaciones de venta en un solo POST (arreglo JSON o NDJSON).
+
+    Todas se validan en una pasada y los descuentos de stock se aplican en un único
+    paso atómico (`decrement_many`). Las ventas cuyo `message_id` ya se aplicó (lote
+    reenviado tras un timeout) se informan como "duplicate" sin tocar el stock.
+    Devuelve el resultado por ítem.
+    """
+    raw_items = _parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+
+    # PASO 1: validar todo el lote
+    results: List[Dict[str, Any]] = []
+    valid: List[tuple] = []
+    for index, item in enumerate(raw_items):
+        if isinstance(item, Exception):
+            results.append({"index": index, "status": "invalid", "errors": str(item)})
+            continue
+        try:
+            notification = SaleNotification.model_validate(item)
+        except ValidationError as ve:
+            results.append({"index": index, "status": "invalid", "errors": ve.errors(include_url=False)})
+            continue
+        results.append({"index": index, "status": "pending"})
+        valid.append((index, notification))
+
+    # PASO 2: descartar las ventas ya aplicadas (también las repetidas dentro del lote)
+    fresh: List[tuple] = []
+    batch_ids = set()
+    for index, notification in valid:
+        message_id = notification.message_id
+        if message_id is not None and (message_id in batch_ids or message_id in applied_sales):
+            results[index] = {"index": index, "status": "duplicate"}
+            continue
+        batch_ids.add(message_id)
+        fresh.append((index, notification))
+
+    # PASO 3: aplicar todos los descuentos en un solo paso atómico
+    applied = 0
+    sale_notifications.extend([notification for _, notification in fresh])
+    outcomes = central_inventory.decrement_many(
+        [(notification.product_id, notification.quantity_sold) for _, notification in fresh]
+    )
+    for (index, notification), outcome in zip(fresh, outcomes):
+        if outcome is None:
+            results[index] = {"index": index, "status": "not_found",
+                              "detail": f"Producto {notification.product_id} no encontrado"}
+            continue
+        applied_sales.add(notification.message_id)
+        applied += 1
+        results[index] = {"index": index, "status": "applied", "updated_central_stock": outcome[1]}
+
+    duplicates = len(valid) - len(fresh)
+    logger.info(f"Lote de notificaciones recibido: {applied}/{len(raw_items)} aplicadas, {duplicates} repetidas")
+    if fresh and live_events.has_clients:
+        live_events.publish('sales', {
+            "notifications": [notification.model_dump(mode='json') for _, notification in fresh],
+            "total": len(sale_notifications)
+        })
+    return {
+        "status": "received",
+        "received": len(raw_items),
+        "applied": applied,
+        "duplicates": duplicates,
+        "results": results
     }
 
 @app.get("/sale-notifications", response_model=List[SaleNotification], tags=["Comunicación"])
-async def get_sale_notifications():
+async def get_sale_notifications(
+    cursor: Optional[int] = Query(None, description="Secuencia de la última fila ya recibida"),
+    limit: int = Query(100, ge=1, le=1000),
+    since: Optional[datetime] = None,
+    branch: Optional[str] = None,
+    product: Optional[int] = None
+):
     """
     Devuelve el historial de notificaciones de ventas recibidas desde sucursales.
+
+    Paginado por cursor: si hay más filas, el encabezado `X-Next-Cursor` trae el valor
+    a enviar como `cursor=` en la siguiente página.
+    """
+    rows, next_cursor = sale_notifications.query(
+        cursor=cursor, limit=limit, since=since, branch=branch, product=product
+    )
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+    return JSONResponse(content=rows, headers=headers)
+
+@app.get("/sale-notifications/stats", tags=["Comunicación"])
+async def get_sale_notifications_stats():
+    """Tamaño de la ventana caliente y filas archivadas en disco"""
+    return sale_notifications.stats()
+
+@app.get("/sale-notifications/export", tags=["Comunicación"])
+async def export_sale_notifications(
+    fmt: str = Query("ndjson", alias="format", description="ndjson | csv"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    branch: Optional[str] = None,
+    product: Optional[int] = None,
+    gzip: bool = False
+):
+    """
+    Exporta TODAS las notificaciones (archivo histórico en disco + ventana caliente) en
+    streaming, para conciliación. Memoria constante sin importar el tamaño del historial.
     """
-    return sale_notifications
+    rows = sale_notifications.export(since=since, until=until, branch=branch, product=product)
+    return export_response(rows, fmt, EXPORT_FIELDS, "sale_notifications", gzip=gzip)
 
 @app.get("/sales/recent", response_model=List[SaleNotification], tags=["Comunicación"])
 async def get_recent_sales():
@@ -302,7 +561,7 @@ async def get_recent_sales():
     Devuelve las ventas recientes (alias de sale-notifications para el frontend)
     """
     logger.info("Solicitud de ventas recientes recibida")
-    return sale_notifications[-10:]  # Últimas 10 ventas
+    return recent_notifications(10)  # Últimas 10 ventas
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,267 @@
+"""codec.py
+Serialización de los payloads AMQP, seleccionada por el header `content_type`.
+
+- application/json: formato histórico. Se decodifica con orjson si está instalado.
+- application/x-msgpack: MessagePack (requiere el paquete opcional `msgpack`).
+- application/x-ecomarket-sale: binario de esquema fijo (`struct`) para notificaciones
+  de venta y lotes del outbox; sin dependencias y sin repetir los nombres de campo.
+
+Los publishers eligen el codec por nombre (json | orjson | msgpack | sale-struct) y
+ponen su `content_type` en las properties; los consumers llaman a
+`decode(body, properties.content_type)`. Un mensaje sin content_type (o con uno
+desconocido) se lee como JSON, así los mensajes ya encolados siguen siendo legibles.
+"""
+
+import json
+import os
+import struct
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dependencia opcional
+    msgpack = None
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/x-msgpack'
+SALE_STRUCT_CONTENT_TYPE = 'application/x-ecomarket-sale'
+
+
+class CodecError(ValueError):
+    """El payload no se pudo codificar o decodificar con el codec pedido."""
+
+
+class Codec(ABC):
+    name = ''
+    content_type = ''
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, body: bytes) -> Any:
+        ...
+
+
+class JsonCodec(Codec):
+    name = 'json'
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, obj: Any) -> bytes:
+        try:
+            return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        except (TypeError, ValueError) as e:
+            raise CodecError(f"json: {e}") from e
+
+    def decode(self, body: bytes) -> Any:
+        try:
+            return json.loads(body)
+        except (TypeError, ValueError) as e:
+            raise CodecError(f"json: {e}") from e
+
+
+class OrjsonCodec(Codec):
+    """Mismo formato que JsonCodec (mismo content_type), con encode/decode en C."""
+
+    name = 'orjson'
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except TypeError as e:
+            raise CodecError(f"orjson: {e}") from e
+
+    def decode(self, body: bytes) -> Any:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # orjson solo acepta UTF-8; json también detecta UTF-16/32 como antes
+            return JsonCodec().decode(body)
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def encode(self, obj: Any) -> bytes:
+        try:
+            return msgpack.packb(obj, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise CodecError(f"msgpack: {e}") from e
+
+    def decode(self, body: bytes) -> Any:
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise CodecError(f"msgpack: {e}") from e
+
+
+class SaleStructCodec(Codec):
+    """Notificación de venta (o lote del outbox) en un registro binario de esquema fijo.
+
+    Mensaje: MAGIC + tipo (0 = una venta, 1 = lote) [+ message_id del lote + cantidad].
+    Venta: product_id, quantity_sold (int64), sale_price (float64) y los largos uint16 de
+    branch_id, timestamp y message_id (0xFFFF = ausente), seguidos de esos textos en UTF-8.
+    Un dict con otros campos no se puede representar y lanza CodecError.
+    """
+
+    name = 'sale-struct'
+    content_type = SALE_STRUCT_CONTENT_TYPE
+
+    MAGIC = b'ES\x01'
+    FIELDS = frozenset(('branch_id', 'product_id', 'quantity_sold', 'timestamp', 'sale_price', 'message_id'))
+    _HEADER = struct.Struct('<3sB')
+    _BATCH = struct.Struct('<I')
+    _SALE = struct.Struct('<qqdHHH')
+    _LEN = struct.Struct('<H')
+    _TEXT_FIELDS = ('branch_id', 'timestamp', 'message_id')
+    _ABSENT = 0xFFFF
+
+    def _text(self, value: Optional[str]) -> Tuple[int, bytes]:
+        if value is None:
+            return self._ABSENT, b''
+        if not isinstance(value, str):
+            raise CodecError(f"sale-struct: se esperaba texto, llegó {type(value).__name__}")
+        raw = value.encode('utf-8')
+        if len(raw) >= self._ABSENT:
+            raise CodecError("sale-struct: texto demasiado largo")
+        return len(raw), raw
+
+    def _pack_sale(self, out: bytearray, sale: Dict[str, Any]) -> None:
+        if not isinstance(sale, dict) or not sale.keys() <= self.FIELDS:
+            raise CodecError("sale-struct: la venta tiene campos fuera del esquema")
+        branch_len, branch = self._text(sale.get('branch_id'))
+        ts_len, ts = self._text(sale.get('timestamp'))
+        id_len, message_id = self._text(sale.get('message_id'))
+        try:
+            out += self._SALE.pack(sale['product_id'], sale['quantity_sold'], sale.get('sale_price', 0.0),
+                                   branch_len, ts_len, id_len)
+        except (KeyError, TypeError, struct.error) as e:
+            raise CodecError(f"sale-struct: {e!r}") from e
+        out += branch
+        out += ts
+        out += message_id
+
+    def _unpack_sale(self, body: bytes, offset: int) -> Tuple[Dict[str, Any], int]:
+        product_id, quantity_sold, sale_price, *lengths = self._SALE.unpack_from(body, offset)
+        offset += self._SALE.size
+        sale = {"product_id": product_id, "quantity_sold": quantity_sold, "sale_price": sale_price}
+        for key, size in zip(self._TEXT_FIELDS, lengths):
+            if size != self._ABSENT:
+                end = offset + size
+                sale[key] = body[offset:end].decode('utf-8')
+                offset = end
+        if offset > len(body):
+            raise CodecError("sale-struct: mensaje truncado")
+        return sale, offset
+
+    def encode(self, obj: Any) -> bytes:
+        out = bytearray()
+        if isinstance(obj, dict) and 'notifications' in obj:
+            if not obj.keys() <= {'message_id', 'notifications'}:
+                raise CodecError("sale-struct: el lote tiene campos fuera del esquema")
+            id_len, message_id = self._text(obj.get('message_id'))
+            out += self._HEADER.pack(self.MAGIC, 1)
+            out += self._LEN.pack(id_len)
+            out += message_id
+            out += self._BATCH.pack(len(obj['notifications']))
+            for sale in obj['notifications']:
+                self._pack_sale(out, sale)
+        else:
+            out += self._HEADER.pack(self.MAGIC, 0)
+            self._pack_sale(out, obj)
+        return bytes(out)
+
+    def decode(self, body: bytes) -> Any:
+        try:
+            magic, kind = self._HEADER.unpack_from(body, 0)
+            if magic != self.MAGIC:
+                raise CodecError("sale-struct: encabezado desconocido")
+            offset = self._HEADER.size
+            if kind == 0:
+                sale, _ = self._unpack_sale(body, offset)
+                return sale
+            (id_len,) = self._LEN.unpack_from(body, offset)
+            offset += self._LEN.size
+            message_id = None
+            if id_len != self._ABSENT:
+                message_id = body[offset:offset + id_len].decode('utf-8')
+                offset += id_len
+            (count,) = self._BATCH.unpack_from(body, offset)
+            offset += self._BATCH.size
+            notifications = []
+            for _ in range(count):
+                sale, offset = self._unpack_sale(body, offset)
+                notifications.append(sale)
+            batch: Dict[str, Any] = {"notifications": notifications}
+            if message_id is not None:
+                batch["message_id"] = message_id
+            return batch
+        except (struct.error, UnicodeDecodeError) as e:
+            raise CodecError(f"sale-struct: {e}") from e
+
+
+_JSON = OrjsonCodec() if orjson is not None else JsonCodec()
+_CODECS = {
+    'json': JsonCodec(),
+    'sale-struct': SaleStructCodec(),
+}
+if orjson is not None:
+    _CODECS['orjson'] = _JSON
+if msgpack is not None:
+    _CODECS['msgpack'] = MsgpackCodec()
+
+_BY_CONTENT_TYPE = {codec.content_type: codec for codec in _CODECS.values()}
+_BY_CONTENT_TYPE[JSON_CONTENT_TYPE] = _JSON
+
+
+def get_codec(name: str) -> Codec:
+    """Codec por nombre; ValueError si no existe o falta su dependencia opcional."""
+    codec = _CODECS.get(name)
+    if codec is None:
+        if name in ('orjson', 'msgpack'):
+            raise ValueError(f"Codec {name} no disponible: instalar el paquete `{name}`")
+        raise ValueError(f"Codec desconocido: {name}")
+    return codec
+
+
+def codec_from_env(var: str, default: str = 'json') -> Codec:
+    return get_codec(os.environ.get(var, default))
+
+
+def encode(obj: Any, codec: Optional[Codec] = None) -> Tuple[bytes, str]:
+    """Codifica `obj` y retorna (body, content_type).
+
+    Si el codec no puede representar el objeto (p. ej. sale-struct con un campo extra)
+    se usa JSON, y el content_type retornado lo indica al consumer.
+    """
+    if codec is None:
+        codec = _JSON
+    try:
+        return codec.encode(obj), codec.content_type
+    except CodecError:
+        if codec.content_type == JSON_CONTENT_TYPE:
+            raise
+        return _JSON.encode(obj), JSON_CONTENT_TYPE
+
+
+def decode(body: bytes, content_type: Optional[str] = None) -> Any:
+    """Decodifica según el content_type del mensaje (ausente o desconocido = JSON)."""
+    if content_type:
+        if ';' in content_type:
+            content_type = content_type.split(';', 1)[0]
+        content_type = content_type.strip().lower()
+        codec = _BY_CONTENT_TYPE.get(content_type)
+        if codec is not None:
+            return codec.decode(body)
+        if content_type == MSGPACK_CONTENT_TYPE:
+            raise CodecError("msgpack: paquete `msgpack` no instalado en este consumer")
+    return _JSON.decode(body)
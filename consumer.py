@@ -1,14 +1,30 @@
 
+import os
+import argparse
+import asyncio
 import pika
-import json
 import logging
-from typing import Set
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import httpx
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+import codec
+import sale_topology
+from dedup_store import build_dedup_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Para idempotencia (en prod: usar Redis o DB)
-processed_messages: Set[str] = set()
+CENTRAL_API_URL = os.environ.get('CENTRAL_API_URL', 'http://localhost:8000')
+
+# Para idempotencia: ventana acotada (TTL/tamaño) y persistente entre reinicios.
+# Backend configurable con DEDUP_BACKEND=sqlite|memory (ver dedup_store.py)
+processed_messages = build_dedup_store()
+# Ventas aplicadas cuyo mensaje todavía no tiene ack: cuentan como duplicadas para otra
+# entrega concurrente, pero solo pasan a `processed_messages` al confirmarse (finish_sales)
+in_flight: Set[str] = set()
 
 # Simulación de inventario central
 central_inventory = {
@@ -19,93 +35,381 @@ central_inventory = {
     5: {"name": "Quinoa", "stock": 15}
 }
 
+def apply_sale(message: dict) -> str:
+    """Aplica una venta al inventario con idempotencia.
+
+    Retorna 'applied', 'duplicate', 'invalid' o 'not_found'.
+    """
+    message_id = message.get('message_id')
+    logger.info(f"📨 Recibido mensaje: {message_id}")
+
+    # Idempotencia
+    if message_id in in_flight or message_id in processed_messages:
+        logger.info(f"⏭️ Mensaje duplicado ignorado: {message_id}")
+        return 'duplicate'
+
+    # Validar datos requeridos
+    required_fields = ['product_id', 'quantity_sold']
+    if not all(field in message for field in required_fields):
+        logger.error(f"❌ Mensaje inválido, faltan campos: {message}")
+        return 'invalid'
+
+    # Procesar lógica de negocio
+    product_id = message['product_id']
+    quantity = message['quantity_sold']
+    if product_id not in central_inventory:
+        logger.error(f"❌ Producto {product_id} no encontrado")
+        return 'not_found'
+
+    product = central_inventory[product_id]
+    old_stock = product['stock']
+    product['stock'] = max(0, product['stock'] - quantity)
+    if message_id is not None:
+        in_flight.add(message_id)
+    logger.info(f"📊 Inventario actualizado - {product['name']}: {old_stock} → {product['stock']} (mensaje: {message_id})")
+    return 'applied'
+
+
+def finish_sales(messages: List[dict], acked: bool) -> None:
+    """Cierra ventas aplicadas: con ack quedan registradas como procesadas; sin ack se
+    liberan para que la reentrega vuelva a aplicarlas (y a notificar al central)."""
+    for message in messages:
+        message_id = message.get('message_id')
+        if message_id is None:
+            continue
+        in_flight.discard(message_id)
+        if acked:
+            processed_messages.add(message_id)
+
+
+def _central_payload(message: dict) -> dict:
+    return {
+        "branch_id": message.get("branch_id", "sucursal-001"),
+        "product_id": message['product_id'],
+        "quantity_sold": message['quantity_sold'],
+        "timestamp": message.get("timestamp"),
+        "sale_price": message.get("sale_price", 0),
+        # Mismo id de punta a punta: el central puede descartar reentregas
+        "message_id": message.get("message_id")
+    }
+
+
+def notify_central(message: dict) -> None:
+    """Envía la notificación de venta al API central."""
+    try:
+        import requests
+        response = requests.post(
+            f"{CENTRAL_API_URL}/sale-notification",
+            json=_central_payload(message),
+            timeout=5
+        )
+        if response.status_code == 200:
+            logger.info("✅ Notificación enviada al API central")
+        else:
+            logger.warning(f"⚠️ Error al notificar al API central: {response.status_code}")
+    except Exception as e:
+        logger.error(f"❌ Error enviando notificación al API central: {e}")
+
+
+def notify_central_batch(messages: List[dict]) -> None:
+    """Envía varias notificaciones al API central en un solo round-trip."""
+    if not messages:
+        return
+    try:
+        import requests
+        response = requests.post(
+            f"{CENTRAL_API_URL}/sale-notifications/batch",
+            json=[_central_payload(m) for m in messages],
+            timeout=5
+        )
+        if response.status_code == 200:
+            logger.info(f"✅ Lote de {len(messages)} notificaciones enviado al API central")
+        else:
+            logger.warning(f"⚠️ Error al notificar lote al API central: {response.status_code}")
+    except Exception as e:
+        logger.error(f"❌ Error enviando lote al API central: {e}")
+
+
 def process_sale_message(ch, method, properties, body):
+    applied: List[dict] = []
     try:
-        message = json.loads(body)
-        message_id = message.get('message_id')
-        logger.info(f"📨 Recibido mensaje: {message_id}")
+        message = codec.decode(body, properties.content_type)
 
-        # Idempotencia
-        if message_id in processed_messages:
-            logger.info(f"⏭️ Mensaje duplicado ignorado: {message_id}")
+        # Lote del outbox de la sucursal: varias ventas en un solo mensaje
+        if isinstance(message.get('notifications'), list):
+            for item in message['notifications']:
+                if apply_sale(item) == 'applied':
+                    applied.append(item)
+            notify_central_batch(applied)
+            logger.info(f"📦 Lote {message.get('message_id')}: {len(applied)}/{len(message['notifications'])} ventas aplicadas")
             ch.basic_ack(delivery_tag=method.delivery_tag)
+            finish_sales(applied, acked=True)
             return
 
-        # Validar datos requeridos
-        required_fields = ['product_id', 'quantity_sold']
-        if not all(field in message for field in required_fields):
-            logger.error(f"❌ Mensaje inválido, faltan campos: {message}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-            return
-
-        # Procesar lógica de negocio
-        product_id = message['product_id']
-        quantity = message['quantity_sold']
-        if product_id in central_inventory:
-            product = central_inventory[product_id]
-            old_stock = product['stock']
-            product['stock'] = max(0, product['stock'] - quantity)
-            processed_messages.add(message_id)
-            logger.info(f"📊 Inventario actualizado - {product['name']}: {old_stock} → {product['stock']} (mensaje: {message_id})")
-            # Enviar notificación al API central
-            try:
-                import requests
-                notification = {
-                    "branch_id": message.get("branch_id", "sucursal-001"),
-                    "product_id": product_id,
-                    "quantity_sold": quantity,
-                    "timestamp": message.get("timestamp"),
-                    "sale_price": message.get("sale_price", 0)
-                }
-                response = requests.post(
-                    "http://localhost:8000/sale-notification",
-                    json=notification,
-                    timeout=5
-                )
-                if response.status_code == 200:
-                    logger.info("✅ Notificación enviada al API central")
-                else:
-                    logger.warning(f"⚠️ Error al notificar al API central: {response.status_code}")
-            except Exception as e:
-                logger.error(f"❌ Error enviando notificación al API central: {e}")
+        outcome = apply_sale(message)
+        if outcome == 'applied':
+            applied = [message]
+            notify_central(message)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            finish_sales(applied, acked=True)
+        elif outcome == 'duplicate':
             ch.basic_ack(delivery_tag=method.delivery_tag)
         else:
-            logger.error(f"❌ Producto {product_id} no encontrado")
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ JSON inválido: {e}")
+    except codec.CodecError as e:
+        logger.error(f"❌ Payload inválido: {e}")
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
     except Exception as e:
         logger.error(f"❌ Error procesando mensaje: {e}")
+        finish_sales(applied, acked=False)
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
 
-def start_consumer():
-    params = pika.ConnectionParameters(
+def get_connection_params():
+    return pika.ConnectionParameters(
         host='localhost',
         port=5672,
         credentials=pika.PlainCredentials('ecomarket_user', 'ecomarket_password'),
         heartbeat=600,
         blocked_connection_timeout=300
     )
+
+
+def declare_sale_queues(channel, shards: Optional[int] = None):
+    sale_topology.declare_sale_topology(channel, shards)
+
+
+def start_consumer(shard: Optional[int] = None, shards: Optional[int] = None):
+    queue = sale_topology.consume_queue(shard, shards)
+    params = get_connection_params()
     connection = pika.BlockingConnection(params)
     channel = connection.channel()
-    channel.queue_declare(
-        queue='sale_notifications',
-        durable=True,
-        arguments={
-            'x-message-ttl': 86400000,
-            'x-dead-letter-exchange': '',
-            'x-dead-letter-routing-key': 'sale_notifications_dlq'
-        }
-    )
-    channel.queue_declare(
-        queue='sale_notifications_dlq',
-        durable=True
-    )
+    declare_sale_queues(channel, shards)
     channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue='sale_notifications', on_message_callback=process_sale_message)
-    logger.info("Esperando mensajes en la cola 'sale_notifications'. Presiona CTRL+C para salir.")
+    channel.basic_consume(queue=queue, on_message_callback=process_sale_message)
+    logger.info(f"Esperando mensajes en la cola '{queue}'. Presiona CTRL+C para salir.")
     channel.start_consuming()
 
+
+# ===== MODO ASÍNCRONO =====
+# Varias notificaciones en vuelo a la vez: prefetch configurable, un pool acotado de
+# workers (semáforo) y acks emitidos en orden de entrega con multiple=True.
+
+ACK = 'ack'
+NACK_DROP = 'nack_drop'
+NACK_REQUEUE = 'nack_requeue'
+
+
+class AsyncSaleConsumer:
+    def __init__(self, prefetch: int = 50, workers: int = 16, reconnect_delay: float = 5.0,
+                 shard: Optional[int] = None, shards: Optional[int] = None):
+        self.queue = sale_topology.consume_queue(shard, shards)
+        self.shards = shards
+        self.prefetch = prefetch
+        self.workers = workers
+        self.reconnect_delay = reconnect_delay
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connection: Optional[AsyncioConnection] = None
+        self._channel = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        # Delivery tags en orden de llegada y su resultado (con las ventas aplicadas) una vez procesados
+        self._delivered: Deque[int] = deque()
+        self._outcomes: Dict[int, Tuple[str, List[dict]]] = {}
+        # Los delivery tags reinician en cada canal: la generación distingue un canal de otro
+        self._generation = 0
+        self._stopping = False
+
+    # --- procesamiento ---
+
+    async def _post(self, path: str, payload) -> None:
+        try:
+            response = await self._client.post(f"{CENTRAL_API_URL}{path}", json=payload)
+            if response.status_code == 200:
+                logger.info("✅ Notificación enviada al API central")
+            else:
+                logger.warning(f"⚠️ Error al notificar al API central: {response.status_code}")
+        except httpx.HTTPError as e:
+            logger.error(f"❌ Error enviando notificación al API central: {e!r}")
+
+    async def process(self, body: bytes, content_type: Optional[str] = None) -> Tuple[str, List[dict]]:
+        """Resultado del mensaje y las ventas aplicadas (se registran al emitir el ack)."""
+        try:
+            message = codec.decode(body, content_type)
+        except codec.CodecError as e:
+            logger.error(f"❌ Payload inválido: {e}")
+            return NACK_DROP, []
+
+        # apply_sale no tiene puntos de espera: verificación y marca "en vuelo" son atómicas
+        applied: List[dict] = []
+        try:
+            if isinstance(message.get('notifications'), list):
+                for item in message['notifications']:
+                    if apply_sale(item) == 'applied':
+                        applied.append(item)
+                if applied:
+                    await self._post("/sale-notifications/batch", [_central_payload(m) for m in applied])
+                logger.info(f"📦 Lote {message.get('message_id')}: {len(applied)}/{len(message['notifications'])} ventas aplicadas")
+                return ACK, applied
+
+            outcome = apply_sale(message)
+            if outcome == 'applied':
+                applied.append(message)
+                await self._post("/sale-notification", _central_payload(message))
+                return ACK, applied
+            if outcome == 'duplicate':
+                return ACK, applied
+            return NACK_DROP, applied
+        except BaseException:
+            finish_sales(applied, acked=False)
+            raise
+
+    async def _handle(self, generation: int, delivery_tag: int, body: bytes, content_type: Optional[str]) -> None:
+        async with self._semaphore:
+            try:
+                outcome, applied = await self.process(body, content_type)
+            except Exception as e:
+                logger.error(f"❌ Error procesando mensaje: {e}")
+                outcome, applied = NACK_REQUEUE, []
+        if generation != self._generation:
+            # Entrega de un canal ya cerrado: RabbitMQ la reencola; su tag no vale en el canal nuevo
+            logger.info(f"⏭️ Resultado descartado de un canal anterior (tag {delivery_tag})")
+            finish_sales(applied, acked=False)
+            return
+        self._outcomes[delivery_tag] = (outcome, applied)
+        self._flush_acks()
+
+    def _flush_acks(self) -> None:
+        """Confirma el prefijo contiguo de mensajes ya procesados, en orden de entrega."""
+        channel = self._channel
+        if channel is None or not channel.is_open:
+            return
+        last_ack = None
+        acked: List[dict] = []
+        while self._delivered and self._delivered[0] in self._outcomes:
+            tag = self._delivered.popleft()
+            outcome, applied = self._outcomes.pop(tag)
+            if outcome == ACK:
+                last_ack = tag
+                acked.extend(applied)
+                continue
+            if last_ack is not None:
+                channel.basic_ack(delivery_tag=last_ack, multiple=True)
+                last_ack = None
+            channel.basic_nack(delivery_tag=tag, requeue=(outcome == NACK_REQUEUE))
+        if last_ack is not None:
+            channel.basic_ack(delivery_tag=last_ack, multiple=True)
+        finish_sales(acked, acked=True)
+
+    def _on_message(self, channel, method, properties, body) -> None:
+        self._delivered.append(method.delivery_tag)
+        self._loop.create_task(self._handle(self._generation, method.delivery_tag, body, properties.content_type))
+
+    # --- conexión (callbacks de pika) ---
+
+    def _connect(self) -> None:
+        self._connection = AsyncioConnection(
+            get_connection_params(),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self._loop
+        )
+
+    def _on_connection_open(self, connection) -> None:
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error) -> None:
+        logger.error(f"❌ No se pudo conectar a RabbitMQ: {error}")
+        self._schedule_reconnect()
+
+    def _on_connection_closed(self, connection, reason) -> None:
+        self._channel = None
+        # Las entregas sin ack vuelven a la cola al cerrarse la conexión
+        self._generation += 1
+        self._delivered.clear()
+        for _, applied in self._outcomes.values():
+            finish_sales(applied, acked=False)
+        self._outcomes.clear()
+        if self._stopping:
+            self._loop.stop()
+        else:
+            logger.warning(f"⚠️ Conexión cerrada: {reason}")
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self) -> None:
+        if not self._stopping:
+            self._loop.call_later(self.reconnect_delay, self._connect)
+
+    def _on_channel_open(self, channel) -> None:
+        self._channel = channel
+        sale_topology.declare_sale_topology_async(
+            channel,
+            lambda: channel.basic_qos(prefetch_count=self.prefetch, callback=self._on_qos_ok),
+            self.shards
+        )
+
+    def _on_qos_ok(self, _frame) -> None:
+        self._channel.basic_consume(queue=self.queue, on_message_callback=self._on_message)
+        logger.info(
+            f"Esperando mensajes en '{self.queue}' (modo async, prefetch={self.prefetch}, "
+            f"workers={self.workers}). Presiona CTRL+C para salir."
+        )
+
+    # --- ciclo de vida ---
+
+    def run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._client = httpx.AsyncClient(
+            timeout=5.0,
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers)
+        )
+        self._connect()
+        try:
+            self._loop.run_forever()
+        except KeyboardInterrupt:
+            self.stop()
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._client.aclose())
+            self._loop.close()
+
+    def stop(self) -> None:
+        self._stopping = True
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+        else:
+            self._loop.stop()
+
+
+def start_async_consumer(prefetch: int = 50, workers: int = 16, shard: Optional[int] = None,
+                         shards: Optional[int] = None):
+    AsyncSaleConsumer(prefetch=prefetch, workers=workers, shard=shard, shards=shards).run()
+
+
 if __name__ == "__main__":
-    start_consumer()
+    parser = argparse.ArgumentParser(description='Consumer de notificaciones de venta')
+    parser.add_argument('--mode', choices=['blocking', 'async'], default=os.environ.get('CONSUMER_MODE', 'blocking'))
+    parser.add_argument('--prefetch', type=int, default=int(os.environ.get('CONSUMER_PREFETCH', '50')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('CONSUMER_WORKERS', '16')))
+    parser.add_argument('--shard', type=int, default=os.environ.get('SALE_SHARD'),
+                        help='Shard a consumir (0..SALE_SHARDS-1); sin valor consume la cola única')
+    parser.add_argument('--shards', type=int, default=sale_topology.shard_count(),
+                        help='Cantidad de shards (por defecto SALE_SHARDS o 1)')
+    args = parser.parse_args()
+    shard = args.shard
+    try:
+        sale_topology.consume_queue(shard, args.shards)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if shard is not None and 'DEDUP_PATH' not in os.environ:
+        # Cada shard ve un subconjunto disjunto de message_ids: store propio por shard
+        processed_messages.close()
+        processed_messages = build_dedup_store(f'consumer_dedup.shard{shard}.db')
+
+    if args.mode == 'async':
+        start_async_consumer(prefetch=args.prefetch, workers=args.workers, shard=shard, shards=args.shards)
+    else:
+        start_consumer(shard=shard, shards=args.shards)
@@ -0,0 +1,123 @@
+"""consumer_base.py
+Base compartida para los consumers de `user_events` con modo micro-batching.
+
+El consumer junta hasta `batch_size` mensajes o espera `max_wait_ms` desde el primero,
+entrega el lote completo a `process_batch` y confirma con un solo
+`basic_ack(multiple=True)`. Con `batch_size=1` se comporta como antes (un ack por mensaje).
+
+`process_batch(channel, deliveries)` recibe una lista de `Delivery` y retorna una lista
+de bool del mismo largo: True = ack, False = nack sin requeue (va a la DLQ de la cola).
+"""
+
+import os
+import logging
+from typing import Callable, List, NamedTuple, Optional
+
+import pika
+
+logger = logging.getLogger(__name__)
+
+
+class Delivery(NamedTuple):
+    method: object
+    properties: object
+    body: bytes
+
+
+BatchHandler = Callable[[object, List[Delivery]], List[bool]]
+
+
+def per_message(handler: Callable[[object, Delivery], bool]) -> BatchHandler:
+    """Adapta un handler de un mensaje a `process_batch`."""
+    def process_batch(channel, deliveries: List[Delivery]) -> List[bool]:
+        return [handler(channel, delivery) for delivery in deliveries]
+    return process_batch
+
+
+class BatchingConsumer:
+    def __init__(self, params: pika.ConnectionParameters, queue: str, process_batch: BatchHandler,
+                 setup: Optional[Callable[[object], None]] = None, batch_size: int = 1,
+                 max_wait_ms: int = 200, name: Optional[str] = None):
+        self.params = params
+        self.queue = queue
+        self.process_batch = process_batch
+        self.setup = setup
+        self.batch_size = max(1, batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.name = name or queue
+        self._connection = None
+        self._channel = None
+        self._buffer: List[Delivery] = []
+        self._timer = None
+
+    @classmethod
+    def from_env(cls, params, queue, process_batch, setup=None, default_batch_size: int = 1,
+                 default_wait_ms: int = 200, name: Optional[str] = None) -> "BatchingConsumer":
+        """Lee CONSUMER_BATCH_SIZE / CONSUMER_BATCH_WAIT_MS con valores por defecto propios del consumer."""
+        return cls(
+            params, queue, process_batch, setup=setup,
+            batch_size=int(os.environ.get('CONSUMER_BATCH_SIZE', default_batch_size)),
+            max_wait_ms=int(os.environ.get('CONSUMER_BATCH_WAIT_MS', default_wait_ms)),
+            name=name
+        )
+
+    # ===== LOTE =====
+
+    def _on_message(self, channel, method, properties, body) -> None:
+        self._buffer.append(Delivery(method, properties, body))
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self._connection.call_later(self.max_wait_ms / 1000.0, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._connection.remove_timeout(self._timer)
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        channel = self._channel
+        try:
+            results = self.process_batch(channel, batch)
+        except Exception as e:
+            logger.error("%s: error procesando lote de %d mensajes: %s", self.name, len(batch), e)
+            channel.basic_nack(delivery_tag=batch[-1].method.delivery_tag, multiple=True, requeue=True)
+            return
+
+        last_ack = None
+        for delivery, ok in zip(batch, results):
+            if ok:
+                last_ack = delivery.method.delivery_tag
+            else:
+                channel.basic_nack(delivery_tag=delivery.method.delivery_tag, requeue=False)
+        if last_ack is not None:
+            # Un solo ack confirma todo el lote (los nack ya no están pendientes)
+            channel.basic_ack(delivery_tag=last_ack, multiple=True)
+        if len(batch) > 1:
+            logger.info("%s: lote de %d mensajes confirmado", self.name, len(batch))
+
+    # ===== CICLO DE VIDA =====
+
+    def run(self) -> None:
+        self._connection = pika.BlockingConnection(self.params)
+        self._channel = self._connection.channel()
+        if self.setup is not None:
+            self.setup(self._channel)
+        self._channel.basic_qos(prefetch_count=self.batch_size)
+        self._channel.basic_consume(queue=self.queue, on_message_callback=self._on_message)
+        logger.info("🎧 %s esperando en queue %s (batch_size=%d, max_wait_ms=%d)...",
+                    self.name, self.queue, self.batch_size, self.max_wait_ms)
+        try:
+            self._channel.start_consuming()
+        except KeyboardInterrupt:
+            logger.info("Cerrando consumer %s...", self.name)
+            self._channel.stop_consuming()
+            self._flush()
+        finally:
+            if self._connection.is_open:
+                self._connection.close()
@@ -2,17 +2,17 @@
 dead_letter_consumer.py
 Consume mensajes de la exchange `dead_letters` para inspección manual.
 """
-import json
 import logging
 from events import get_connection_params
 import pika
+import codec
 
 logging.basicConfig(level=logging.INFO)
 
 
 def process_dead_letter(ch, method, props, body):
     try:
-        message = json.loads(body)
+        message = codec.decode(body, props.content_type)
     except Exception:
         logging.error('DLQ: mensaje inválido')
         ch.basic_ack(delivery_tag=method.delivery_tag)
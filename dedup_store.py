@@ -0,0 +1,225 @@
+"""dedup_store.py
+Almacenes de idempotencia acotados para los consumers.
+
+Todos exponen la misma interfaz que un `set` (`message_id in store`, `store.add(id)`),
+así que reemplazan directamente al `set` en memoria:
+
+- MemoryDedupStore: en proceso, con TTL y tamaño máximo; desaloja por orden de alta
+  (FIFO: consultar un id no lo renueva, así la poda por TTL mira solo el frente).
+- SqliteDedupStore: en disco (SQLite WAL); sobrevive reinicios y poda por TTL.
+- BloomFrontedStore: filtro de Bloom delante de otro store para responder rápido
+  los "no visto" (la gran mayoría) sin tocar el disco.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import hashlib
+import math
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+
+class MemoryDedupStore:
+    def __init__(self, max_size: int = 1_000_000, ttl_seconds: float = 86400.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, message_id: Optional[str]) -> bool:
+        if message_id is None:
+            return False
+        with self._lock:
+            seen_at = self._seen.get(message_id)
+            if seen_at is None:
+                return False
+            if time.time() - seen_at > self.ttl_seconds:
+                del self._seen[message_id]
+                return False
+            return True
+
+    def add(self, message_id: Optional[str]) -> None:
+        if message_id is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._seen[message_id] = now
+            self._seen.move_to_end(message_id)
+            # Lo más antiguo está al frente: podar por tamaño y por TTL
+            while self._seen:
+                oldest_id, oldest_at = next(iter(self._seen.items()))
+                if len(self._seen) > self.max_size or now - oldest_at > self.ttl_seconds:
+                    del self._seen[oldest_id]
+                else:
+                    break
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def ids(self) -> Iterator[str]:
+        return iter(list(self._seen))
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteDedupStore:
+    def __init__(self, path: str, ttl_seconds: float = 86400.0, prune_every: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.prune_every = prune_every
+        self._adds = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed (message_id TEXT PRIMARY KEY, seen_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_seen_at ON processed(seen_at)")
+        self.prune()
+
+    def __contains__(self, message_id: Optional[str]) -> bool:
+        if message_id is None:
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM processed WHERE message_id = ? AND seen_at >= ?",
+                (message_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return row is not None
+
+    def add(self, message_id: Optional[str]) -> None:
+        if message_id is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed (message_id, seen_at) VALUES (?, ?)",
+                (message_id, time.time())
+            )
+            self._adds += 1
+            should_prune = self._adds % self.prune_every == 0
+        if should_prune:
+            self.prune()
+
+    def prune(self) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM processed WHERE seen_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        return cur.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def ids(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id FROM processed WHERE seen_at >= ?",
+                (time.time() - self.ttl_seconds,)
+            ).fetchall()
+        return (row[0] for row in rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class BloomFrontedStore:
+    """Filtro de Bloom de dos generaciones delante de `store`.
+
+    La generación activa se rota cada `rotate_seconds` para que la ventana del filtro
+    siga a la del TTL y la tasa de falsos positivos no crezca sin límite. Un id vive en
+    el filtro entre `rotate_seconds` y 2x`rotate_seconds`: rotar antes del TTL del store
+    haría responder "no visto" a ids que el store todavía recuerda (duplicados aplicados),
+    por eso el periodo nunca es menor que ese TTL.
+    """
+
+    def __init__(self, store, capacity: int = 1_000_000, error_rate: float = 0.001,
+                 rotate_seconds: Optional[float] = None):
+        self.store = store
+        self.capacity = capacity
+        self.error_rate = error_rate
+        ttl = getattr(store, 'ttl_seconds', 0.0)
+        self.rotate_seconds = max(ttl, rotate_seconds or 0.0) or 86400.0
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+        # Calentar el filtro con lo que el store ya conoce (p. ej. tras un reinicio)
+        for message_id in store.ids():
+            self._current.add(message_id)
+
+    def _maybe_rotate(self) -> None:
+        if time.monotonic() - self._rotated_at > self.rotate_seconds:
+            self._previous, self._current = self._current, BloomFilter(self.capacity, self.error_rate)
+            self._rotated_at = time.monotonic()
+
+    def __contains__(self, message_id: Optional[str]) -> bool:
+        if message_id is None:
+            return False
+        with self._lock:
+            self._maybe_rotate()
+            maybe_seen = message_id in self._current or message_id in self._previous
+        return maybe_seen and message_id in self.store
+
+    def add(self, message_id: Optional[str]) -> None:
+        if message_id is None:
+            return
+        with self._lock:
+            self._maybe_rotate()
+            self._current.add(message_id)
+        self.store.add(message_id)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def ids(self) -> Iterator[str]:
+        return self.store.ids()
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def build_dedup_store(default_path: str = 'consumer_dedup.db', path_var: str = 'DEDUP_PATH'):
+    """Construye el store según variables de entorno.
+
+    DEDUP_BACKEND=memory|sqlite, DEDUP_PATH (o `path_var`), DEDUP_TTL_SECONDS, DEDUP_MAX_SIZE,
+    DEDUP_BLOOM=0|1
+    """
+    backend = os.environ.get('DEDUP_BACKEND', 'sqlite')
+    ttl = float(os.environ.get('DEDUP_TTL_SECONDS', '86400'))
+    max_size = int(os.environ.get('DEDUP_MAX_SIZE', '1000000'))
+    if backend == 'memory':
+        store = MemoryDedupStore(max_size=max_size, ttl_seconds=ttl)
+    elif backend == 'sqlite':
+        store = SqliteDedupStore(os.environ.get(path_var, default_path), ttl_seconds=ttl)
+    else:
+        raise ValueError(f"DEDUP_BACKEND desconocido: {backend}")
+    if os.environ.get('DEDUP_BLOOM', '1') == '1':
+        store = BloomFrontedStore(store, capacity=max_size, rotate_seconds=ttl)
+    return store
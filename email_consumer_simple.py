@@ -4,10 +4,10 @@ Consumer simple que se bindea al exchange fanout `user_events` y procesa eventos
 Uso: python email_consumer_simple.py
 """
 import os
-import json
 import logging
 from events import get_connection_params, republish_to_retry_queue, publish_to_dead_letters
-import pika
+from consumer_base import BatchingConsumer, per_message
+import codec
 
 logging.basicConfig(level=logging.INFO)
 
@@ -21,12 +21,12 @@ else:
     RETRY_DELAYS_MS = [5000, 30000, 120000]  # 5s, 30s, 2min
 
 
-def process_user_created_email(ch, method, props, body):
+def process_user_created_email(ch, delivery) -> bool:
+    props = delivery.properties
     try:
-        message = json.loads(body)
+        message = codec.decode(delivery.body, props.content_type)
     except Exception:
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
+        return False
 
     if message.get('event_type') == 'UsuarioCreado' or 'email' in message:
         email = message.get('email')
@@ -40,7 +40,7 @@ def process_user_created_email(ch, method, props, body):
 
             logging.info(f"📧 Enviando email a {email}")
             # Lógica real de envío aquí
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return True
 
         except Exception as e:
             logging.error('Error enviando email: %s', e)
@@ -48,25 +48,20 @@ def process_user_created_email(ch, method, props, body):
             retries = int(headers.get('x-retries', 0))
             if retries >= MAX_RETRIES:
                 logging.warning('Retries excedidos para mensaje; enviando a dead_letters')
-                publish_to_dead_letters(message, headers=headers)
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+                publish_to_dead_letters(message, headers=headers, channel=ch)
+                return True
             else:
                 # Republish to retry queue with increasing delay
                 new_headers = dict(headers)
                 new_headers['x-retries'] = retries + 1
                 delay = RETRY_DELAYS_MS[min(retries, len(RETRY_DELAYS_MS)-1)]
-                republish_to_retry_queue('email_queue', message, headers=new_headers, delay_ms=delay)
+                republish_to_retry_queue('email_queue', message, headers=new_headers, delay_ms=delay, channel=ch)
                 logging.info('Re-publicado a retry-queue (delay %d ms) retries=%d', delay, retries+1)
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-    else:
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return True
+    return False
 
 
-def start_email_consumer():
-    params = get_connection_params()
-    conn = pika.BlockingConnection(params)
-    ch = conn.channel()
-
+def setup_email_queue(ch):
     ch.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
 
     # Declarar cola durable nombrada para email con DLQ
@@ -76,11 +71,15 @@ def start_email_consumer():
     ch.queue_declare(queue='email_queue', durable=True, arguments=args)
     ch.queue_bind(exchange='user_events', queue='email_queue')
 
-    ch.basic_qos(prefetch_count=1)
-    ch.basic_consume(queue='email_queue', on_message_callback=process_user_created_email)
 
-    logging.info('🎧 Email consumer esperando en queue email_queue...')
-    ch.start_consuming()
+def start_email_consumer():
+    BatchingConsumer.from_env(
+        get_connection_params(),
+        'email_queue',
+        per_message(process_user_created_email),
+        setup=setup_email_queue,
+        name='Email consumer'
+    ).run()
 
 
 if __name__ == '__main__':
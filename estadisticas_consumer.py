@@ -2,12 +2,15 @@
 Consumer opcional que cuenta usuarios nuevos a partir del evento UsuarioCreado.
 
 Mantiene un contador en memoria (demostración). En producción usar persistencia (Redis/DB).
+Procesa en micro-lotes (por defecto hasta 100 mensajes o 200 ms) con un solo ack por lote.
 """
 import pika
-import json
 import logging
 from threading import Lock
 
+from consumer_base import BatchingConsumer
+import codec
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -25,33 +28,33 @@ def get_connection_params():
     )
 
 
-def on_message(ch, method, properties, body):
+def on_batch(ch, deliveries):
+    """Cuenta todos los usuarios válidos del lote con una sola toma del lock."""
     global _counter
-    try:
-        evt = json.loads(body)
-    except Exception as e:
-        logger.error("JSON inválido en estadisticas_consumer: %s", e)
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
-
-    if 'id' not in evt:
-        logger.error("Evento sin id: %s", evt)
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
+    results = []
+    for delivery in deliveries:
+        try:
+            evt = codec.decode(delivery.body, delivery.properties.content_type)
+        except Exception as e:
+            logger.error("Payload inválido en estadisticas_consumer: %s", e)
+            results.append(False)
+            continue
+
+        if 'id' not in evt:
+            logger.error("Evento sin id: %s", evt)
+            results.append(False)
+            continue
+        results.append(True)
 
     with _lock:
-        _counter += 1
+        _counter += sum(results)
         current = _counter
 
-    logger.info("[ESTADISTICAS] Nuevo usuario contado. Total: %d", current)
-    ch.basic_ack(delivery_tag=method.delivery_tag)
-
+    logger.info("[ESTADISTICAS] %d usuarios nuevos contados. Total: %d", sum(results), current)
+    return results
 
-def main():
-    params = get_connection_params()
-    connection = pika.BlockingConnection(params)
-    channel = connection.channel()
 
+def setup_queues(channel):
     channel.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
     channel.queue_declare(queue='estadisticas_user_queue', durable=True, arguments={
         'x-dead-letter-exchange': '',
@@ -60,17 +63,16 @@ def main():
     channel.queue_declare(queue='estadisticas_user_dlq', durable=True)
     channel.queue_bind(exchange='user_events', queue='estadisticas_user_queue')
 
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue='estadisticas_user_queue', on_message_callback=on_message)
-
-    logger.info("Esperando eventos en 'estadisticas_user_queue' (CTRL+C para salir)")
-    try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        logger.info("Cerrando consumidor de estadísticas...")
-        channel.stop_consuming()
-    finally:
-        connection.close()
+
+def main():
+    BatchingConsumer.from_env(
+        get_connection_params(),
+        'estadisticas_user_queue',
+        on_batch,
+        setup=setup_queues,
+        default_batch_size=100,
+        name='Estadisticas consumer'
+    ).run()
 
 
 if __name__ == '__main__':
@@ -1,16 +1,25 @@
 """events.py
 Encapsula la lógica de publicación de eventos a RabbitMQ para el Taller 4.
 
-Provee una función `publish_user_created` con reintentos simples.
+Provee `publish_user_created` (publisher confirms en pipeline sobre un canal persistente)
+y los helpers de reintento / dead letters usados por los consumers.
 """
 
 import os
 import pika
-import json
+import queue
 import time
-from typing import Dict, Any, Optional
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, Set, Tuple
 import logging
 
+from pika.adapters.select_connection import IOLoop
+
+import codec
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,70 +39,474 @@ def get_connection_params():
     )
 
 
-def publish_user_created(user_data: Dict[str, Any], max_retries: int = 5, backoff_seconds: float = 1.5) -> bool:
-    """Publica un evento UsuarioCreado al exchange 'user_events'.
+class PublishNacked(Exception):
+    """El broker rechazó (basic.nack) el mensaje publicado."""
+
+
+class _PendingMessage:
+    __slots__ = ('body', 'routing_key', 'properties', 'future')
+
+    def __init__(self, body, routing_key, properties, future):
+        self.body = body
+        self.routing_key = routing_key
+        self.properties = properties
+        self.future = future
+
+
+class ConfirmedPublisher:
+    """Publisher con publisher confirms en pipeline sobre un canal persistente.
+
+    Un hilo de I/O es dueño de una `SelectConnection` con el canal en modo confirm.
+    `publish()` puede llamarse desde cualquier hilo y retorna un Future que se resuelve
+    cuando llega el basic.ack del broker (los acks `multiple` resuelven varios a la vez).
+    La ventana `max_in_flight` limita los mensajes sin confirmar: cuando se llena,
+    `publish()` bloquea (backpressure). Si la conexión cae, lo no confirmado se
+    republica al reconectar (entrega at-least-once).
+
+    `publish_nowait()` nunca bloquea: deja el mensaje en una cola acotada de envío que
+    el hilo de I/O vacía en ráfagas (un solo despertar para muchos mensajes).
+    """
+
+    def __init__(self, exchange: str = 'user_events', exchange_type: str = 'fanout',
+                 max_in_flight: int = 1000, max_queue: int = 10000, reconnect_delay: float = 2.0,
+                 params_factory=get_connection_params):
+        self.exchange = exchange
+        self.exchange_type = exchange_type
+        self.max_in_flight = max_in_flight
+        self.reconnect_delay = reconnect_delay
+        self._params_factory = params_factory
+        self._window = threading.BoundedSemaphore(max_in_flight)
+        self._send_queue: "queue.Queue[_PendingMessage]" = queue.Queue(maxsize=max_queue)
+        self._pump_scheduled = threading.Event()
+        self._ioloop = None
+        self._connection = None
+        self._channel = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = False
+        self._stopping = False
+        # Solo se tocan desde el hilo de I/O
+        self._next_tag = 0
+        self._outstanding: Dict[int, _PendingMessage] = {}
+        self._backlog: "deque[_PendingMessage]" = deque()
+        # Contadores (lectura aproximada desde otros hilos)
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self.confirmed = 0
+        self.nacked = 0
+        self.rejected = 0
+
+    # ===== CICLO DE VIDA =====
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._ioloop = IOLoop()
+        self._thread = threading.Thread(target=self._run, name='confirmed-publisher', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        self._connect()
+        self._ioloop.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Drena la cola de envío, espera (hasta `timeout`) las confirmaciones pendientes y cierra.
+
+        Lo que no se confirmó a tiempo (backlog y cola de envío) se resuelve con error.
+        """
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self.in_flight or not self._send_queue.empty()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping = True
+        self._ioloop.add_callback_threadsafe(self._close)
+        self._thread.join(max(0.5, deadline - time.monotonic()))
+        self._thread = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready,
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self._send_queue.qsize(),
+            "confirmed": self.confirmed,
+            "nacked": self.nacked,
+            "rejected_queue_full": self.rejected,
+        }
+
+    # ===== API =====
+
+    def publish(self, body, routing_key: str = '', properties: Optional[pika.BasicProperties] = None,
+                block_timeout: Optional[float] = 30.0) -> Future:
+        future: Future = Future()
+        if self._thread is None or self._stopping:
+            future.set_exception(RuntimeError("ConfirmedPublisher no está iniciado"))
+            return future
+        if not self._window.acquire(timeout=block_timeout):
+            future.set_exception(TimeoutError("Ventana de mensajes sin confirmar llena"))
+            return future
+        self._add_in_flight(1)
+        message = _PendingMessage(body, routing_key, properties, future)
+        self._ioloop.add_callback_threadsafe(lambda: self._enqueue(message))
+        return future
+
+    def publish_nowait(self, body, routing_key: str = '', properties: Optional[pika.BasicProperties] = None) -> bool:
+        """Encola sin bloquear; retorna False si la cola de envío está llena o el publisher detenido."""
+        if self._thread is None or self._stopping:
+            return False
+        message = _PendingMessage(body, routing_key, properties, Future())
+        message.future.add_done_callback(_log_unconfirmed)
+        try:
+            self._send_queue.put_nowait(message)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self._schedule_pump()
+        return True
+
+    def _schedule_pump(self) -> None:
+        # Coalescer: solo se agenda un despertar del hilo de I/O por ráfaga
+        if not self._pump_scheduled.is_set():
+            self._pump_scheduled.set()
+            self._ioloop.add_callback_threadsafe(self._pump)
+
+    # ===== HILO DE I/O =====
+
+    def _pump(self) -> None:
+        """Mueve mensajes de la cola de envío al canal mientras haya ventana disponible."""
+        self._pump_scheduled.clear()
+        while not self._send_queue.empty():
+            if not self._window.acquire(blocking=False):
+                break  # se reanuda cuando lleguen confirmaciones
+            try:
+                message = self._send_queue.get_nowait()
+            except queue.Empty:
+                self._window.release()
+                break
+            self._add_in_flight(1)
+            self._backlog.append(message)
+        if self._ready:
+            self._flush_backlog()
+
+    def _add_in_flight(self, delta: int) -> None:
+        with self._in_flight_lock:
+            self._in_flight += delta
+
+    def _resolve(self, message: _PendingMessage, ok: bool) -> None:
+        if ok:
+            self.confirmed += 1
+            message.future.set_result(True)
+        else:
+            self.nacked += 1
+            message.future.set_exception(PublishNacked("El broker rechazó el mensaje"))
+        self._add_in_flight(-1)
+        self._window.release()
+        if not self._send_queue.empty():
+            self._schedule_pump()
+
+    def _enqueue(self, message: _PendingMessage) -> None:
+        self._backlog.append(message)
+        if self._ready:
+            self._flush_backlog()
+
+    def _flush_backlog(self) -> None:
+        while self._backlog and self._ready:
+            message = self._backlog.popleft()
+            self._next_tag += 1
+            self._outstanding[self._next_tag] = message
+            self._channel.basic_publish(
+                exchange=self.exchange,
+                routing_key=message.routing_key,
+                body=message.body,
+                properties=message.properties
+            )
+
+    def _on_confirm(self, frame) -> None:
+        method = frame.method
+        ok = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            # _outstanding está ordenado por delivery tag (orden de inserción)
+            for tag in [t for t in self._outstanding if t <= method.delivery_tag]:
+                self._resolve(self._outstanding.pop(tag), ok)
+        else:
+            message = self._outstanding.pop(method.delivery_tag, None)
+            if message is not None:
+                self._resolve(message, ok)
+
+    def _connect(self) -> None:
+        self._connection = pika.SelectConnection(
+            self._params_factory(),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self._ioloop
+        )
+
+    def _on_connection_open(self, connection) -> None:
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_channel_open(self, channel) -> None:
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.exchange_declare(
+            exchange=self.exchange, exchange_type=self.exchange_type, durable=True,
+            callback=lambda _frame: channel.confirm_delivery(
+                ack_nack_callback=self._on_confirm, callback=self._on_confirm_mode
+            )
+        )
+
+    def _on_confirm_mode(self, _frame) -> None:
+        self._next_tag = 0
+        self._ready = True
+        logger.info("📡 ConfirmedPublisher listo (exchange=%s, ventana=%d)", self.exchange, self.max_in_flight)
+        self._flush_backlog()
+
+    def _requeue_outstanding(self) -> None:
+        """Lo publicado sin confirmar vuelve al frente del backlog para republicarse."""
+        self._ready = False
+        pending = list(self._outstanding.values())
+        self._outstanding.clear()
+        self._backlog.extendleft(reversed(pending))
+
+    def _on_channel_closed(self, channel, reason) -> None:
+        self._requeue_outstanding()
+        self._channel = None
+        if not self._stopping and self._connection is not None and self._connection.is_open:
+            logger.warning("⚠️ Canal de publicación cerrado (%s); reabriendo", reason)
+            self._connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error) -> None:
+        logger.error("❌ ConfirmedPublisher sin conexión a RabbitMQ: %s", error)
+        self._after_disconnect()
+
+    def _on_connection_closed(self, connection, reason) -> None:
+        self._requeue_outstanding()
+        self._channel = None
+        if not self._stopping:
+            logger.warning("⚠️ Conexión de publicación cerrada: %s", reason)
+        self._after_disconnect()
+
+    def _after_disconnect(self) -> None:
+        if self._stopping:
+            error = RuntimeError("ConfirmedPublisher detenido")
+            self._fail_backlog(error)
+            self._fail_send_queue(error)
+            self._ioloop.stop()
+        else:
+            self._ioloop.call_later(self.reconnect_delay, self._connect)
+
+    def _fail_backlog(self, error: Exception) -> None:
+        while self._backlog:
+            message = self._backlog.popleft()
+            message.future.set_exception(error)
+            self._add_in_flight(-1)
+            self._window.release()
+
+    def _fail_send_queue(self, error: Exception) -> None:
+        # Sin ventana tomada: nunca llegaron al backlog
+        while True:
+            try:
+                message = self._send_queue.get_nowait()
+            except queue.Empty:
+                return
+            message.future.set_exception(error)
 
-    Retorna True si el publish fue exitoso, False si falló después de reintentos.
+    def _close(self) -> None:
+        if self._connection is not None and not (self._connection.is_closed or self._connection.is_closing):
+            self._connection.close()
+        else:
+            self._after_disconnect()
+
+
+def _log_unconfirmed(future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error("Evento no confirmado por el broker: %r", error)
+
+
+_user_events_publisher: Optional[ConfirmedPublisher] = None
+_user_events_publisher_lock = threading.Lock()
+
+
+def get_user_events_publisher() -> ConfirmedPublisher:
+    """Publisher confirmado compartido por proceso para el exchange 'user_events'."""
+    global _user_events_publisher
+    with _user_events_publisher_lock:
+        if _user_events_publisher is None:
+            _user_events_publisher = ConfirmedPublisher(
+                exchange='user_events',
+                exchange_type='fanout',
+                max_in_flight=int(os.environ.get('PUBLISH_MAX_IN_FLIGHT', '1000')),
+                max_queue=int(os.environ.get('PUBLISH_MAX_QUEUE', '10000'))
+            )
+            _user_events_publisher.start()
+        return _user_events_publisher
+
+
+def user_events_publisher_stats() -> Optional[Dict[str, Any]]:
+    """Stats del publisher compartido, o None si no hay uno (nunca lo crea: apto para /health)."""
+    publisher = _user_events_publisher
+    return publisher.stats() if publisher is not None else None
+
+
+def shutdown_user_events_publisher(timeout: float = 10.0) -> None:
+    """Drena y cierra el publisher compartido (llamar al apagar el proceso)."""
+    global _user_events_publisher
+    with _user_events_publisher_lock:
+        publisher, _user_events_publisher = _user_events_publisher, None
+    if publisher is not None:
+        publisher.stop(timeout=timeout)
+
+
+# Codec de los eventos de usuario: EVENT_CODEC=json|orjson|msgpack (los consumers detectan el formato)
+USER_EVENT_CODEC = codec.codec_from_env('EVENT_CODEC')
+
+
+_USER_EVENT_PROPERTIES: Dict[str, pika.BasicProperties] = {}
+
+
+def encode_user_event(message: Dict[str, Any]) -> Tuple[bytes, pika.BasicProperties]:
+    """Body y properties (persistente, con el content_type usado) de un evento de usuario.
+
+    Si USER_EVENT_CODEC no puede representar el evento (p. ej. sale-struct) se usa JSON.
     """
-    body = {
+    body, content_type = codec.encode(message, USER_EVENT_CODEC)
+    properties = _USER_EVENT_PROPERTIES.get(content_type)
+    if properties is None:
+        properties = _USER_EVENT_PROPERTIES[content_type] = pika.BasicProperties(
+            delivery_mode=2, content_type=content_type
+        )
+    return body, properties
+
+
+def user_created_message(user_data: Dict[str, Any]) -> Tuple[bytes, pika.BasicProperties]:
+    return encode_user_event({
         **user_data,
         "event_type": "UsuarioCreado"
-    }
+    })
 
+
+def publish_user_created(user_data: Dict[str, Any], max_retries: int = 5, backoff_seconds: float = 1.5,
+                         confirm_timeout: float = 30.0) -> bool:
+    """Publica un evento UsuarioCreado al exchange 'user_events'.
+
+    Usa el publisher confirmado compartido: la llamada espera el ack del broker, pero
+    muchas llamadas concurrentes comparten el canal y sus confirmaciones en pipeline.
+    Un mensaje sin confirmar sigue en el backlog del publisher (se republica al
+    reconectar), así que un timeout vuelve a esperar el mismo Future; solo se publica
+    de nuevo si el anterior terminó en error (nack, ventana llena, publisher detenido).
+    Retorna True si el publish fue confirmado, False si falló después de reintentos (si el
+    último intento seguía pendiente, el evento aún puede salir al reconectar: at-least-once).
+    """
+    body, properties = user_created_message(user_data)
+
+    future: Optional[Future] = None
     attempt = 0
     while attempt < max_retries:
+        if future is None:
+            future = get_user_events_publisher().publish(body, properties=properties)
         try:
-            params = get_connection_params()
-            connection = pika.BlockingConnection(params)
-            channel = connection.channel()
-            channel.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
-            channel.basic_publish(
-                exchange='user_events',
-                routing_key='',
-                body=json.dumps(body),
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
-            connection.close()
-            logger.info("Evento UsuarioCreado publicado: %s", body)
+            future.result(timeout=confirm_timeout)
+            logger.info("Evento UsuarioCreado publicado: id=%s", user_data.get('id'))
             return True
         except Exception as e:
             attempt += 1
-            logger.error("Error publicando evento (intento %d/%d): %s", attempt, max_retries, e)
-            time.sleep(backoff_seconds * attempt)
+            logger.error("Error publicando evento (intento %d/%d): %r", attempt, max_retries, e)
+            if future.done():
+                future = None
+                time.sleep(backoff_seconds * attempt)
 
     logger.error("No se pudo publicar evento UsuarioCreado después de %d intentos", max_retries)
     return False
 
 
-def republish_to_retry_queue(queue_name: str, message: Dict[str, Any], headers: Optional[Dict[str, Any]] = None, delay_ms: int = 5000) -> None:
+# ===== PUBLICACIÓN EN EL CAMINO DE FALLA =====
+# Reutiliza el canal del consumer (o una conexión cacheada por hilo) y memoiza las
+# declaraciones, para que reintentar un mensaje cueste lo mismo que procesarlo.
+
+_local = threading.local()
+_declared: "weakref.WeakKeyDictionary[Any, Set[str]]" = weakref.WeakKeyDictionary()
+
+
+def _cached_channel():
+    """Canal de una conexión persistente por hilo; se recrea si se cerró."""
+    ch = getattr(_local, 'channel', None)
+    if ch is None or not ch.is_open:
+        conn = getattr(_local, 'connection', None)
+        if conn is None or not conn.is_open:
+            conn = pika.BlockingConnection(get_connection_params())
+            _local.connection = conn
+        ch = conn.channel()
+        _local.channel = ch
+    return ch
+
+
+def _reset_cached_channel() -> None:
+    conn = getattr(_local, 'connection', None)
+    _local.channel = None
+    _local.connection = None
+    try:
+        if conn is not None and conn.is_open:
+            conn.close()
+    except Exception:
+        pass
+
+
+def _declare_once(ch, key: str, declare) -> None:
+    declared = _declared.setdefault(ch, set())
+    if key not in declared:
+        declare()
+        declared.add(key)
+
+
+def _publish_failure_path(channel, publish) -> None:
+    """Ejecuta `publish(ch)` en el canal dado o en el canal cacheado (con un reintento)."""
+    if channel is not None:
+        publish(channel)
+        return
+    try:
+        publish(_cached_channel())
+    except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError):
+        _reset_cached_channel()
+        publish(_cached_channel())
+
+
+def republish_to_retry_queue(queue_name: str, message: Dict[str, Any], headers: Optional[Dict[str, Any]] = None, delay_ms: int = 5000, channel=None) -> None:
     """Publica el mensaje en una retry-queue con TTL que dead-letters a la queue original.
 
     retry queue name: {queue_name}.retry.{delay_ms}
     La retry-queue tiene x-message-ttl = delay_ms y x-dead-letter-routing-key = queue_name
+    Si se pasa `channel` (p. ej. el del consumer) se publica ahí sin abrir conexión nueva.
     """
-    params = get_connection_params()
-    conn = pika.BlockingConnection(params)
-    ch = conn.channel()
-
     retry_queue = f"{queue_name}.retry.{delay_ms}"
     args = {
         'x-dead-letter-exchange': '',
         'x-dead-letter-routing-key': queue_name,
         'x-message-ttl': delay_ms,
     }
-    ch.queue_declare(queue=retry_queue, durable=True, arguments=args)
+    body, content_type = codec.encode(message, USER_EVENT_CODEC)
+    props = pika.BasicProperties(headers=headers or {}, delivery_mode=2, content_type=content_type)
+
+    def publish(ch):
+        _declare_once(ch, retry_queue, lambda: ch.queue_declare(queue=retry_queue, durable=True, arguments=args))
+        ch.basic_publish(exchange='', routing_key=retry_queue, body=body, properties=props)
 
-    props = pika.BasicProperties(headers=headers or {}, delivery_mode=2, content_type='application/json')
-    ch.basic_publish(exchange='', routing_key=retry_queue, body=json.dumps(message), properties=props)
-    conn.close()
+    _publish_failure_path(channel, publish)
 
 
-def publish_to_dead_letters(message: Dict[str, Any], headers: Optional[Dict[str, Any]] = None) -> None:
+def publish_to_dead_letters(message: Dict[str, Any], headers: Optional[Dict[str, Any]] = None, channel=None) -> None:
     """Publica un mensaje a la exchange `dead_letters` para inspección/operaciones manuales."""
-    params = get_connection_params()
-    conn = pika.BlockingConnection(params)
-    ch = conn.channel()
-    ch.exchange_declare(exchange='dead_letters', exchange_type='fanout', durable=True)
-    props = pika.BasicProperties(headers=headers or {}, delivery_mode=2, content_type='application/json')
-    ch.basic_publish(exchange='dead_letters', routing_key='', body=json.dumps(message), properties=props)
-    conn.close()
+    body, content_type = codec.encode(message, USER_EVENT_CODEC)
+    props = pika.BasicProperties(headers=headers or {}, delivery_mode=2, content_type=content_type)
+
+    def publish(ch):
+        _declare_once(ch, 'exchange:dead_letters',
+                      lambda: ch.exchange_declare(exchange='dead_letters', exchange_type='fanout', durable=True))
+        ch.basic_publish(exchange='dead_letters', routing_key='', body=body, properties=props)
+
+    _publish_failure_path(channel, publish)
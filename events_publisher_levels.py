@@ -1,21 +1,25 @@
 """
-Script para demo: publisher en 3 niveles (simple, persistente, robusto con confirms).
+Script para demo: publisher en 4 niveles (simple, persistente, robusto con confirms,
+confirms en pipeline sobre un canal persistente).
 Uso: python events_publisher_levels.py --level 1 --nombre "Ana" --email "ana@example.com"
+     python events_publisher_levels.py --level 4 --count 1000
 """
 import argparse
-import json
 import uuid
 from datetime import datetime
 import time
 import pika
-from events import get_connection_params
+import codec
+from events import get_connection_params, ConfirmedPublisher, USER_EVENT_CODEC, encode_user_event
 
 
 def publish_level1(user_data: dict):
     conn = pika.BlockingConnection(get_connection_params())
     ch = conn.channel()
     ch.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
-    ch.basic_publish(exchange='user_events', routing_key='', body=json.dumps(user_data))
+    body, content_type = codec.encode(user_data, USER_EVENT_CODEC)
+    ch.basic_publish(exchange='user_events', routing_key='', body=body,
+                     properties=pika.BasicProperties(content_type=content_type))
     conn.close()
     print('Publicado (nivel 1)')
 
@@ -25,7 +29,8 @@ def publish_level2_persistent(user_data: dict):
     conn = pika.BlockingConnection(get_connection_params())
     ch = conn.channel()
     ch.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
-    ch.basic_publish(exchange='user_events', routing_key='', body=json.dumps(message), properties=pika.BasicProperties(delivery_mode=2, content_type='application/json'))
+    body, properties = encode_user_event(message)
+    ch.basic_publish(exchange='user_events', routing_key='', body=body, properties=properties)
     conn.close()
     print('Publicado (nivel 2 persistent)')
 
@@ -39,7 +44,8 @@ def publish_level3_confirm(user_data: dict, max_retries: int = 3):
             ch = conn.channel()
             ch.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
             ch.confirm_delivery()
-            ch.basic_publish(exchange='user_events', routing_key='', body=json.dumps(message), properties=pika.BasicProperties(delivery_mode=2, content_type='application/json'), mandatory=True)
+            body, properties = encode_user_event(message)
+            ch.basic_publish(exchange='user_events', routing_key='', body=body, properties=properties, mandatory=True)
             conn.close()
             print(f'Publicado y confirmado (nivel 3) {message["event_id"]}')
             return True
@@ -50,11 +56,34 @@ def publish_level3_confirm(user_data: dict, max_retries: int = 3):
     return False
 
 
+def publish_level4_pipelined(user_data: dict, count: int = 1, max_in_flight: int = 1000):
+    """Nivel 3 sin round-trip por mensaje: se publican todos y se esperan los acks al final."""
+    publisher = ConfirmedPublisher(exchange='user_events', exchange_type='fanout', max_in_flight=max_in_flight)
+    publisher.start()
+    start = time.perf_counter()
+    futures = []
+    for _ in range(count):
+        message = {**user_data, 'event_type': 'UsuarioCreado', 'event_id': str(uuid.uuid4()), 'timestamp': datetime.utcnow().isoformat()}
+        body, properties = encode_user_event(message)
+        futures.append(publisher.publish(body, properties=properties))
+    confirmed = 0
+    for future in futures:
+        try:
+            confirmed += bool(future.result(timeout=30))
+        except Exception as e:
+            print(f'Mensaje no confirmado: {e!r}')
+    elapsed = time.perf_counter() - start
+    publisher.stop()
+    print(f'Publicados y confirmados (nivel 4) {confirmed}/{count} en {elapsed:.2f}s')
+    return confirmed == count
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--level', type=int, default=1, choices=[1,2,3])
+    parser.add_argument('--level', type=int, default=1, choices=[1,2,3,4])
     parser.add_argument('--nombre', default='Test')
     parser.add_argument('--email', default='test@example.com')
+    parser.add_argument('--count', type=int, default=1, help='Mensajes a publicar (nivel 4)')
     args = parser.parse_args()
 
     user = {'user_id': str(uuid.uuid4()), 'nombre': args.nombre, 'email': args.email}
@@ -63,5 +92,7 @@ if __name__ == '__main__':
         publish_level1(user)
     elif args.level == 2:
         publish_level2_persistent(user)
-    else:
+    elif args.level == 3:
         publish_level3_confirm(user)
+    else:
+        publish_level4_pipelined(user, count=args.count)
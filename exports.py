@@ -0,0 +1,87 @@
+"""exports.py
+Exportaciones en streaming (NDJSON o CSV) para conciliación.
+
+- Las filas salen de un generador y se envían en bloques de ~64 KB: memoria constante y
+  primer byte inmediato, sin armar la lista completa del historial.
+- gzip opcional: el mismo flujo se comprime por bloques con zlib (`Content-Encoding: gzip`).
+- Los generadores son síncronos: Starlette los recorre en su threadpool, así que leer el
+  archivo histórico del disco no bloquea el event loop.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def naive_local(ts: Optional[datetime]) -> Optional[datetime]:
+    """Fecha con zona (p. ej. `...Z` en la query) -> hora local sin zona, como los timestamps guardados."""
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone().replace(tzinfo=None)
+
+
+def ndjson_lines(rows: Iterable[dict]) -> Iterator[bytes]:
+    for row in rows:
+        yield (json.dumps(row, default=str) + "\n").encode()
+
+
+def csv_lines(rows: Iterable[dict], fields: Sequence[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore', lineterminator="\n")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def chunked(lines: Iterable[bytes], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Agrupa líneas en bloques de ~`size` bytes (un write por bloque, no por fila)."""
+    parts, length = [], 0
+    for line in lines:
+        parts.append(line)
+        length += len(line)
+        if length >= size:
+            yield b"".join(parts)
+            parts, length = [], 0
+    if parts:
+        yield b"".join(parts)
+
+
+def gzipped(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(rows: Iterable[dict], fmt: str, fields: Sequence[str], filename: str,
+                    gzip: bool = False) -> StreamingResponse:
+    """StreamingResponse con las filas en NDJSON o CSV; 400 si el formato no existe."""
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {fmt} (ndjson | csv)")
+    lines = ndjson_lines(rows) if fmt == "ndjson" else csv_lines(rows, fields)
+    body = chunked(lines)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    if gzip:
+        body = gzipped(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=MEDIA_TYPES[fmt], headers=headers)
@@ -0,0 +1,327 @@
+"""inventory_engine.py
+Motor de inventario seguro entre hilos, compartido por el API central y las sucursales.
+
+- Registros compactos en columnas (`array` para stock, precio y versión; lista para nombres),
+  un slot por producto.
+- Escrituras de stock con locks por franjas (lock striping): dos productos en franjas
+  distintas nunca se bloquean entre sí.
+- Operaciones atómicas: `reserve` (sin sobreventa), `release`, `decrement_clamped`
+  (descuento sin bajar de 0, como el central), `compare_and_set` y `set_stock`.
+  `decrement_many` aplica un lote de descuentos en un solo paso, tomando los locks de
+  sus franjas en orden fijo (por índice) para que dos lotes no se bloqueen mutuamente.
+- Cada cambio recibe un número de versión global creciente; cada producto recuerda la
+  versión de su último cambio; `epoch` identifica la instancia (las versiones reinician con
+  el proceso). Los listeners se notifican fuera de los locks.
+- `snapshot()` copia las columnas sin tomar los locks de stock: las lecturas masivas no
+  bloquean a los escritores (cada stock leído es un valor ya confirmado).
+"""
+
+import os
+import secrets
+import threading
+from array import array
+from contextlib import ExitStack
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class UnknownProduct(KeyError):
+    """El producto no existe en el inventario."""
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id: int, available: int, requested: int):
+        super().__init__(f"Stock insuficiente para {product_id}: disponible {available}, pedido {requested}")
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+
+
+class InventoryChange(NamedTuple):
+    kind: str  # 'stock' | 'upsert' | 'remove'
+    product_id: int
+    previous_stock: Optional[int]
+    stock: Optional[int]
+    version: int
+
+
+Listener = Callable[[InventoryChange], None]
+
+
+class InventoryEngine:
+    def __init__(self, products: Iterable[dict] = (), stripes: int = 64):
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._struct_lock = threading.RLock()  # altas, bajas y snapshots
+        self._version_lock = threading.Lock()
+        self._version = 0
+        # Las versiones reinician con el proceso: la época distingue un arranque de otro
+        self.epoch = secrets.token_hex(4)
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._ids = array('q')
+        self._stock = array('q')
+        self._price = array('d')
+        self._versions = array('q')
+        self._names: List[Optional[str]] = []
+        self._listeners: List[Listener] = []
+        for product in products:
+            self.upsert(product['id'], product['name'], product['price'], product['stock'])
+
+    # ===== INTERNOS =====
+
+    def _lock_for(self, product_id: int) -> threading.Lock:
+        return self._stripes[hash(product_id) % len(self._stripes)]
+
+    def _slot(self, product_id: int) -> int:
+        slot = self._slots.get(product_id)
+        if slot is None:
+            raise UnknownProduct(product_id)
+        return slot
+
+    def _next_version(self) -> int:
+        with self._version_lock:
+            self._version += 1
+            return self._version
+
+    def _notify(self, change: InventoryChange) -> None:
+        for listener in self._listeners:
+            try:
+                listener(change)
+            except Exception:
+                pass  # un listener defectuoso no debe romper la venta
+
+    def _record(self, slot: int) -> dict:
+        return {
+            "id": self._ids[slot],
+            "name": self._names[slot],
+            "price": self._price[slot],
+            "stock": self._stock[slot],
+        }
+
+    # ===== ALTAS / BAJAS =====
+
+    def upsert(self, product_id: int, name: str, price: float, stock: int) -> dict:
+        """Crea o reemplaza un producto completo."""
+        with self._struct_lock, self._lock_for(product_id):
+            slot = self._slots.get(product_id)
+            previous = None
+            if slot is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    slot = len(self._ids)
+                    self._ids.append(0)
+                    self._stock.append(0)
+                    self._price.append(0.0)
+                    self._versions.append(0)
+                    self._names.append(None)
+            else:
+                previous = self._stock[slot]
+            version = self._next_version()
+            self._ids[slot] = product_id
+            self._names[slot] = name
+            self._price[slot] = price
+            self._stock[slot] = stock
+            self._versions[slot] = version
+            self._slots[product_id] = slot
+            record = self._record(slot)
+        self._notify(InventoryChange('upsert', product_id, previous, stock, version))
+        return record
+
+    def add(self, product_id: int, name: str, price: float, stock: int) -> dict:
+        """Como `upsert`, pero falla con ValueError si el producto ya existe."""
+        with self._struct_lock:
+            if product_id in self._slots:
+                raise ValueError(f"ID de producto {product_id} ya existe")
+            return self.upsert(product_id, name, price, stock)
+
+    def update(self, product_id: int, name: str, price: float, stock: int) -> dict:
+        """Como `upsert`, pero falla con UnknownProduct si el producto no existe."""
+        with self._struct_lock:
+            if product_id not in self._slots:
+                raise UnknownProduct(product_id)
+            return self.upsert(product_id, name, price, stock)
+
+    def upsert_many(self, products: Iterable[dict]) -> int:
+        """Aplica un lote de altas/cambios en bloque; omite los que no cambian. Retorna aplicados."""
+        applied = 0
+        with self._struct_lock:
+            for product in products:
+                current = self.get(product['id'])
+                if current is not None and all(current[key] == product[key] for key in ('name', 'price', 'stock')):
+                    continue
+                self.upsert(product['id'], product['name'], product['price'], product['stock'])
+                applied += 1
+        return applied
+
+    def remove(self, product_id: int) -> dict:
+        with self._struct_lock, self._lock_for(product_id):
+            slot = self._slot(product_id)
+            record = self._record(slot)
+            del self._slots[product_id]
+            self._names[slot] = None
+            self._free.append(slot)
+            version = self._next_version()
+        self._notify(InventoryChange('remove', product_id, record["stock"], None, version))
+        return record
+
+    # ===== STOCK (ATÓMICO POR PRODUCTO) =====
+
+    def reserve(self, product_id: int, quantity: int) -> int:
+        """Descuenta `quantity` solo si alcanza el stock; retorna el stock restante."""
+        with self._lock_for(product_id):
+            slot = self._slot(product_id)
+            available = self._stock[slot]
+            if available < quantity:
+                raise InsufficientStock(product_id, available, quantity)
+            remaining = available - quantity
+            self._stock[slot] = remaining
+            version = self._versions[slot] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, available, remaining, version))
+        return remaining
+
+    def release(self, product_id: int, quantity: int) -> int:
+        """Devuelve stock reservado (p. ej. si la venta no se pudo registrar)."""
+        with self._lock_for(product_id):
+            slot = self._slot(product_id)
+            previous = self._stock[slot]
+            stock = self._stock[slot] = previous + quantity
+            version = self._versions[slot] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, previous, stock, version))
+        return stock
+
+    def decrement_clamped(self, product_id: int, quantity: int) -> Tuple[int, int]:
+        """Descuenta sin bajar de 0 (ventas ya ocurridas en una sucursal); retorna (antes, después)."""
+        with self._lock_for(product_id):
+            slot = self._slot(product_id)
+            previous = self._stock[slot]
+            stock = self._stock[slot] = max(0, previous - quantity)
+            version = self._versions[slot] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, previous, stock, version))
+        return previous, stock
+
+    def decrement_many(self, items: Sequence[Tuple[int, int]]) -> List[Optional[Tuple[int, int]]]:
+        """`decrement_clamped` de un lote (product_id, cantidad) en un solo paso atómico.
+
+        Retorna (antes, después) por ítem, o None si el producto no existe.
+        """
+        results: List[Optional[Tuple[int, int]]] = []
+        changes: List[InventoryChange] = []
+        with ExitStack() as stack:
+            for index in sorted({hash(product_id) % len(self._stripes) for product_id, _ in items}):
+                stack.enter_context(self._stripes[index])
+            for product_id, quantity in items:
+                slot = self._slots.get(product_id)
+                if slot is None:
+                    results.append(None)
+                    continue
+                previous = self._stock[slot]
+                stock = self._stock[slot] = max(0, previous - quantity)
+                version = self._versions[slot] = self._next_version()
+                results.append((previous, stock))
+                changes.append(InventoryChange('stock', product_id, previous, stock, version))
+        for change in changes:
+            self._notify(change)
+        return results
+
+    def compare_and_set(self, product_id: int, expected: int, stock: int) -> bool:
+        with self._lock_for(product_id):
+            slot = self._slot(product_id)
+            if self._stock[slot] != expected:
+                return False
+            self._stock[slot] = stock
+            version = self._versions[slot] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, expected, stock, version))
+        return True
+
+    def set_stock(self, product_id: int, stock: int) -> int:
+        with self._lock_for(product_id):
+            slot = self._slot(product_id)
+            previous = self._stock[slot]
+            self._stock[slot] = stock
+            version = self._versions[slot] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, previous, stock, version))
+        return stock
+
+    # ===== LECTURA =====
+
+    def get(self, product_id: int) -> Optional[dict]:
+        slot = self._slots.get(product_id)
+        if slot is None:
+            return None
+        record = self._record(slot)
+        # El slot pudo reciclarse entre la búsqueda y la lectura
+        return record if record["id"] == product_id else None
+
+    def stock(self, product_id: int) -> int:
+        return self._stock[self._slot(product_id)]
+
+    def product_version(self, product_id: int) -> int:
+        return self._versions[self._slot(product_id)]
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self) -> List[dict]:
+        """Copia consistente de todos los productos ordenados por id, sin bloquear ventas."""
+        with self._struct_lock:
+            slots = sorted(self._slots.items())
+            ids, names = self._ids[:], self._names[:]
+            stock, price = self._stock[:], self._price[:]
+        return [
+            {"id": ids[slot], "name": names[slot], "price": price[slot], "stock": stock[slot]}
+            for _, slot in slots
+        ]
+
+    def changes_since(self, version: int) -> Tuple[int, List[dict]]:
+        """Productos cambiados después de `version`; retorna (versión de corte, registros).
+
+        La versión de corte es el `since` de la próxima consulta: ningún cambio queda fuera
+        (alguno puede repetirse; volver a aplicarlo es idempotente). Las bajas no se informan.
+        """
+        cutoff = self._version
+        # Barrera: toda operación con versión <= cutoff ya terminó de escribir su slot
+        for lock in self._stripes:
+            with lock:
+                pass
+        with self._struct_lock:
+            slots = sorted(self._slots.items())
+            ids, names = self._ids[:], self._names[:]
+            stock, price, versions = self._stock[:], self._price[:], self._versions[:]
+        return cutoff, [
+            {"id": ids[slot], "name": names[slot], "price": price[slot], "stock": stock[slot]}
+            for _, slot in slots if versions[slot] > version
+        ]
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # ===== LISTENERS =====
+
+    def add_listener(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        self._listeners.remove(listener)
+
+
+def build_inventory(products: Iterable[dict] = (), name: str = 'ecomarket_inventory'):
+    """Construye el inventario según variables de entorno.
+
+    INVENTORY_BACKEND=memory (por proceso) | shm (memoria compartida entre workers, ver
+    shm_inventory.py), INVENTORY_SHM_NAME, INVENTORY_SHM_CAPACITY
+    """
+    backend = os.environ.get('INVENTORY_BACKEND', 'memory')
+    if backend == 'memory':
+        return InventoryEngine(products)
+    if backend == 'shm':
+        from shm_inventory import SharedMemoryInventory
+        return SharedMemoryInventory(
+            os.environ.get('INVENTORY_SHM_NAME', name),
+            products,
+            capacity=int(os.environ.get('INVENTORY_SHM_CAPACITY', '1024'))
+        )
+    raise ValueError(f"INVENTORY_BACKEND desconocido: {backend}")
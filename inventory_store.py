@@ -0,0 +1,147 @@
+"""inventory_store.py
+Persistencia del inventario central con write-behind.
+
+- InventoryStore: tabla `products` en SQLite (modo WAL); es el snapshot durable que se
+  carga al iniciar (SQLite reproduce su propio WAL al abrir el archivo).
+- WriteBehind: escucha los cambios del `InventoryEngine` y los escribe en lotes desde un
+  hilo propio. Los cambios del mismo producto se colapsan: mil ventas seguidas de un
+  producto entre dos flush son una sola fila escrita. Las lecturas nunca tocan el disco.
+
+Durabilidad: lo cambiado en la ventana de `interval` (por defecto 200 ms) antes de una
+caída se pierde; un apagado normal (`stop`) vacía la cola antes de salir.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                price REAL NOT NULL,
+                stock INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+
+    def load(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, name, price, stock FROM products ORDER BY id").fetchall()
+        return [{"id": row[0], "name": row[1], "price": row[2], "stock": row[3]} for row in rows]
+
+    def write(self, upserts: List[Dict], deletes: List[int]) -> None:
+        """Aplica un lote de altas/cambios y bajas en una sola transacción."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """INSERT INTO products (id, name, price, stock, updated_at) VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(id) DO UPDATE SET
+                           name = excluded.name, price = excluded.price,
+                           stock = excluded.stock, updated_at = excluded.updated_at""",
+                    [(p["id"], p["name"], p["price"], p["stock"], now) for p in upserts]
+                )
+                self._conn.executemany("DELETE FROM products WHERE id = ?", [(pid,) for pid in deletes])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehind:
+    def __init__(self, engine, store: InventoryStore, interval: float = 0.2):
+        self.engine = engine
+        self.store = store
+        self.interval = interval
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_error: Optional[str] = None
+        engine.add_listener(self._on_change)
+
+    def _on_change(self, change) -> None:
+        with self._lock:
+            self._dirty.add(change.product_id)
+        self._pending.set()
+
+    def flush(self) -> int:
+        """Escribe el estado actual de los productos modificados; retorna filas escritas."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._pending.clear()
+        if not dirty:
+            return 0
+        upserts, deletes = [], []
+        for product_id in dirty:
+            record = self.engine.get(product_id)
+            if record is None:
+                deletes.append(product_id)
+            else:
+                upserts.append(record)
+        try:
+            self.store.write(upserts, deletes)
+        except Exception as e:
+            # Devolver los ids a la cola para el próximo intento
+            with self._lock:
+                self._dirty |= dirty
+            self._pending.set()
+            self.last_error = repr(e)
+            raise
+        self.flushes += 1
+        self.rows_written += len(dirty)
+        return len(dirty)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._pending.wait()
+            # Ventana de coalescencia: juntar más cambios antes de escribir
+            self._stopping.wait(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Write-behind de inventario: {e}")
+                self._stopping.wait(min(5.0, self.interval * 10))
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='inventory-write-behind', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._pending.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "dirty_products": len(self._dirty),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "last_error": self.last_error,
+        }
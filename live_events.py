@@ -0,0 +1,180 @@
+"""live_events.py
+Eventos en vivo para los dashboards (Server-Sent Events).
+
+- EventBroadcaster: un solo difusor por proceso. Cada evento se serializa UNA vez y el
+  mismo frame se reparte a las colas de todos los clientes conectados; publicar desde
+  cualquier hilo es seguro. Sin clientes conectados, publicar no cuesta nada.
+- Reconexión: el navegador reenvía `Last-Event-ID` (`<proceso>.<n>`); si los eventos
+  perdidos siguen en el historial se reenvían, si no (o si el servidor se reinició) se
+  envía `reset` y el dashboard recarga su estado completo. Un cliente lento (cola llena)
+  también recibe `reset` en lugar de acumular memoria.
+- InventoryFeed: publica los cambios del inventario como eventos `inventory`. Con el
+  motor en memoria usa sus listeners; con el inventario compartido entre workers
+  (INVENTORY_BACKEND=shm) consulta `changes_since` periódicamente, porque los cambios
+  hechos por otros workers no disparan listeners en este proceso.
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+import threading
+from collections import deque
+from typing import AsyncIterator, Deque, Optional, Set, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+Frame = Tuple[int, bytes]
+
+_RESET: Frame = (0, b"event: reset\ndata: {}\n\n")
+_PING = b": ping\n\n"
+
+
+class EventBroadcaster:
+    def __init__(self, history: int = 512, client_queue: int = 256, heartbeat: float = 15.0):
+        self.client_queue = client_queue
+        self.heartbeat = heartbeat
+        self._history: Deque[Frame] = deque(maxlen=history)
+        self._clients: Set[asyncio.Queue] = set()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._next_id = 1
+        # Los ids reinician con el proceso: el prefijo distingue un arranque de otro
+        self._token = secrets.token_hex(4)
+        self.published = 0
+        self.resets = 0
+
+    def start(self) -> None:
+        """Llamar desde el lifespan: fija el event loop que atiende a los clientes."""
+        self._loop = asyncio.get_running_loop()
+
+    @property
+    def has_clients(self) -> bool:
+        return bool(self._clients)
+
+    def publish(self, event: str, data) -> None:
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            if not self._clients:
+                # Nadie escucha: el historial dejaría huecos, un reconectado recibirá `reset`
+                self._history.clear()
+                return
+            frame = (event_id, f"id: {self._token}.{event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode())
+            self._history.append(frame)
+        self.published += 1
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._fan_out, frame)
+
+    def _fan_out(self, frame: Frame) -> None:
+        for queue in list(self._clients):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # Cliente lento: descartar lo pendiente y pedirle que recargue
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_RESET)
+                self.resets += 1
+
+    def _replay(self, last_event_id: Optional[str]) -> Tuple[list, int]:
+        """Frames a reenviar tras una reconexión y el último id ya cubierto."""
+        with self._lock:
+            newest = self._next_id - 1
+            history = list(self._history)
+        if last_event_id is None:
+            return [], newest
+        token, _, number = last_event_id.partition('.')
+        if token != self._token or not number.isdigit():
+            return [_RESET], newest
+        last = int(number)
+        if last >= newest:
+            return [], newest
+        if history and history[0][0] <= last + 1:
+            return [frame for frame in history if frame[0] > last], newest
+        return [_RESET], newest
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.client_queue)
+        replay, sent = self._replay(last_event_id)
+        self._clients.add(queue)
+        try:
+            yield b"retry: 3000\n\n"
+            for _, frame in replay:
+                yield frame
+            while True:
+                try:
+                    event_id, frame = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield _PING
+                    continue
+                if event_id and event_id <= sent:
+                    continue  # ya incluido en el reenvío inicial
+                yield frame
+        finally:
+            self._clients.discard(queue)
+
+    def response(self, request: Request) -> StreamingResponse:
+        return StreamingResponse(
+            self.stream(request.headers.get("last-event-id")),
+            media_type="text/event-stream",
+            # Sin buffering en nginx: cada evento sale en cuanto se publica
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    def stats(self) -> dict:
+        return {"clients": len(self._clients), "published": self.published, "resets": self.resets}
+
+
+class InventoryFeed:
+    def __init__(self, engine, broadcaster: EventBroadcaster, poll_interval: Optional[float] = None):
+        self.engine = engine
+        self.broadcaster = broadcaster
+        self.poll_interval = poll_interval
+        self._cursor = engine.version
+        self._task: Optional[asyncio.Task] = None
+        if poll_interval is None:
+            engine.add_listener(self._on_change)
+
+    def _on_change(self, change) -> None:
+        if not self.broadcaster.has_clients:
+            return
+        if change.kind == 'remove':
+            self.broadcaster.publish('inventory', {"op": "remove", "id": change.product_id, "version": change.version})
+            return
+        record = self.engine.get(change.product_id)
+        if record is not None:
+            self.broadcaster.publish('inventory', {"op": "upsert", "product": record, "version": change.version})
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self.engine.version == self._cursor:
+                continue
+            if not self.broadcaster.has_clients:
+                self._cursor = self.engine.version
+                continue
+            try:
+                self._cursor, changes = self.engine.changes_since(self._cursor)
+            except Exception as e:
+                logger.error(f"❌ Feed de inventario: {e}")
+                continue
+            for record in changes:
+                self.broadcaster.publish('inventory', {"op": "upsert", "product": record, "version": self._cursor})
+
+    def start(self) -> None:
+        if self.poll_interval is not None and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -4,10 +4,10 @@ Consumer simple que activa lealtad al recibir UsuarioCreado.
 Uso: python loyalty_consumer_simple.py
 """
 import os
-import json
 import logging
 from events import get_connection_params, republish_to_retry_queue, publish_to_dead_letters
-import pika
+from consumer_base import BatchingConsumer, per_message
+import codec
 
 logging.basicConfig(level=logging.INFO)
 
@@ -20,12 +20,12 @@ else:
     RETRY_DELAYS_MS = [5000, 30000, 120000]
 
 
-def process_user_created_loyalty(ch, method, props, body):
+def process_user_created_loyalty(ch, delivery) -> bool:
+    props = delivery.properties
     try:
-        message = json.loads(body)
+        message = codec.decode(delivery.body, props.content_type)
     except Exception:
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
+        return False
 
     if message.get('event_type') == 'UsuarioCreado' or 'user_id' in message:
         user_id = message.get('user_id') or message.get('id')
@@ -38,31 +38,26 @@ def process_user_created_loyalty(ch, method, props, body):
 
             logging.info(f"🎁 Activando lealtad para {user_id}")
             # Lógica de activación aquí
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return True
         except Exception as e:
             logging.error('Error activando lealtad: %s', e)
             headers = props.headers or {}
             retries = int(headers.get('x-retries', 0))
             if retries >= MAX_RETRIES:
                 logging.warning('Retries excedidos para mensaje; enviando a dead_letters')
-                publish_to_dead_letters(message, headers=headers)
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+                publish_to_dead_letters(message, headers=headers, channel=ch)
+                return True
             else:
                 new_headers = dict(headers)
                 new_headers['x-retries'] = retries + 1
                 delay = RETRY_DELAYS_MS[min(retries, len(RETRY_DELAYS_MS)-1)]
-                republish_to_retry_queue('loyalty_queue', message, headers=new_headers, delay_ms=delay)
+                republish_to_retry_queue('loyalty_queue', message, headers=new_headers, delay_ms=delay, channel=ch)
                 logging.info('Re-publicado a retry-queue (delay %d ms) retries=%d', delay, retries+1)
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-    else:
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return True
+    return False
 
 
-def start_loyalty_consumer():
-    params = get_connection_params()
-    conn = pika.BlockingConnection(params)
-    ch = conn.channel()
-
+def setup_loyalty_queue(ch):
     ch.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
 
     args = {
@@ -71,11 +66,15 @@ def start_loyalty_consumer():
     ch.queue_declare(queue='loyalty_queue', durable=True, arguments=args)
     ch.queue_bind(exchange='user_events', queue='loyalty_queue')
 
-    ch.basic_qos(prefetch_count=1)
-    ch.basic_consume(queue='loyalty_queue', on_message_callback=process_user_created_loyalty)
 
-    logging.info('🎧 Loyalty consumer esperando en queue loyalty_queue...')
-    ch.start_consuming()
+def start_loyalty_consumer():
+    BatchingConsumer.from_env(
+        get_connection_params(),
+        'loyalty_queue',
+        per_message(process_user_created_loyalty),
+        setup=setup_loyalty_queue,
+        name='Loyalty consumer'
+    ).run()
 
 
 if __name__ == '__main__':
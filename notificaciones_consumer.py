@@ -6,12 +6,15 @@ Funcionalidades mínimas:
 - Declara cola durable 'notificaciones_user_queue' ligada al exchange
 - Valida campos básicos (id, nombre, email)
 - Usa DLQ para mensajes inválidos
+- Micro-batching opcional de acks (CONSUMER_BATCH_SIZE / CONSUMER_BATCH_WAIT_MS)
 """
 import pika
-import json
 import logging
 import re
 
+from consumer_base import BatchingConsumer, per_message
+import codec
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -39,32 +42,26 @@ def validar_evento(evt: dict) -> bool:
     return True
 
 
-def on_message(ch, method, properties, body):
+def on_message(ch, delivery) -> bool:
     try:
-        evt = json.loads(body)
+        evt = codec.decode(delivery.body, delivery.properties.content_type)
     except Exception as e:
-        logger.error("JSON inválido: %s", e)
+        logger.error("Payload inválido: %s", e)
         # mensaje corrupto -> no requeue -> direct to DLQ (via queue args)
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
+        return False
 
     if not validar_evento(evt):
         logger.error("Evento inválido recibido: %s", evt)
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
+        return False
 
     # Simular envío de correo
     logger.info("[NOTIFICACIONES] Enviando email de bienvenida a %s <%s>", evt['nombre'], evt['email'])
     print(f"[EMAIL SIMULADO] Hola {evt['nombre']} <{evt['email']}> — ¡Bienvenido a EcoMarket!")
 
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+    return True
 
 
-def main():
-    params = get_connection_params()
-    connection = pika.BlockingConnection(params)
-    channel = connection.channel()
-
+def setup_queues(channel):
     # Exchange fanout
     channel.exchange_declare(exchange='user_events', exchange_type='fanout', durable=True)
 
@@ -81,17 +78,16 @@ def main():
     channel.queue_declare(queue='notificaciones_user_dlq', durable=True)
 
     channel.queue_bind(exchange='user_events', queue='notificaciones_user_queue')
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue='notificaciones_user_queue', on_message_callback=on_message)
 
-    logger.info("Esperando mensajes en 'notificaciones_user_queue' (CTRL+C para salir)")
-    try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        logger.info("Cerrando consumidor de notificaciones...")
-        channel.stop_consuming()
-    finally:
-        connection.close()
+
+def main():
+    BatchingConsumer.from_env(
+        get_connection_params(),
+        'notificaciones_user_queue',
+        per_message(on_message),
+        setup=setup_queues,
+        name='Notificaciones consumer'
+    ).run()
 
 
 if __name__ == '__main__':
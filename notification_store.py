@@ -0,0 +1,436 @@
+"""notification_store.py
+Almacén acotado e indexado para las notificaciones de venta del central.
+
+- Ventana caliente en un ring buffer de capacidad fija con columnas compactas
+  (`array` para números, listas para textos); memoria constante.
+- Las filas que salen de la ventana se vuelcan a un archivo NDJSON (archivo histórico);
+  al cerrar se vuelca también la ventana, así que no se pierde nada en un reinicio limpio.
+- La secuencia continúa tras un reinicio: se siembra con la última del archivo, y los
+  cursores no chocan con los de la ejecución anterior.
+- Índices por `branch_id` y `product_id` (secuencias en orden de llegada) y un máximo
+  acumulado de timestamps para ubicar `since=` con búsqueda binaria.
+- Paginación por cursor: el cursor es el número de secuencia de la última fila devuelta.
+  Los cursores anteriores a la ventana se leen del archivo, con un índice disperso
+  (secuencia, offset, máximo de timestamp) cada `ARCHIVE_INDEX_EVERY` filas.
+- Exportación (`export`): archivo histórico + ventana caliente como generador de filas,
+  con memoria constante.
+"""
+
+import json
+import logging
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_INDEX_EVERY = 256    # filas del archivo entre entradas del índice disperso
+ARCHIVE_SCAN_LIMIT = 50000   # filas del archivo revisadas como máximo por página
+
+
+class _SeqIndex:
+    """Lista de secuencias ascendentes con cabeza móvil (desalojo O(1) amortizado)."""
+
+    __slots__ = ('seqs', 'head')
+
+    def __init__(self):
+        self.seqs = array('q')
+        self.head = 0
+
+    def append(self, seq: int) -> None:
+        self.seqs.append(seq)
+
+    def evict(self, seq: int) -> None:
+        if self.head < len(self.seqs) and self.seqs[self.head] == seq:
+            self.head += 1
+            if self.head > 1024 and self.head * 2 > len(self.seqs):
+                del self.seqs[:self.head]
+                self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.head
+
+    def iter_from(self, start_seq: int) -> Iterator[int]:
+        seqs = self.seqs
+        for i in range(bisect_left(seqs, start_seq, self.head), len(seqs)):
+            yield seqs[i]
+
+
+def _epoch(ts: datetime) -> float:
+    return ts.timestamp()
+
+
+def _row_epoch(row: dict) -> float:
+    return _epoch(datetime.fromisoformat(row['timestamp']))
+
+
+def _row_matches(row: dict, since_ts: Optional[float], until_ts: Optional[float],
+                 branch: Optional[str], product: Optional[int]) -> bool:
+    """Filtros sobre una fila leída del archivo histórico."""
+    if branch is not None and row['branch_id'] != branch:
+        return False
+    if product is not None and row['product_id'] != product:
+        return False
+    if since_ts is None and until_ts is None:
+        return True
+    ts = _row_epoch(row)
+    return (since_ts is None or ts >= since_ts) and (until_ts is None or ts <= until_ts)
+
+
+class SaleNotificationStore:
+    def __init__(self, capacity: int = 10000, archive_path: Optional[str] = None):
+        self.capacity = capacity
+        self.archive_path = archive_path
+        self._lock = threading.RLock()
+        self._first = 0  # secuencia más antigua en la ventana
+        self._next = 0   # próxima secuencia a asignar
+        # Columnas del ring buffer (posición = seq % capacity)
+        self._branch: List[Optional[str]] = [None] * capacity
+        self._iso: List[Optional[str]] = [None] * capacity
+        self._product = array('q', bytes(8 * capacity))
+        self._quantity = array('q', bytes(8 * capacity))
+        self._price = array('d', bytes(8 * capacity))
+        self._ts = array('d', bytes(8 * capacity))
+        self._ts_max = array('d', bytes(8 * capacity))
+        self._by_branch: Dict[str, _SeqIndex] = {}
+        self._by_product: Dict[int, _SeqIndex] = {}
+        self._archive = None  # se abre al primer desalojo
+        self.archived = 0
+        # Índice disperso del archivo histórico: una entrada cada ARCHIVE_INDEX_EVERY filas
+        # con la primera secuencia del bloque, su offset y el máximo de timestamp anterior
+        self._arch_seq = array('q')
+        self._arch_off = array('q')
+        self._arch_ts = array('d')
+        self._arch_rows = 0
+        self._arch_size = 0
+        self._arch_ts_max = float('-inf')
+        self._load_archive()
+
+    # ===== ARCHIVO HISTÓRICO =====
+
+    def _index_archived(self, seq: int, ts: float, size: int) -> None:
+        if self._arch_rows % ARCHIVE_INDEX_EVERY == 0:
+            self._arch_seq.append(seq)
+            self._arch_off.append(self._arch_size)
+            self._arch_ts.append(self._arch_ts_max)
+        self._arch_rows += 1
+        self._arch_size += size
+        self._arch_ts_max = max(self._arch_ts_max, ts)
+
+    def _load_archive(self) -> None:
+        """Indexa el archivo existente y siembra la secuencia con la última archivada.
+
+        Una línea cortada al final (caída a mitad de escritura) se descarta. Un archivo de
+        versiones anteriores, donde la secuencia volvía a 0 en cada arranque, se renumera
+        una vez para que las secuencias del archivo sean crecientes.
+        """
+        if not self.archive_path or not os.path.exists(self.archive_path):
+            return
+        last = -1
+        renumber = False
+        with open(self.archive_path, 'rb') as archive:
+            for line in archive:
+                if not line.endswith(b"\n"):
+                    break
+                row = json.loads(line)
+                if row['seq'] <= last:
+                    renumber = True
+                    break
+                self._index_archived(row['seq'], _row_epoch(row), len(line))
+                last = row['seq']
+        if renumber:
+            last = self._renumber_archive()
+        elif self._arch_size < os.path.getsize(self.archive_path):
+            os.truncate(self.archive_path, self._arch_size)
+        self._first = self._next = last + 1
+
+    def _renumber_archive(self) -> int:
+        """Reescribe el archivo con secuencias 0..n-1 y rehace el índice; retorna la última."""
+        self._arch_seq, self._arch_off, self._arch_ts = array('q'), array('q'), array('d')
+        self._arch_rows, self._arch_size, self._arch_ts_max = 0, 0, float('-inf')
+        tmp_path = self.archive_path + ".tmp"
+        with open(self.archive_path, 'rb') as source, open(tmp_path, 'wb') as target:
+            for line in source:
+                if not line.endswith(b"\n"):
+                    break
+                row = json.loads(line)
+                row['seq'] = self._arch_rows
+                data = (json.dumps(row) + "\n").encode()
+                target.write(data)
+                self._index_archived(row['seq'], _row_epoch(row), len(data))
+        os.replace(tmp_path, self.archive_path)
+        logger.warning(f"🗄️ Archivo histórico renumerado: {self._arch_rows} filas")
+        return self._arch_rows - 1
+
+    # ===== ESCRITURA =====
+
+    def append(self, notification: BaseModel) -> int:
+        """Agrega una notificación (SaleNotification) y retorna su número de secuencia."""
+        data = notification.model_dump(mode='json')
+        ts = _epoch(notification.timestamp)
+        with self._lock:
+            if self._next - self._first == self.capacity:
+                self._evict_oldest()
+            seq = self._next
+            pos = seq % self.capacity
+            branch = data['branch_id']
+            self._branch[pos] = branch
+            self._iso[pos] = data['timestamp']
+            self._product[pos] = data['product_id']
+            self._quantity[pos] = data['quantity_sold']
+            self._price[pos] = data['sale_price']
+            self._ts[pos] = ts
+            prev_max = self._ts_max[(seq - 1) % self.capacity] if seq > self._first else ts
+            self._ts_max[pos] = max(prev_max, ts)
+            self._by_branch.setdefault(branch, _SeqIndex()).append(seq)
+            self._by_product.setdefault(data['product_id'], _SeqIndex()).append(seq)
+            self._next += 1
+            return seq
+
+    def extend(self, notifications: List[BaseModel]) -> None:
+        with self._lock:
+            for notification in notifications:
+                self.append(notification)
+
+    def _evict_oldest(self) -> None:
+        seq = self._first
+        row = self._row(seq)
+        if self.archive_path:
+            if self._archive is None:
+                self._archive = open(self.archive_path, 'ab')
+            data = (json.dumps(row) + "\n").encode()
+            self._archive.write(data)
+            self._archive.flush()
+            self._index_archived(seq, self._ts[seq % self.capacity], len(data))
+            self.archived += 1
+        branch_index = self._by_branch[row['branch_id']]
+        branch_index.evict(seq)
+        if not branch_index:
+            del self._by_branch[row['branch_id']]
+        product_index = self._by_product[row['product_id']]
+        product_index.evict(seq)
+        if not product_index:
+            del self._by_product[row['product_id']]
+        self._first += 1
+
+    # ===== LECTURA =====
+
+    def _row(self, seq: int) -> dict:
+        pos = seq % self.capacity
+        return {
+            "seq": seq,
+            "branch_id": self._branch[pos],
+            "product_id": self._product[pos],
+            "quantity_sold": self._quantity[pos],
+            "timestamp": self._iso[pos],
+            "sale_price": self._price[pos],
+        }
+
+    def _seq_since(self, since: float) -> int:
+        """Primera secuencia cuyo máximo acumulado de timestamp alcanza `since`."""
+        lo, hi = self._first, self._next
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts_max[mid % self.capacity] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, cursor: Optional[int] = None, limit: int = 100,
+              since: Optional[datetime] = None, until: Optional[datetime] = None,
+              branch: Optional[str] = None, product: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        """Filas en orden de llegada que cumplen los filtros, más el cursor siguiente (o None).
+
+        Sin cursor, o con un cursor anterior a la ventana, se empieza por el archivo
+        histórico. Si una página revisa `ARCHIVE_SCAN_LIMIT` filas del archivo sin llenarse,
+        se corta ahí y el cursor siguiente apunta a la última fila revisada.
+        """
+        since_ts = _epoch(since) if since is not None else None
+        until_ts = _epoch(until) if until is not None else None
+        rows: List[dict] = []
+        with self._lock:
+            from_archive = (self._arch_rows > 0 and (cursor is None or cursor + 1 < self._first)
+                            and (since_ts is None or since_ts <= self._arch_ts_max))
+        if from_archive:
+            rows, cursor, exhausted = self._query_archive(cursor, limit, since_ts, until_ts, branch, product)
+            if not exhausted:
+                return rows, cursor
+        with self._lock:
+            if cursor is not None and cursor + 1 < self._first:
+                # La ventana avanzó mientras se leía el archivo: la siguiente página sigue ahí
+                return rows, cursor
+            start = self._first
+            if cursor is not None:
+                start = max(start, cursor + 1)
+            if since_ts is not None:
+                start = max(start, self._seq_since(since_ts))
+
+            candidates: Iterator[int]
+            indexes = []
+            if branch is not None:
+                indexes.append(self._by_branch.get(branch))
+            if product is not None:
+                indexes.append(self._by_product.get(product))
+            if indexes:
+                if any(index is None for index in indexes):
+                    return rows, None
+                candidates = min(indexes, key=len).iter_from(start)
+            else:
+                candidates = iter(range(start, self._next))
+
+            for seq in candidates:
+                pos = seq % self.capacity
+                if branch is not None and self._branch[pos] != branch:
+                    continue
+                if product is not None and self._product[pos] != product:
+                    continue
+                ts = self._ts[pos]
+                if since_ts is not None and ts < since_ts:
+                    continue
+                if until_ts is not None and ts > until_ts:
+                    continue
+                rows.append(self._row(seq))
+                if len(rows) == limit:
+                    return rows, seq
+            return rows, None
+
+    def _query_archive(self, cursor: Optional[int], limit: int,
+                       since_ts: Optional[float], until_ts: Optional[float],
+                       branch: Optional[str], product: Optional[int]) -> Tuple[List[dict], int, bool]:
+        """Página del archivo histórico: (filas, última secuencia revisada, archivo agotado)."""
+        with self._lock:
+            end = self._first  # todo lo anterior ya está escrito en el archivo
+            start = self._arch_seq[0] if cursor is None else cursor + 1
+            block = max(bisect_right(self._arch_seq, start) - 1, 0)
+            if since_ts is not None:
+                # Último bloque cuyo máximo anterior no alcanza `since`
+                block = max(block, bisect_left(self._arch_ts, since_ts) - 1)
+            offset = self._arch_off[block]
+
+        rows: List[dict] = []
+        last = start - 1
+        scanned = 0
+        with open(self.archive_path, 'rb') as archive:
+            archive.seek(offset)
+            for line in archive:
+                row = json.loads(line)
+                seq = row['seq']
+                if seq < start:
+                    continue
+                if seq >= end:
+                    break
+                last = seq
+                scanned += 1
+                if _row_matches(row, since_ts, until_ts, branch, product):
+                    rows.append(row)
+                    if len(rows) == limit:
+                        return rows, seq, False
+                if scanned == ARCHIVE_SCAN_LIMIT:
+                    return rows, seq, False
+        return rows, max(last, end - 1), True
+
+    def _matches(self, seq: int, since_ts: Optional[float], until_ts: Optional[float],
+                 branch: Optional[str], product: Optional[int]) -> bool:
+        pos = seq % self.capacity
+        return ((branch is None or self._branch[pos] == branch)
+                and (product is None or self._product[pos] == product)
+                and (since_ts is None or self._ts[pos] >= since_ts)
+                and (until_ts is None or self._ts[pos] <= until_ts))
+
+    def export(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               branch: Optional[str] = None, product: Optional[int] = None,
+               page: int = 500) -> Iterator[dict]:
+        """Todas las filas que cumplen los filtros: primero el archivo histórico, luego la ventana.
+
+        El archivo se lee línea a línea y la ventana por páginas de `page` filas, soltando el
+        lock entre páginas (las notificaciones siguen entrando). La exportación llega hasta la
+        última fila presente al empezar; las filas que se desalojen mientras tanto sin haber
+        sido leídas se toman del final del archivo, donde acaban de escribirse.
+        """
+        since_ts = _epoch(since) if since is not None else None
+        until_ts = _epoch(until) if until is not None else None
+
+        with self._lock:
+            end = self._next
+            cursor = self._first  # próxima secuencia de la ventana por leer
+            if since_ts is not None:
+                cursor = self._seq_since(since_ts)
+            offset = os.path.getsize(self.archive_path) if self.archive_path and os.path.exists(self.archive_path) else 0
+
+        archive = None
+        try:
+            # 1) Archivo histórico hasta donde llegaba al empezar (incluye ejecuciones anteriores)
+            if offset:
+                archive = open(self.archive_path, 'rb')
+                while archive.tell() < offset:
+                    line = archive.readline()
+                    if not line:
+                        break
+                    row = json.loads(line)
+                    if _row_matches(row, since_ts, until_ts, branch, product):
+                        yield row
+            # 2) Ventana caliente por páginas
+            while cursor < end:
+                with self._lock:
+                    first = self._first
+                    in_window = cursor >= first
+                    if in_window:
+                        stop = min(end, cursor + page)
+                        rows = [self._row(seq) for seq in range(cursor, stop)
+                                if self._matches(seq, since_ts, until_ts, branch, product)]
+                        cursor = stop
+                if in_window:
+                    yield from rows
+                    continue
+                # Desalojadas sin leer: son las líneas siguientes a `offset` en el archivo
+                if archive is None:
+                    archive = open(self.archive_path, 'rb')
+                archive.seek(offset)
+                while cursor < first:
+                    line = archive.readline()
+                    if not line:
+                        break
+                    row = json.loads(line)
+                    if row['seq'] < cursor:
+                        continue
+                    cursor = row['seq'] + 1
+                    if cursor <= end and _row_matches(row, since_ts, until_ts, branch, product):
+                        yield row
+                offset = archive.tell()
+                cursor = max(cursor, first)
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def latest(self, n: int) -> List[dict]:
+        with self._lock:
+            return [self._row(seq) for seq in range(max(self._first, self._next - n), self._next)]
+
+    def __len__(self) -> int:
+        return self._next - self._first
+
+    def stats(self) -> dict:
+        return {
+            "hot_rows": len(self),
+            "capacity": self.capacity,
+            "first_seq": self._first,
+            "next_seq": self._next,
+            "archived_rows": self.archived,
+            "archive_rows": self._arch_rows,
+        }
+
+    def close(self) -> None:
+        """Vuelca la ventana caliente al archivo histórico (sobrevive al reinicio) y lo cierra."""
+        with self._lock:
+            if self.archive_path:
+                while self._first < self._next:
+                    self._evict_oldest()
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
@@ -0,0 +1,284 @@
+"""outbox.py
+Outbox local (write-ahead) para las notificaciones de venta de la sucursal.
+
+La venta se registra en SQLite (modo WAL) en el mismo paso en que se descuenta el stock,
+así que si el proceso muere las notificaciones pendientes siguen en disco. Un drainer
+asíncrono las envía a central en lotes y las marca como entregadas.
+
+Con varios workers (uvicorn --workers N) todos comparten el archivo: cada drainer
+reclama su lote con un lease (`claim_pending`), así dos workers no envían la misma fila.
+
+Si el destino rechaza un lote de forma definitiva (`BatchRejected`, p. ej. HTTP 4xx), el
+drainer reenvía sus filas de a una para aislar la rechazada; una fila rechazada con
+`attempts` >= `max_attempts` pasa a estado dead (`dead_at`) y deja de bloquear el resto.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRejected(Exception):
+    """El destino rechazó el lote de forma definitiva: reenviarlo igual no sirve."""
+
+
+class SaleOutbox:
+    """Tabla append-only de notificaciones pendientes/entregadas."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                delivered_at REAL,
+                claimed_until REAL,
+                dead_at REAL
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for column in ("claimed_until", "dead_at"):
+            if column not in columns:
+                try:
+                    self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} REAL")
+                except sqlite3.OperationalError:
+                    pass  # otro worker ya migró la tabla
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(id) WHERE delivered_at IS NULL"
+        )
+
+    def append(self, notification: Dict) -> str:
+        """Persiste la notificación y retorna su message_id (clave de idempotencia)."""
+        message_id = notification.setdefault("message_id", str(uuid.uuid4()))
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (message_id, payload, created_at) VALUES (?, ?, ?)",
+                (message_id, json.dumps(notification), time.time())
+            )
+        return message_id
+
+    def fetch_pending(self, limit: int) -> List[Tuple[int, Dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM outbox WHERE delivered_at IS NULL AND dead_at IS NULL ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def claim_pending(self, limit: int, lease_seconds: float = 30.0) -> List[Tuple[int, Dict]]:
+        """Reclama hasta `limit` pendientes sin lease vigente (atómico entre procesos)."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """UPDATE outbox SET claimed_until = ?
+                   WHERE id IN (
+                       SELECT id FROM outbox
+                       WHERE delivered_at IS NULL AND dead_at IS NULL
+                         AND (claimed_until IS NULL OR claimed_until < ?)
+                       ORDER BY id LIMIT ?
+                   )
+                   RETURNING id, payload""",
+                (now + lease_seconds, now, limit)
+            ).fetchall()
+        rows.sort()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def mark_delivered(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET delivered_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now, row_id) for row_id in ids]
+            )
+
+    def mark_failed(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, claimed_until = NULL WHERE id = ?",
+                [(row_id,) for row_id in ids]
+            )
+
+    def mark_rejected(self, ids: List[int], max_attempts: int) -> int:
+        """Rechazo definitivo: suma el intento y pasa a dead las que llegan a `max_attempts`.
+
+        Retorna cuántas quedaron en dead; el resto vuelve a pendiente.
+        """
+        if not ids:
+            return 0
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                """UPDATE outbox SET attempts = attempts + 1, claimed_until = NULL,
+                       dead_at = CASE WHEN attempts + 1 >= ? THEN ? END
+                   WHERE id = ?""",
+                [(max_attempts, now, row_id) for row_id in ids]
+            )
+            placeholders = ",".join("?" * len(ids))
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM outbox WHERE dead_at IS NOT NULL AND id IN ({placeholders})", ids
+            ).fetchone()[0]
+
+    def purge_delivered(self, older_than_seconds: float) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE delivered_at IS NOT NULL AND delivered_at < ?",
+                (time.time() - older_than_seconds,)
+            )
+        return cur.rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE delivered_at IS NULL AND dead_at IS NULL"
+            ).fetchone()
+            delivered = self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE delivered_at IS NOT NULL"
+            ).fetchone()[0]
+            dead = self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE dead_at IS NOT NULL"
+            ).fetchone()[0]
+        return {
+            "pending": pending,
+            "delivered_retained": delivered,
+            "dead": dead,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# send_batch recibe las notificaciones en orden y retorna cuántas (desde el inicio) se entregaron;
+# lanza BatchRejected si el destino rechaza el lote de forma definitiva
+BatchSender = Callable[[List[Dict]], Awaitable[int]]
+
+
+class OutboxDrainer:
+    """Tarea asíncrona que vacía el outbox en lotes de hasta `batch_size` notificaciones."""
+
+    def __init__(self, outbox: SaleOutbox, send_batch: BatchSender, batch_size: int = 100,
+                 interval: float = 0.5, max_backoff: float = 30.0,
+                 retention_seconds: float = 3600.0, max_attempts: int = 3):
+        self.outbox = outbox
+        self._send_batch = send_batch
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.retention_seconds = retention_seconds
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.batches_sent = 0
+        self.delivered = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=5.0)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+            self._task = None
+
+    def wake(self) -> None:
+        """Avisa que hay notificaciones nuevas (no espera al próximo intervalo)."""
+        self._wakeup.set()
+
+    async def drain_once(self) -> int:
+        """Envía un lote; retorna cuántas notificaciones quedaron entregadas."""
+        pending = self.outbox.claim_pending(self.batch_size)
+        if not pending:
+            return 0
+        ids = [row_id for row_id, _ in pending]
+        try:
+            sent = await self._send_batch([notification for _, notification in pending])
+        except BatchRejected as e:
+            logger.warning(f"🚫 Outbox: lote rechazado por el destino ({e}); reenviando de a una")
+            return await self._isolate_rejected(pending)
+        except Exception as e:
+            logger.error(f"❌ Error enviando lote del outbox: {e}")
+            sent = 0
+        self.outbox.mark_delivered(ids[:sent])
+        self.outbox.mark_failed(ids[sent:])
+        if sent:
+            self.batches_sent += 1
+            self.delivered += sent
+            logger.info(f"📤 Outbox: {sent}/{len(ids)} notificaciones entregadas en un lote")
+        if sent < len(ids):
+            raise RuntimeError(f"lote parcialmente entregado ({sent}/{len(ids)})")
+        return sent
+
+    async def _isolate_rejected(self, pending: List[Tuple[int, Dict]]) -> int:
+        """Reenvía un lote rechazado fila por fila: entrega las válidas y aparta la rechazada."""
+        delivered = 0
+        for position, (row_id, notification) in enumerate(pending):
+            try:
+                sent = await self._send_batch([notification])
+            except BatchRejected as e:
+                dead = self.outbox.mark_rejected([row_id], self.max_attempts)
+                state = "dead" if dead else "se reintentará"
+                logger.error(f"🚫 Outbox: venta {notification.get('message_id')} rechazada ({e}); {state}")
+                continue
+            except Exception as e:
+                logger.error(f"❌ Error enviando venta del outbox: {e}")
+                sent = 0
+            if not sent:
+                self.outbox.mark_failed([rest_id for rest_id, _ in pending[position:]])
+                raise RuntimeError(f"lote parcialmente entregado ({delivered}/{len(pending)})")
+            self.outbox.mark_delivered([row_id])
+            delivered += 1
+        self.delivered += delivered
+        return delivered
+
+    async def _run(self) -> None:
+        backoff = self.interval
+        last_purge = time.monotonic()
+        while True:
+            try:
+                while await self.drain_once() == self.batch_size:
+                    pass  # todavía hay más pendientes: seguir sin esperar
+                backoff = self.interval
+            except Exception as e:
+                logger.warning(f"⚠️ Outbox: reintentando en {backoff:.1f}s ({e})")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                if self._stopping:
+                    return
+                continue
+
+            if time.monotonic() - last_purge > 60:
+                self.outbox.purge_delivered(self.retention_seconds)
+                last_purge = time.monotonic()
+            if self._stopping:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
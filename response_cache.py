@@ -0,0 +1,77 @@
+"""response_cache.py
+Respuestas JSON pre-serializadas por versión del inventario, con ETag / If-None-Match.
+
+Cada representación (p. ej. la lista de productos o la versión "en español") se serializa
+una sola vez por versión del inventario: mientras no haya cambios, todas las consultas
+reciben los mismos bytes, y un cliente que envía el ETag vigente recibe 304 sin que se
+construya ni serialice nada.
+
+El ETag combina la época del inventario (cambia en cada arranque o segmento compartido)
+con su versión, así un ETag viejo nunca coincide con un estado distinto.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+import codec
+
+Representation = Callable[[List[dict]], Any]
+
+
+class _Entry(NamedTuple):
+    version: int
+    etag: str
+    body: bytes
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate == etag or candidate == f"W/{etag}":
+            return True
+    return False
+
+
+class VersionedResponseCache:
+    def __init__(self, inventory, representations: Dict[str, Representation]):
+        self.inventory = inventory
+        self.representations = representations
+        self._entries: Dict[str, _Entry] = {}
+        self.hits = 0
+        self.not_modified = 0
+        self.builds = 0
+
+    def _entry(self, name: str) -> _Entry:
+        # Leer la versión ANTES del snapshot: si cambia entre medio, la próxima consulta reconstruye
+        version = self.inventory.version
+        entry = self._entries.get(name)
+        if entry is not None and entry.version == version:
+            self.hits += 1
+            return entry
+        body, _ = codec.encode(self.representations[name](self.inventory.snapshot()))
+        entry = _Entry(version, f'"{self.inventory.epoch}-{version}-{name}"', body)
+        self._entries[name] = entry
+        self.builds += 1
+        return entry
+
+    def response(self, name: str, request: Request) -> Response:
+        entry = self._entry(name)
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "not_modified": self.not_modified, "builds": self.builds}
+
+
+def inventario_rows(products: List[dict]) -> List[dict]:
+    """Representación "en español" del inventario (endpoints /inventario)."""
+    return [
+        {"id": p["id"], "nombre": p["name"], "precio": p["price"], "stock": p["stock"]}
+        for p in products
+    ]
@@ -0,0 +1,207 @@
+"""retry_engine.py
+Motor de reintentos asíncrono para notificaciones HTTP.
+
+- Backoff exponencial con jitter completo (nunca `time.sleep` dentro del event loop).
+- Presupuesto de reintentos (token bucket): los reintentos no pueden superar una fracción
+  de las peticiones originales, evitando tormentas de reintentos cuando central cae.
+- Circuit breaker por endpoint: tras varias fallas seguidas se deja de llamar durante
+  `reset_timeout` segundos y luego se deja pasar una sola prueba (half-open).
+- Un único `httpx.AsyncClient` compartido con keep-alive.
+"""
+
+import asyncio
+import itertools
+import random
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class RequestRejected(Exception):
+    """El servidor rechazó la petición con un 4xx no reintentable: repetirla no sirve."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"rechazada con HTTP {status_code}")
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    multiplier: float = 2.0
+    max_delay: float = 30.0
+
+    def delay_for(self, attempt: int) -> float:
+        """Espera antes del intento `attempt + 1` (jitter completo sobre el backoff)."""
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+class RetryBudget:
+    """Token bucket: cada petición original deposita `ratio` tokens y cada reintento consume 1."""
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self.rejected = 0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.rejected += 1
+        return False
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("🔌 Circuit breaker ABIERTO tras %d fallas", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class AsyncRetryScheduler:
+    """POST con reintentos no bloqueantes sobre un cliente HTTP compartido."""
+
+    def __init__(self, timeout: float = 5.0, budget: Optional[RetryBudget] = None,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self._timeout = timeout
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self.budget = budget or RetryBudget()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._ids = itertools.count(1)
+        # job_id -> instante (monotonic) del primer intento, solo para trabajos en reintento
+        self._retrying: Dict[int, float] = {}
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # Uso fuera del lifespan (scripts/tests): crear el cliente perezosamente
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+        return self._client
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        endpoint = httpx.URL(url).copy_with(query=None)
+        key = str(endpoint)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(self._failure_threshold, self._reset_timeout)
+        return breaker
+
+    async def post(self, url: str, payload: Any, policy: RetryPolicy, label: str = "HTTP") -> bool:
+        """Envía `payload` como JSON; retorna True si algún intento obtuvo 2xx.
+
+        Lanza RequestRejected si la respuesta es un 4xx no reintentable (todo salvo 429).
+        """
+        job_id = next(self._ids)
+        started = time.monotonic()
+        breaker = self.breaker_for(url)
+        self.budget.deposit()
+        try:
+            for attempt in range(1, policy.max_attempts + 1):
+                retriable = True
+                if not breaker.allow():
+                    logger.warning(f"⚠️ {label} intento {attempt}: circuito abierto para {url}")
+                else:
+                    try:
+                        response = await self.client.post(url, json=payload)
+                        if 200 <= response.status_code < 300:
+                            breaker.record_success()
+                            logger.info(f"✅ Notificación enviada por {label} (intento {attempt})")
+                            return True
+                        logger.warning(f"⚠️ Error {label} intento {attempt}: {response.status_code}")
+                        retriable = response.status_code >= 500 or response.status_code == 429
+                        if retriable:
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                            raise RequestRejected(response.status_code)
+                    except httpx.HTTPError as e:
+                        breaker.record_failure()
+                        logger.error(f"❌ Error {label} intento {attempt}: {e!r}")
+
+                if not retriable or attempt == policy.max_attempts:
+                    break
+                if not self.budget.withdraw():
+                    logger.warning(f"⚠️ {label}: presupuesto de reintentos agotado, se descarta")
+                    break
+                self._retrying.setdefault(job_id, started)
+                await asyncio.sleep(policy.delay_for(attempt))
+            return False
+        finally:
+            self._retrying.pop(job_id, None)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        oldest = min(self._retrying.values(), default=None)
+        return {
+            "retries_in_flight": len(self._retrying),
+            "oldest_pending_age_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "retry_budget_rejected": self.budget.rejected,
+            "circuit_breakers": {
+                url: {"state": b.state, "consecutive_failures": b.failures}
+                for url, b in self._breakers.items()
+            },
+        }
@@ -0,0 +1,107 @@
+"""sale_topology.py
+Topología RabbitMQ de las notificaciones de venta, compartida por la sucursal (publisher),
+`consumer.py` y `setup_queues.py`.
+
+- SALE_SHARDS=1 (por defecto): la cola única histórica `sale_notifications`.
+- SALE_SHARDS=N>1: exchange directo `sale_notifications.sharded` y N colas
+  `sale_notifications.shard.{i}`; cada venta va a la shard `product_id % N`, así todas
+  las ventas de un producto pasan por la misma cola (y el mismo consumer) en orden.
+
+Cambiar N remapea productos entre shards: drenar las colas antes de cambiarlo
+(incluida la cola única, con un consumer sin `--shard`).
+"""
+
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SALE_QUEUE = 'sale_notifications'
+SALE_DLQ = 'sale_notifications_dlq'
+SALE_EXCHANGE = 'sale_notifications.sharded'
+
+QUEUE_ARGUMENTS = {
+    'x-message-ttl': 86400000,
+    'x-dead-letter-exchange': '',
+    'x-dead-letter-routing-key': SALE_DLQ
+}
+
+
+def shard_count() -> int:
+    return max(1, int(os.environ.get('SALE_SHARDS', '1')))
+
+
+def shard_queue(shard: int) -> str:
+    return f"{SALE_QUEUE}.shard.{shard}"
+
+
+def consume_queue(shard: Optional[int] = None, shards: Optional[int] = None) -> str:
+    """Cola que consume un proceso: la única si no hay shards, o la de su shard.
+
+    Pedir una shard con SALE_SHARDS=1 es un error de configuración (ValueError): de lo
+    contrario varios consumers "por shard" competirían en silencio por la cola única.
+    """
+    shards = shard_count() if shards is None else shards
+    if shard is None:
+        return SALE_QUEUE
+    if shards == 1:
+        raise ValueError(f"shard {shard} pedida sin sharding (SALE_SHARDS=1); usar --shards N o SALE_SHARDS")
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard {shard} fuera de rango para SALE_SHARDS={shards}")
+    return shard_queue(shard)
+
+
+def shard_for(product_id: Any, shards: int) -> int:
+    try:
+        return int(product_id) % shards
+    except (TypeError, ValueError):
+        return 0  # mensaje inválido: cualquier shard lo rechaza igual
+
+
+def route(product_id: Any, shards: Optional[int] = None) -> Tuple[str, str]:
+    """(exchange, routing_key) para publicar una venta de `product_id`."""
+    shards = shard_count() if shards is None else shards
+    if shards == 1:
+        return '', SALE_QUEUE
+    return SALE_EXCHANGE, str(shard_for(product_id, shards))
+
+
+def split_by_shard(notifications: List[Dict], shards: Optional[int] = None) -> Dict[int, List[Dict]]:
+    """Agrupa un lote por shard conservando el orden relativo dentro de cada grupo."""
+    shards = shard_count() if shards is None else shards
+    groups: Dict[int, List[Dict]] = {}
+    for notification in notifications:
+        groups.setdefault(shard_for(notification.get('product_id'), shards), []).append(notification)
+    return groups
+
+
+def _topology_steps(shards: int) -> List[Tuple[str, Dict[str, Any]]]:
+    steps = [('queue_declare', {'queue': SALE_DLQ, 'durable': True})]
+    if shards == 1:
+        steps.append(('queue_declare', {'queue': SALE_QUEUE, 'durable': True, 'arguments': QUEUE_ARGUMENTS}))
+        return steps
+    steps.append(('exchange_declare', {'exchange': SALE_EXCHANGE, 'exchange_type': 'direct', 'durable': True}))
+    for shard in range(shards):
+        queue = shard_queue(shard)
+        steps.append(('queue_declare', {'queue': queue, 'durable': True, 'arguments': QUEUE_ARGUMENTS}))
+        steps.append(('queue_bind', {'queue': queue, 'exchange': SALE_EXCHANGE, 'routing_key': str(shard)}))
+    return steps
+
+
+def declare_sale_topology(channel, shards: Optional[int] = None) -> None:
+    """Declara DLQ, exchange y colas (todas las shards) en un canal bloqueante."""
+    for method, kwargs in _topology_steps(shard_count() if shards is None else shards):
+        getattr(channel, method)(**kwargs)
+
+
+def declare_sale_topology_async(channel, on_done: Callable[[], None], shards: Optional[int] = None) -> None:
+    """Igual que `declare_sale_topology` para canales asíncronos: encadena los callbacks."""
+    steps = iter(_topology_steps(shard_count() if shards is None else shards))
+
+    def next_step(_frame=None):
+        step = next(steps, None)
+        if step is None:
+            on_done()
+            return
+        method, kwargs = step
+        getattr(channel, method)(callback=next_step, **kwargs)
+
+    next_step()
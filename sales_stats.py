@@ -0,0 +1,106 @@
+"""sales_stats.py
+Estadísticas de ventas incrementales para la sucursal.
+
+Los agregados (conteo, ingresos, promedio, mínimo y máximo) se actualizan en cada venta,
+así que consultar las estadísticas cuesta O(1) sin importar el tamaño del historial.
+También mantiene acumulados por producto y por intervalos de minuto/hora/día con una
+retención acotada. Los intervalos empiezan en los límites de la hora local (un "día" va
+de medianoche a medianoche local, como los timestamps de las ventas).
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class _Aggregate:
+    __slots__ = ('count', 'units', 'revenue', 'min_sale', 'max_sale')
+
+    def __init__(self):
+        self.count = 0
+        self.units = 0
+        self.revenue = 0.0
+        self.min_sale: Optional[float] = None
+        self.max_sale: Optional[float] = None
+
+    def add(self, quantity: int, amount: float) -> None:
+        self.count += 1
+        self.units += quantity
+        self.revenue += amount
+        if self.min_sale is None or amount < self.min_sale:
+            self.min_sale = amount
+        if self.max_sale is None or amount > self.max_sale:
+            self.max_sale = amount
+
+    def as_dict(self) -> dict:
+        return {
+            "total_sales": self.count,
+            "total_units": self.units,
+            "total_revenue": round(self.revenue, 2),
+            "average_sale": round(self.revenue / self.count, 2) if self.count else 0,
+            "min_sale": round(self.min_sale, 2) if self.min_sale is not None else 0,
+            "max_sale": round(self.max_sale, 2) if self.max_sale is not None else 0,
+        }
+
+
+# Campos que se llevan a 0 para obtener el inicio del intervalo (en hora local)
+RESOLUTIONS = {
+    "minute": {"second": 0, "microsecond": 0},
+    "hour": {"minute": 0, "second": 0, "microsecond": 0},
+    "day": {"hour": 0, "minute": 0, "second": 0, "microsecond": 0},
+}
+
+
+class SalesStats:
+    def __init__(self, retention: Optional[Dict[str, int]] = None):
+        # Cantidad de intervalos conservados por resolución (24h de minutos, 30 días de horas, 1 año de días)
+        self.retention = retention or {"minute": 1440, "hour": 720, "day": 365}
+        self.total = _Aggregate()
+        self._products: Dict[int, _Aggregate] = {}
+        self._product_names: Dict[int, str] = {}
+        self._buckets: Dict[str, "OrderedDict[int, _Aggregate]"] = {
+            resolution: OrderedDict() for resolution in RESOLUTIONS
+        }
+
+    def record(self, product_id: int, product_name: str, quantity: int, amount: float,
+               timestamp: datetime) -> None:
+        self.total.add(quantity, amount)
+        product = self._products.get(product_id)
+        if product is None:
+            product = self._products[product_id] = _Aggregate()
+        product.add(quantity, amount)
+        self._product_names[product_id] = product_name
+
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        for resolution, truncate in RESOLUTIONS.items():
+            buckets = self._buckets[resolution]
+            start = int(timestamp.replace(**truncate).timestamp())
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = _Aggregate()
+                while len(buckets) > self.retention[resolution]:
+                    buckets.popitem(last=False)
+            bucket.add(quantity, amount)
+
+    def summary(self) -> dict:
+        return self.total.as_dict()
+
+    def by_product(self) -> List[dict]:
+        return [
+            {"product_id": product_id, "product_name": self._product_names.get(product_id), **agg.as_dict()}
+            for product_id, agg in sorted(self._products.items())
+        ]
+
+    def timeseries(self, resolution: str = "minute", limit: int = 60) -> List[dict]:
+        """Últimos `limit` intervalos con ventas, en orden cronológico."""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Resolución no soportada: {resolution}")
+        buckets = self._buckets[resolution]
+        points = []
+        for start in reversed(buckets):
+            if len(points) == limit:
+                break
+            points.append({"bucket_start": datetime.fromtimestamp(start), **buckets[start].as_dict()})
+        points.reverse()
+        return points
@@ -0,0 +1,237 @@
+"""
+amqp_standin.py
+Broker AMQP 0-9-1 mínimo, en proceso, para correr benchmarks locales sin RabbitMQ.
+
+Habla el protocolo real (frames de `pika.frame` / `pika.spec`), así que los publishers del
+proyecto (PooledPublisher, ConfirmedPublisher, pika.BlockingConnection) funcionan sin
+cambios: handshake, canales, declaraciones (siempre aceptadas), publisher confirms
+(un basic.ack por mensaje) y basic.publish. Los mensajes se cuentan por
+(exchange, routing_key) y se descartan: no hay colas ni consumidores, así que mide el
+costo del lado de los clientes, no la semántica de RabbitMQ.
+Uso: python scripts/amqp_standin.py --port 5673
+"""
+import argparse
+import asyncio
+import threading
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+
+from pika import frame, spec
+
+SERVER_PROPERTIES = {
+    "product": "ecomarket-amqp-standin",
+    "capabilities": {
+        "publisher_confirms": True,
+        "basic.nack": True,
+        "consumer_cancel_notify": True,
+        "exchange_exchange_bindings": True,
+        "connection.blocked": True,
+        "authentication_failure_close": True,
+        "per_consumer_qos": True,
+    },
+}
+
+
+def _reply(method) -> Optional[object]:
+    """Respuesta a un método síncrono (None si no requiere respuesta)."""
+    if getattr(method, 'nowait', False):
+        return None
+    if isinstance(method, spec.Channel.Flow):
+        return spec.Channel.FlowOk(method.active)
+    if isinstance(method, spec.Exchange.Declare):
+        return spec.Exchange.DeclareOk()
+    if isinstance(method, spec.Exchange.Delete):
+        return spec.Exchange.DeleteOk()
+    if isinstance(method, spec.Exchange.Bind):
+        return spec.Exchange.BindOk()
+    if isinstance(method, spec.Exchange.Unbind):
+        return spec.Exchange.UnbindOk()
+    if isinstance(method, spec.Queue.Declare):
+        return spec.Queue.DeclareOk(method.queue or f"amq.gen-{uuid.uuid4().hex}", 0, 0)
+    if isinstance(method, spec.Queue.Bind):
+        return spec.Queue.BindOk()
+    if isinstance(method, spec.Queue.Unbind):
+        return spec.Queue.UnbindOk()
+    if isinstance(method, spec.Queue.Purge):
+        return spec.Queue.PurgeOk(0)
+    if isinstance(method, spec.Queue.Delete):
+        return spec.Queue.DeleteOk(0)
+    if isinstance(method, spec.Basic.Qos):
+        return spec.Basic.QosOk()
+    if isinstance(method, spec.Confirm.Select):
+        return spec.Confirm.SelectOk()
+    return None
+
+
+class _Channel:
+    __slots__ = ('confirm', 'delivery_tag', 'publish', 'body_size', 'received')
+
+    def __init__(self):
+        self.confirm = False
+        self.delivery_tag = 0
+        self.publish: Optional[spec.Basic.Publish] = None
+        self.body_size = 0
+        self.received = 0
+
+
+class AmqpStandIn:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.published = 0
+        self.connections = 0
+        self.by_route: Counter = Counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ===== PROTOCOLO =====
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        buffer = bytearray()
+        channels: Dict[int, _Channel] = {}
+        out = []
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                buffer += data
+                while True:
+                    consumed, received = frame.decode_frame(buffer)
+                    if not consumed:
+                        break
+                    del buffer[:consumed]
+                    if not self._on_frame(received, channels, out):
+                        writer.write(b"".join(out))
+                        await writer.drain()
+                        return
+                if out:
+                    writer.write(b"".join(out))
+                    out.clear()
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _on_frame(self, received, channels: Dict[int, _Channel], out: list) -> bool:
+        """Procesa un frame y agrega las respuestas a `out`; False cierra la conexión."""
+        if isinstance(received, frame.ProtocolHeader):
+            out.append(frame.Method(0, spec.Connection.Start(server_properties=SERVER_PROPERTIES)).marshal())
+            return True
+        if isinstance(received, frame.Heartbeat):
+            out.append(frame.Heartbeat().marshal())
+            return True
+        number = received.channel_number
+        if isinstance(received, frame.Header):
+            channel = channels[number]
+            channel.body_size, channel.received = received.body_size, 0
+            if channel.body_size == 0:
+                self._published(number, channel, out)
+            return True
+        if isinstance(received, frame.Body):
+            channel = channels[number]
+            channel.received += len(received.fragment)
+            if channel.received >= channel.body_size:
+                self._published(number, channel, out)
+            return True
+
+        method = received.method
+        if isinstance(method, spec.Connection.StartOk):
+            out.append(frame.Method(0, spec.Connection.Tune(channel_max=2047, frame_max=131072, heartbeat=0)).marshal())
+        elif isinstance(method, spec.Connection.Open):
+            out.append(frame.Method(0, spec.Connection.OpenOk()).marshal())
+        elif isinstance(method, spec.Connection.Close):
+            out.append(frame.Method(0, spec.Connection.CloseOk()).marshal())
+            return False
+        elif isinstance(method, spec.Connection.CloseOk):
+            return False
+        elif isinstance(method, spec.Channel.Open):
+            channels[number] = _Channel()
+            out.append(frame.Method(number, spec.Channel.OpenOk()).marshal())
+        elif isinstance(method, spec.Channel.Close):
+            channels.pop(number, None)
+            out.append(frame.Method(number, spec.Channel.CloseOk()).marshal())
+        elif isinstance(method, spec.Basic.Publish):
+            channels[number].publish = method
+        elif isinstance(method, (spec.Basic.Ack, spec.Basic.Nack, spec.Basic.Reject, spec.Connection.TuneOk)):
+            pass
+        else:
+            if isinstance(method, spec.Confirm.Select):
+                channels[number].confirm = True
+            reply = _reply(method)
+            if reply is None and not getattr(method, 'nowait', False):
+                out.append(frame.Method(0, spec.Connection.Close(540, f"NOT_IMPLEMENTED - {method.NAME}")).marshal())
+                return False
+            if reply is not None:
+                out.append(frame.Method(number, reply).marshal())
+        return True
+
+    def _published(self, number: int, channel: _Channel, out: list) -> None:
+        self.published += 1
+        self.by_route[(channel.publish.exchange, channel.publish.routing_key)] += 1
+        channel.publish = None
+        if channel.confirm:
+            channel.delivery_tag += 1
+            out.append(frame.Method(number, spec.Basic.Ack(channel.delivery_tag)).marshal())
+
+    # ===== CICLO DE VIDA =====
+
+    async def serve(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def start(self) -> int:
+        """Arranca el broker en un hilo propio; retorna el puerto."""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='amqp-standin', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "published": self.published,
+            "by_route": {f"{exchange or '(default)'}/{routing_key}": n
+                         for (exchange, routing_key), n in self.by_route.items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5673)
+    args = parser.parse_args()
+
+    async def run():
+        broker = AmqpStandIn(args.host, args.port)
+        await broker.serve()
+        print(f"🐇 Broker stand-in escuchando en {args.host}:{broker.port} (Ctrl+C para salir)")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
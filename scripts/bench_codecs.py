@@ -0,0 +1,66 @@
+"""
+bench_codecs.py
+Compara tamaño y costo de encode/decode de los codecs de `codec.py` con payloads
+típicos (UsuarioCreado, una venta y un lote del outbox de 100 ventas).
+Uso: python scripts/bench_codecs.py --iterations 50000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+
+
+def sample_sale(product_id: int) -> dict:
+    return {
+        "branch_id": "sucursal-001",
+        "product_id": product_id,
+        "quantity_sold": 2,
+        "timestamp": datetime.now().isoformat(),
+        "sale_price": 12.5,
+        "message_id": str(uuid.uuid4()),
+    }
+
+
+PAYLOADS = {
+    "usuario": {"id": str(uuid.uuid4()), "nombre": "Ana Pérez", "email": "ana@example.com",
+                "created_at": datetime.utcnow().isoformat(), "event_type": "UsuarioCreado"},
+    "venta": sample_sale(3),
+    "lote_100": {"message_id": str(uuid.uuid4()), "notifications": [sample_sale(i % 5 + 1) for i in range(100)]},
+}
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    names = [name for name in ('json', 'orjson', 'msgpack', 'sale-struct') if name in codec._CODECS]
+    print(f"{'payload':<10} {'codec':<12} {'bytes':>7} {'encode (µs)':>12} {'decode (µs)':>12}")
+    for payload_name, payload in PAYLOADS.items():
+        iterations = max(1, args.iterations // (50 if payload_name == 'lote_100' else 1))
+        for name in names:
+            c = codec.get_codec(name)
+            try:
+                body = c.encode(payload)
+            except codec.CodecError:
+                continue  # p. ej. sale-struct con un evento de usuario
+            encode_us = per_call_us(lambda: c.encode(payload), iterations)
+            decode_us = per_call_us(lambda: codec.decode(body, c.content_type), iterations)
+            print(f"{payload_name:<10} {name:<12} {len(body):>7} {encode_us:>12.2f} {decode_us:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,536 @@
+"""
+bench_topology.py
+Generador de carga y benchmark de la topología EcoMarket: POST /sales (sucursal),
+POST /users (users_service, directo o detrás de nginx) y publicación AMQP cruda.
+
+- Lazo cerrado (por defecto): `--concurrency` clientes, cada uno envía la siguiente
+  petición al recibir la respuesta anterior.
+- Lazo abierto (`--rate R`): llegadas a R/s (Poisson o uniformes) sin esperar respuestas;
+  la latencia se mide desde la llegada programada, así que incluye la espera cuando el
+  sistema se atrasa. `--concurrency` limita las peticiones en vuelo.
+- Reporta por escenario throughput y latencias p50/p95/p99, y durante el escenario de
+  ventas la latencia extremo a extremo venta -> stock actualizado en el central (sondas
+  sobre un producto reservado, medidas con el evento `inventory` de GET /events del central).
+- `--target local` (por defecto): levanta central, sucursal y users_service en este mismo
+  proceso (uvicorn en hilos, puertos libres, archivos en un directorio temporal) y un broker
+  AMQP stand-in (amqp_standin.py); no hace falta Docker ni RabbitMQ. La sucursal notifica
+  al central por HTTP. `--target remote`: usa las URLs indicadas y RABBIT_* del entorno.
+- Guarda el resultado en artifacts/bench_topology_<fecha>.json; `--baseline <json>`
+  compara contra una corrida anterior (p. ej. la de la versión previa).
+Uso: python scripts/bench_topology.py --duration 10 --concurrency 32
+     python scripts/bench_topology.py --scenario sales --rate 300 --duration 20
+     python scripts/bench_topology.py --target remote --users-url http://localhost:80 --scenario users
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+import pika  # noqa: E402
+
+from amqp_standin import AmqpStandIn  # noqa: E402
+
+SCENARIOS = ('sales', 'users', 'amqp')
+
+Sender = Callable[[int], Awaitable[None]]
+
+
+class RequestFailed(Exception):
+    def __init__(self, kind: str):
+        super().__init__(kind)
+        self.kind = kind
+
+
+# ===== MEDICIÓN =====
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies: List[float]) -> dict:
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+    return {
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+        "mean_ms": ms(sum(ordered) / len(ordered) if ordered else None),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors: Counter = Counter()
+        self.started = time.perf_counter()
+        self.finished = self.started
+
+    async def timed(self, send: Sender, index: int, scheduled: float) -> None:
+        try:
+            await send(index)
+        except RequestFailed as e:
+            self.errors[e.kind] += 1
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+        else:
+            self.latencies.append(time.perf_counter() - scheduled)
+        self.finished = time.perf_counter()
+
+    def report(self) -> dict:
+        elapsed = max(self.finished - self.started, 1e-9)
+        ok = len(self.latencies)
+        return {
+            "requests": ok + sum(self.errors.values()),
+            "ok": ok,
+            "errors": dict(self.errors),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(ok / elapsed, 1),
+            **summarize(self.latencies),
+        }
+
+
+async def run_closed(send: Sender, concurrency: int, duration: float, requests: Optional[int]) -> dict:
+    recorder = Recorder()
+    deadline = recorder.started + duration
+    counter = iter(range(requests if requests else sys.maxsize))
+
+    async def client():
+        for index in counter:
+            if not requests and time.perf_counter() >= deadline:
+                return
+            await recorder.timed(send, index, time.perf_counter())
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return recorder.report()
+
+
+async def run_open(send: Sender, rate: float, concurrency: int, duration: float,
+                   requests: Optional[int], arrivals: str) -> dict:
+    recorder = Recorder()
+    in_flight = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def arrival(index: int, scheduled: float):
+        async with in_flight:
+            await recorder.timed(send, index, scheduled)
+
+    scheduled, index = recorder.started, 0
+    while (index < requests) if requests else (scheduled < recorder.started + duration):
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.ensure_future(arrival(index, scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        index += 1
+        scheduled += random.expovariate(rate) if arrivals == 'poisson' else 1 / rate
+    await asyncio.gather(*tasks)
+    report = recorder.report()
+    report["offered_rps"] = rate
+    return report
+
+
+# ===== ESCENARIOS =====
+
+def http_sender(client: httpx.AsyncClient, url: str, payload: Callable[[int], dict]) -> Sender:
+    async def send(index: int) -> None:
+        response = await client.post(url, json=payload(index))
+        if response.status_code >= 400:
+            raise RequestFailed(f"http_{response.status_code}")
+    return send
+
+
+class AmqpSender:
+    """Publicación cruda con pika.BlockingConnection: una conexión por hilo del pool."""
+
+    def __init__(self, params: pika.ConnectionParameters, queue: str, confirm: bool, threads: int):
+        self.params = params
+        self.queue = queue
+        self.confirm = confirm
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='bench-amqp')
+        self._local = threading.local()
+        self._connections: List[pika.BlockingConnection] = []
+        self._lock = threading.Lock()
+
+    def _channel(self):
+        channel = getattr(self._local, 'channel', None)
+        if channel is None or not channel.is_open:
+            connection = pika.BlockingConnection(self.params)
+            channel = connection.channel()
+            # Cola propia del benchmark, acotada: no alimenta a los consumers reales
+            channel.queue_declare(self.queue, arguments={'x-max-length': 10000})
+            if self.confirm:
+                channel.confirm_delivery()
+            with self._lock:
+                self._connections.append(connection)
+            self._local.channel = channel
+        return channel
+
+    def _publish(self, body: bytes) -> None:
+        self._channel().basic_publish('', self.queue, body, pika.BasicProperties(content_type='application/json'))
+
+    async def __call__(self, index: int) -> None:
+        body = json.dumps({
+            "branch_id": "bench", "product_id": index % 5 + 1, "quantity_sold": 1,
+            "timestamp": datetime.now().isoformat(), "sale_price": 1.0, "message_id": str(uuid.uuid4()),
+        }).encode()
+        await asyncio.get_running_loop().run_in_executor(self.pool, self._publish, body)
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+        for connection in self._connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+# ===== EXTREMO A EXTREMO =====
+
+class CentralStockWatcher:
+    """Escucha GET /events del central y avisa cada cambio de stock de un producto."""
+
+    def __init__(self, client: httpx.AsyncClient, central_url: str, product_id: int):
+        self.client = client
+        self.url = f"{central_url}/events"
+        self.product_id = product_id
+        self.changes: asyncio.Queue = asyncio.Queue()
+        self.connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _listen(self) -> None:
+        async with self.client.stream('GET', self.url, timeout=None) as response:
+            response.raise_for_status()
+            self.connected.set()
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:') and event == 'inventory':
+                    data = json.loads(line[5:])
+                    product = data.get("product") or {}
+                    if data.get("op") == "upsert" and product.get("id") == self.product_id:
+                        self.changes.put_nowait(time.perf_counter())
+                elif not line:
+                    event = None
+
+    async def start(self, timeout: float = 5.0) -> None:
+        self._task = asyncio.ensure_future(self._listen())
+        done, _ = await asyncio.wait({self._task, asyncio.ensure_future(self.connected.wait())},
+                                     timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if self._task in done:
+            self._task.result()  # propaga el error de conexión
+        if not self.connected.is_set():
+            raise TimeoutError(f"Sin conexión a {self.url}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+async def probe_sale_to_central(client: httpx.AsyncClient, branch_url: str, watcher: CentralStockWatcher,
+                                interval: float, timeout: float, stop: asyncio.Event) -> dict:
+    """Ventas de sonda mientras dura la carga: POST /sales -> evento de stock en el central."""
+    latencies, errors = [], Counter()
+    while not stop.is_set():
+        while not watcher.changes.empty():
+            watcher.changes.get_nowait()
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"{branch_url}/sales",
+                                         json={"product_id": watcher.product_id, "quantity": 1})
+            if response.status_code >= 400:
+                raise RequestFailed(f"http_{response.status_code}")
+            changed_at = await asyncio.wait_for(watcher.changes.get(), timeout)
+            latencies.append(changed_at - started)
+        except RequestFailed as e:
+            errors[e.kind] += 1
+        except asyncio.TimeoutError:
+            errors["timeout"] += 1
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+    return {"probes": len(latencies) + sum(errors.values()), "ok": len(latencies),
+            "errors": dict(errors), **summarize(latencies)}
+
+
+# ===== TOPOLOGÍA LOCAL =====
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class _ServerThread:
+    def __init__(self, app, port: int, name: str):
+        import uvicorn
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(
+            app, host='127.0.0.1', port=port, log_level='warning', access_log=False,
+            timeout_graceful_shutdown=2
+        ))
+        self.server.install_signal_handlers = lambda: None
+        self.thread = threading.Thread(target=self.server.run, name=name, daemon=True)
+
+    def start(self) -> str:
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError(f"{self.thread.name} no arrancó")
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{self.port}"
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(10)
+
+
+class LocalTopology:
+    """Central + sucursal + users_service en hilos de este proceso, con el broker stand-in."""
+
+    def __init__(self, app_log_level: str):
+        self.app_log_level = app_log_level
+        self.broker = AmqpStandIn()
+        self.servers: List[_ServerThread] = []
+        self.workdir = tempfile.mkdtemp(prefix='bench_topology_')
+
+    def start(self) -> Dict[str, str]:
+        broker_port = self.broker.start()
+        central_port, branch_port, users_port = _free_port(), _free_port(), _free_port()
+        central_url = f"http://127.0.0.1:{central_port}"
+        branch_url = f"http://127.0.0.1:{branch_port}"
+        # Configuración por entorno ANTES de importar las apps (se lee al importar)
+        os.environ.update({
+            "RABBIT_HOST": "127.0.0.1",
+            "RABBIT_PORT": str(broker_port),
+            "CENTRAL_DB_PATH": os.path.join(self.workdir, "central_inventory.db"),
+            "NOTIFICATIONS_ARCHIVE": os.path.join(self.workdir, "sale_notifications_archive.ndjson"),
+            "BRANCH_URLS": f"sucursal-001={branch_url}",
+            "BRANCH_ID": "sucursal-001",
+            "CENTRAL_API_URL": central_url,
+            "BRANCH_PUBLIC_URL": branch_url,
+            "OUTBOX_PATH": os.path.join(self.workdir, "outbox_sucursal-001.db"),
+        })
+        os.chdir(ROOT)  # templates/ y static/ son relativos
+        import central_api
+        import sucursal_api
+        import users_service
+        logging.getLogger().setLevel(self.app_log_level)
+        for app, port, name in ((central_api.app, central_port, 'central'),
+                                (sucursal_api.app, branch_port, 'sucursal'),
+                                (users_service.app, users_port, 'users')):
+            server = _ServerThread(app, port, name)
+            server.start()
+            self.servers.append(server)
+        return {"central": central_url, "branch": branch_url, "users": f"http://127.0.0.1:{users_port}"}
+
+    def stop(self) -> None:
+        for server in reversed(self.servers):
+            server.stop()
+        self.broker.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# ===== CORRIDA =====
+
+async def prepare_branch(client: httpx.AsyncClient, branch_url: str, products: List[int],
+                         restock: Optional[int], notify_method: Optional[str]) -> None:
+    if notify_method:
+        await client.post(f"{branch_url}/set-method", data={"method": notify_method})
+    if restock:
+        for product_id in products:
+            response = await client.put(f"{branch_url}/products/{product_id}", json={"stock": restock})
+            response.raise_for_status()
+
+
+async def run_scenario(name: str, send: Sender, args) -> dict:
+    if args.rate:
+        return await run_open(send, args.rate, args.concurrency, args.duration, args.requests, args.arrivals)
+    return await run_closed(send, args.concurrency, args.duration, args.requests)
+
+
+async def bench(args, urls: Dict[str, str], amqp_params: pika.ConnectionParameters) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency + 2, max_keepalive_connections=args.concurrency + 2)
+    results: Dict[str, dict] = {}
+    e2e: Optional[dict] = None
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client, \
+            httpx.AsyncClient(timeout=args.timeout) as probe_client:
+        load_products = [p for p in args.products if p != args.probe_product]
+        if 'sales' in args.scenario:
+            await prepare_branch(client, urls["branch"], load_products + [args.probe_product],
+                                 args.restock, args.notify_method)
+
+        for name in args.scenario:
+            print(f"▶️  {name} ({'lazo abierto %s/s' % args.rate if args.rate else 'lazo cerrado'}, "
+                  f"concurrencia {args.concurrency})", flush=True)
+            if name == 'sales':
+                send = http_sender(client, f"{urls['branch']}/sales", lambda i: {
+                    "product_id": load_products[i % len(load_products)], "quantity": 1})
+                watcher = stop = probes = None
+                if args.probe_interval > 0 and urls.get("central"):
+                    watcher = CentralStockWatcher(probe_client, urls["central"], args.probe_product)
+                    try:
+                        await watcher.start()
+                        stop = asyncio.Event()
+                        probes = asyncio.ensure_future(probe_sale_to_central(
+                            probe_client, urls["branch"], watcher, args.probe_interval, args.timeout, stop))
+                    except Exception as e:
+                        print(f"⚠️ Sin medición extremo a extremo: {e!r}")
+                        watcher = None
+                results[name] = await run_scenario(name, send, args)
+                if probes is not None:
+                    stop.set()
+                    e2e = await probes
+                if watcher is not None:
+                    await watcher.stop()
+            elif name == 'users':
+                send = http_sender(client, f"{urls['users']}/users", lambda i: {
+                    "nombre": f"Bench {i}", "email": f"bench{i}@example.com"})
+                results[name] = await run_scenario(name, send, args)
+            elif name == 'amqp':
+                sender = AmqpSender(amqp_params, args.amqp_queue, args.amqp_confirm, args.concurrency)
+                try:
+                    results[name] = await run_scenario(name, sender, args)
+                finally:
+                    sender.close()
+    return {"scenarios": results, "e2e_sale_to_central": e2e}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def print_report(document: dict, baseline: Optional[dict]) -> None:
+    print(f"\n{'escenario':<14} {'ok':>7} {'err':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = dict(document["scenarios"])
+    if document.get("e2e_sale_to_central"):
+        rows["venta→central"] = {**document["e2e_sale_to_central"], "throughput_rps": None}
+    for name, r in rows.items():
+        errors = sum(r["errors"].values())
+        rps = f"{r['throughput_rps']:.1f}" if r["throughput_rps"] is not None else "-"
+        cells = [f"{r[key]:.2f}" if r[key] is not None else "-" for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{name:<14} {r['ok']:>7} {errors:>6} {rps:>9} {cells[0]:>9} {cells[1]:>9} {cells[2]:>9}")
+        if r["errors"]:
+            print(f"{'':<14} errores: {r['errors']}")
+    if baseline:
+        print(f"\nContra {baseline.get('git_commit') or 'baseline'} ({baseline.get('timestamp')}):")
+        for name, r in document["scenarios"].items():
+            before = baseline.get("scenarios", {}).get(name)
+            if not before or not before.get("throughput_rps") or not before.get("p99_ms") or r["p99_ms"] is None:
+                continue
+            print(f"  {name:<8} rps {r['throughput_rps'] / before['throughput_rps'] - 1:+.1%}"
+                  f"   p99 {r['p99_ms'] / before['p99_ms'] - 1:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--target', choices=('local', 'remote'), default='local')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append',
+                        help="repetible; por defecto todos")
+    parser.add_argument('--duration', type=float, default=10.0, help="segundos por escenario")
+    parser.add_argument('--requests', type=int, help="en lugar de --duration: peticiones por escenario")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, help="lazo abierto: llegadas por segundo")
+    parser.add_argument('--arrivals', choices=('poisson', 'uniform'), default='poisson')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--central-url', default='http://localhost:8000')
+    parser.add_argument('--branch-url', default='http://localhost:8001')
+    parser.add_argument('--users-url', default='http://localhost:8002', help="users_service o nginx")
+    parser.add_argument('--products', type=int, nargs='+', default=[1, 2, 3, 4, 5])
+    parser.add_argument('--probe-product', type=int, default=5,
+                        help="producto reservado para las sondas extremo a extremo")
+    parser.add_argument('--probe-interval', type=float, default=0.2, help="0 desactiva las sondas")
+    parser.add_argument('--restock', type=int, help="stock a fijar en la sucursal antes de vender "
+                                                    "(local: 10000000)")
+    parser.add_argument('--notify-method', help="método de notificación de la sucursal (local: http)")
+    parser.add_argument('--amqp-queue', default='bench_topology')
+    parser.add_argument('--no-amqp-confirm', dest='amqp_confirm', action='store_false')
+    parser.add_argument('--app-log-level', default='WARNING', help="logs de las apps en modo local")
+    parser.add_argument('--baseline', help="JSON de una corrida anterior para comparar")
+    parser.add_argument('--output', help="ruta del JSON (por defecto artifacts/bench_topology_<fecha>.json)")
+    args = parser.parse_args()
+    args.scenario = list(dict.fromkeys(args.scenario or SCENARIOS))
+
+    topology = None
+    if args.target == 'local':
+        topology = LocalTopology(args.app_log_level)
+        urls = topology.start()
+        args.restock = args.restock or 10_000_000
+        args.notify_method = args.notify_method or 'http'
+        amqp_params = pika.ConnectionParameters('127.0.0.1', topology.broker.port)
+    else:
+        from amqp_publisher import get_connection_params
+        urls = {"central": args.central_url, "branch": args.branch_url, "users": args.users_url}
+        amqp_params = get_connection_params()
+
+    try:
+        result = asyncio.run(bench(args, urls, amqp_params))
+    finally:
+        if topology is not None:
+            broker_stats = topology.broker.stats()
+            topology.stop()
+
+    document = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": args.target,
+        "urls": urls,
+        "config": {key: value for key, value in vars(args).items() if key not in ('baseline', 'output')},
+        **result,
+    }
+    if topology is not None:
+        document["broker_standin"] = broker_stats
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(document, baseline)
+
+    output = args.output or os.path.join(ROOT, 'artifacts', f"bench_topology_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados en {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,22 @@
 """
 setup_queues.py
-Declaración de exchanges y colas necesarias para la demo: user_events (fanout), dead_letters, email_queue, loyalty_queue, analytics_queue y retry queues.
-Uso: python setup_queues.py
+Declaración de exchanges y colas necesarias para la demo: user_events (fanout), dead_letters, email_queue, loyalty_queue, analytics_queue, retry queues
+y las colas de notificaciones de venta (cola única o N shards, ver sale_topology.py).
+Uso: python setup_queues.py [--sale-shards N]
 """
+import argparse
+
 import pika
 from events import get_connection_params
+import sale_topology
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Declarar exchanges y colas de la demo')
+    parser.add_argument('--sale-shards', type=int, default=sale_topology.shard_count(),
+                        help='Cantidad de shards de sale_notifications (por defecto SALE_SHARDS o 1)')
+    args = parser.parse_args()
+
     params = get_connection_params()
     conn = pika.BlockingConnection(params)
     ch = conn.channel()
@@ -17,10 +26,10 @@ def main():
     ch.exchange_declare(exchange='dead_letters', exchange_type='fanout', durable=True)
 
     # Queues principales con DLX
-    args = {'x-dead-letter-exchange': 'dead_letters'}
-    ch.queue_declare(queue='email_queue', durable=True, arguments=args)
-    ch.queue_declare(queue='loyalty_queue', durable=True, arguments=args)
-    ch.queue_declare(queue='analytics_queue', durable=True, arguments=args)
+    dlx_args = {'x-dead-letter-exchange': 'dead_letters'}
+    ch.queue_declare(queue='email_queue', durable=True, arguments=dlx_args)
+    ch.queue_declare(queue='loyalty_queue', durable=True, arguments=dlx_args)
+    ch.queue_declare(queue='analytics_queue', durable=True, arguments=dlx_args)
 
     # Bind queues al exchange fanout
     ch.queue_bind(exchange='user_events', queue='email_queue')
@@ -31,6 +40,9 @@ def main():
     ch.queue_declare(queue='dead_letter_queue', durable=True)
     ch.queue_bind(exchange='dead_letters', queue='dead_letter_queue')
 
+    # Notificaciones de venta (sucursal -> consumer)
+    sale_topology.declare_sale_topology(ch, args.sale_shards)
+
     print('Queues and exchanges declared')
     conn.close()
 
@@ -0,0 +1,406 @@
+"""shm_inventory.py
+Backend de inventario en memoria compartida para correr una sucursal con
+`uvicorn --workers N`: todos los procesos ven los mismos contadores de stock.
+
+- Un segmento `multiprocessing.shared_memory` con un encabezado y un slot de tamaño fijo
+  por producto (palabras int64: ocupado, id, stock, versión, precio y nombre UTF-8).
+- Exclusión entre procesos con locks de rango sobre un archivo (`fcntl.lockf`, o
+  `msvcrt.locking` en Windows): un byte por franja de productos, más uno para altas/bajas
+  y otro para el contador de versión. Dentro del proceso, un `threading.Lock` por franja.
+- El segmento no se registra en el resource_tracker: que termine un worker no lo borra.
+  Sobrevive mientras la máquina no se reinicie; `unlink()` lo elimina explícitamente.
+- Misma interfaz que `InventoryEngine`; los listeners solo ven los cambios de su proceso.
+  Se elige con INVENTORY_BACKEND=shm (ver `inventory_engine.build_inventory`).
+"""
+
+import os
+import secrets
+import tempfile
+import threading
+from contextlib import ExitStack
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from inventory_engine import InsufficientStock, InventoryChange, Listener, UnknownProduct
+
+if os.name == 'nt':  # pragma: no cover - Windows
+    import msvcrt
+
+    _seek_lock = threading.Lock()
+
+    def _lock_range(fd: int, start: int) -> None:
+        while True:
+            with _seek_lock:
+                os.lseek(fd, start, os.SEEK_SET)
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    pass
+            threading.Event().wait(0.0005)
+
+    def _unlock_range(fd: int, start: int) -> None:
+        with _seek_lock:
+            os.lseek(fd, start, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_range(fd: int, start: int) -> None:
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, start)
+
+    def _unlock_range(fd: int, start: int) -> None:
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, start)
+
+
+class _RangeLock:
+    """Lock entre hilos (threading) y entre procesos (rango de 1 byte del archivo de locks)."""
+
+    __slots__ = ('fd', 'start', 'local')
+
+    def __init__(self, fd: int, start: int):
+        self.fd = fd
+        self.start = start
+        self.local = threading.Lock()
+
+    def __enter__(self):
+        self.local.acquire()
+        try:
+            _lock_range(self.fd, self.start)
+        except BaseException:
+            self.local.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            _unlock_range(self.fd, self.start)
+        finally:
+            self.local.release()
+
+
+# Encabezado (palabras int64): magic, capacidad, versión global, generación de altas/bajas
+# y época (aleatoria por segmento: distingue versiones de segmentos distintos)
+_MAGIC = 0x45434F494E563032  # "ECOINV02"
+_H_MAGIC, _H_CAPACITY, _H_VERSION, _H_GENERATION, _H_EPOCH = range(5)
+_HEADER_WORDS = 5
+# Slot (palabras int64): ocupado, id, stock, versión, precio (float64) y nombre
+_S_USED, _S_ID, _S_STOCK, _S_VERSION, _S_PRICE = range(5)
+_NAME_BYTES = 64
+_SLOT_WORDS = 5 + _NAME_BYTES // 8
+
+# Bytes del archivo de locks
+_LOCK_STRUCT = 0
+_LOCK_VERSION = 1
+_LOCK_STRIPES = 2
+
+
+class SharedMemoryInventory:
+    def __init__(self, name: str, products: Iterable[dict] = (), capacity: int = 1024,
+                 stripes: int = 64, lock_dir: Optional[str] = None):
+        self.name = name
+        lock_path = os.path.join(lock_dir or tempfile.gettempdir(), f"{name}.lock")
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._struct_lock = _RangeLock(self._lock_fd, _LOCK_STRUCT)
+        self._version_lock = _RangeLock(self._lock_fd, _LOCK_VERSION)
+        self._stripes = [_RangeLock(self._lock_fd, _LOCK_STRIPES + i) for i in range(stripes)]
+        self._listeners: List[Listener] = []
+        self._slots: Dict[int, int] = {}
+        self._slots_generation = -1
+
+        size = (_HEADER_WORDS + capacity * _SLOT_WORDS) * 8
+        with self._struct_lock:
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+            # Ningún worker debe borrar el segmento al terminar (ver docstring del módulo)
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+            self._q = self._shm.buf.cast('q')
+            self._d = self._shm.buf.cast('d')
+            if self._q[_H_MAGIC] != _MAGIC:
+                # Primer proceso: inicializar y sembrar el inventario
+                capacity = min(capacity, (len(self._q) - _HEADER_WORDS) // _SLOT_WORDS)
+                self._q[_H_CAPACITY] = capacity
+                self._q[_H_VERSION] = 0
+                self._q[_H_GENERATION] = 0
+                self._q[_H_EPOCH] = secrets.randbits(62)
+                self._q[_H_MAGIC] = _MAGIC
+                self.capacity = capacity
+                for product in products:
+                    self._upsert_locked(product['id'], product['name'], product['price'], product['stock'])
+            self.capacity = self._q[_H_CAPACITY]
+            self.epoch = format(self._q[_H_EPOCH], 'x')
+
+    # ===== INTERNOS =====
+
+    def _base(self, slot: int) -> int:
+        return _HEADER_WORDS + slot * _SLOT_WORDS
+
+    def _lock_for(self, product_id: int) -> _RangeLock:
+        return self._stripes[hash(product_id) % len(self._stripes)]
+
+    def _refresh_slots(self) -> None:
+        q = self._q
+        while True:
+            generation = q[_H_GENERATION]
+            slots = {}
+            for slot in range(self.capacity):
+                base = self._base(slot)
+                if q[base + _S_USED]:
+                    slots[q[base + _S_ID]] = slot
+            if q[_H_GENERATION] == generation:
+                self._slots, self._slots_generation = slots, generation
+                return
+
+    def _slot(self, product_id: int) -> int:
+        """Slot del producto; llamar con el lock de su franja tomado."""
+        if self._slots_generation != self._q[_H_GENERATION]:
+            self._refresh_slots()
+        slot = self._slots.get(product_id)
+        if slot is not None:
+            base = self._base(slot)
+            if self._q[base + _S_USED] and self._q[base + _S_ID] == product_id:
+                return slot
+        self._refresh_slots()
+        slot = self._slots.get(product_id)
+        if slot is None:
+            raise UnknownProduct(product_id)
+        return slot
+
+    def _next_version(self) -> int:
+        with self._version_lock:
+            version = self._q[_H_VERSION] + 1
+            self._q[_H_VERSION] = version
+            return version
+
+    def _bump_generation(self) -> None:
+        self._q[_H_GENERATION] += 1  # con el lock de altas/bajas tomado
+
+    def _notify(self, change: InventoryChange) -> None:
+        for listener in self._listeners:
+            try:
+                listener(change)
+            except Exception:
+                pass
+
+    def _name(self, slot: int) -> str:
+        start = (self._base(slot) + 5) * 8
+        return bytes(self._shm.buf[start:start + _NAME_BYTES]).rstrip(b'\0').decode('utf-8', errors='ignore')
+
+    def _record(self, slot: int) -> dict:
+        base = self._base(slot)
+        return {
+            "id": self._q[base + _S_ID],
+            "name": self._name(slot),
+            "price": self._d[base + _S_PRICE],
+            "stock": self._q[base + _S_STOCK],
+        }
+
+    def _upsert_locked(self, product_id: int, name: str, price: float, stock: int) -> Tuple[int, Optional[int], int]:
+        if self._slots_generation != self._q[_H_GENERATION]:
+            self._refresh_slots()
+        slot = self._slots.get(product_id)
+        previous = None
+        if slot is None:
+            used = set(self._slots.values())
+            slot = next((s for s in range(self.capacity) if s not in used), None)
+            if slot is None:
+                raise ValueError(f"Inventario compartido lleno (capacidad {self.capacity})")
+        else:
+            previous = self._q[self._base(slot) + _S_STOCK]
+        base = self._base(slot)
+        raw_name = name.encode('utf-8')[:_NAME_BYTES]
+        start = (base + 5) * 8
+        self._shm.buf[start:start + _NAME_BYTES] = raw_name.ljust(_NAME_BYTES, b'\0')
+        version = self._next_version()
+        self._q[base + _S_ID] = product_id
+        self._d[base + _S_PRICE] = price
+        self._q[base + _S_STOCK] = stock
+        self._q[base + _S_VERSION] = version
+        if not self._q[base + _S_USED]:
+            self._q[base + _S_USED] = 1
+            self._bump_generation()
+        return slot, previous, version
+
+    # ===== ALTAS / BAJAS =====
+
+    def _upsert_struct_locked(self, product_id: int, name: str, price: float, stock: int) -> dict:
+        # El lock de altas/bajas no es reentrante entre procesos: add/update no llaman a upsert
+        with self._lock_for(product_id):
+            slot, previous, version = self._upsert_locked(product_id, name, price, stock)
+            record = self._record(slot)
+        self._notify(InventoryChange('upsert', product_id, previous, stock, version))
+        return record
+
+    def upsert(self, product_id: int, name: str, price: float, stock: int) -> dict:
+        with self._struct_lock:
+            return self._upsert_struct_locked(product_id, name, price, stock)
+
+    def add(self, product_id: int, name: str, price: float, stock: int) -> dict:
+        with self._struct_lock:
+            if product_id in self:
+                raise ValueError(f"ID de producto {product_id} ya existe")
+            return self._upsert_struct_locked(product_id, name, price, stock)
+
+    def update(self, product_id: int, name: str, price: float, stock: int) -> dict:
+        with self._struct_lock:
+            if product_id not in self:
+                raise UnknownProduct(product_id)
+            return self._upsert_struct_locked(product_id, name, price, stock)
+
+    def remove(self, product_id: int) -> dict:
+        with self._struct_lock, self._lock_for(product_id):
+            slot = self._slot(product_id)
+            record = self._record(slot)
+            self._q[self._base(slot) + _S_USED] = 0
+            self._bump_generation()
+            version = self._next_version()
+        self._notify(InventoryChange('remove', product_id, record["stock"], None, version))
+        return record
+
+    # ===== STOCK (ATÓMICO POR PRODUCTO, ENTRE PROCESOS) =====
+
+    def reserve(self, product_id: int, quantity: int) -> int:
+        with self._lock_for(product_id):
+            base = self._base(self._slot(product_id))
+            available = self._q[base + _S_STOCK]
+            if available < quantity:
+                raise InsufficientStock(product_id, available, quantity)
+            remaining = available - quantity
+            self._q[base + _S_STOCK] = remaining
+            version = self._q[base + _S_VERSION] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, available, remaining, version))
+        return remaining
+
+    def release(self, product_id: int, quantity: int) -> int:
+        with self._lock_for(product_id):
+            base = self._base(self._slot(product_id))
+            previous = self._q[base + _S_STOCK]
+            stock = self._q[base + _S_STOCK] = previous + quantity
+            version = self._q[base + _S_VERSION] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, previous, stock, version))
+        return stock
+
+    def decrement_clamped(self, product_id: int, quantity: int) -> Tuple[int, int]:
+        with self._lock_for(product_id):
+            base = self._base(self._slot(product_id))
+            previous = self._q[base + _S_STOCK]
+            stock = self._q[base + _S_STOCK] = max(0, previous - quantity)
+            version = self._q[base + _S_VERSION] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, previous, stock, version))
+        return previous, stock
+
+    def decrement_many(self, items: Sequence[Tuple[int, int]]) -> List[Optional[Tuple[int, int]]]:
+        """Lote de `decrement_clamped` en un solo paso; franjas bloqueadas en orden de índice."""
+        results: List[Optional[Tuple[int, int]]] = []
+        changes: List[InventoryChange] = []
+        with ExitStack() as stack:
+            for index in sorted({hash(product_id) % len(self._stripes) for product_id, _ in items}):
+                stack.enter_context(self._stripes[index])
+            for product_id, quantity in items:
+                try:
+                    base = self._base(self._slot(product_id))
+                except UnknownProduct:
+                    results.append(None)
+                    continue
+                previous = self._q[base + _S_STOCK]
+                stock = self._q[base + _S_STOCK] = max(0, previous - quantity)
+                version = self._q[base + _S_VERSION] = self._next_version()
+                results.append((previous, stock))
+                changes.append(InventoryChange('stock', product_id, previous, stock, version))
+        for change in changes:
+            self._notify(change)
+        return results
+
+    def compare_and_set(self, product_id: int, expected: int, stock: int) -> bool:
+        with self._lock_for(product_id):
+            base = self._base(self._slot(product_id))
+            if self._q[base + _S_STOCK] != expected:
+                return False
+            self._q[base + _S_STOCK] = stock
+            version = self._q[base + _S_VERSION] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, expected, stock, version))
+        return True
+
+    def set_stock(self, product_id: int, stock: int) -> int:
+        with self._lock_for(product_id):
+            base = self._base(self._slot(product_id))
+            previous = self._q[base + _S_STOCK]
+            self._q[base + _S_STOCK] = stock
+            version = self._q[base + _S_VERSION] = self._next_version()
+        self._notify(InventoryChange('stock', product_id, previous, stock, version))
+        return stock
+
+    # ===== LECTURA (SIN LOCKS) =====
+
+    def get(self, product_id: int) -> Optional[dict]:
+        if self._slots_generation != self._q[_H_GENERATION]:
+            self._refresh_slots()
+        slot = self._slots.get(product_id)
+        if slot is None:
+            return None
+        record = self._record(slot)
+        return record if record["id"] == product_id else None
+
+    def stock(self, product_id: int) -> int:
+        record = self.get(product_id)
+        if record is None:
+            raise UnknownProduct(product_id)
+        return record["stock"]
+
+    def product_version(self, product_id: int) -> int:
+        if product_id not in self:
+            raise UnknownProduct(product_id)
+        return self._q[self._base(self._slots[product_id]) + _S_VERSION]
+
+    @property
+    def version(self) -> int:
+        return self._q[_H_VERSION]
+
+    def snapshot(self) -> List[dict]:
+        if self._slots_generation != self._q[_H_GENERATION]:
+            self._refresh_slots()
+        return [self._record(slot) for _, slot in sorted(self._slots.items())]
+
+    def changes_since(self, version: int) -> Tuple[int, List[dict]]:
+        """Igual que `InventoryEngine.changes_since` (la barrera cubre a todos los procesos)."""
+        cutoff = self._q[_H_VERSION]
+        for lock in self._stripes:
+            with lock:
+                pass
+        if self._slots_generation != self._q[_H_GENERATION]:
+            self._refresh_slots()
+        return cutoff, [
+            self._record(slot) for _, slot in sorted(self._slots.items())
+            if self._q[self._base(slot) + _S_VERSION] > version
+        ]
+
+    def __contains__(self, product_id: int) -> bool:
+        return self.get(product_id) is not None
+
+    def __len__(self) -> int:
+        if self._slots_generation != self._q[_H_GENERATION]:
+            self._refresh_slots()
+        return len(self._slots)
+
+    # ===== LISTENERS / CICLO DE VIDA =====
+
+    def add_listener(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        self._listeners.remove(listener)
+
+    def close(self) -> None:
+        """Libera las vistas de este proceso (el segmento sigue existiendo)."""
+        self._q.release()
+        self._d.release()
+        self._shm.close()
+        os.close(self._lock_fd)
+
+    def unlink(self) -> None:
+        """Elimina el segmento compartido (p. ej. para reiniciar el stock desde la semilla)."""
+        # SharedMemory.unlink des-registra del resource_tracker: volver a registrar para balancear
+        resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
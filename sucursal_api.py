@@ -4,25 +4,92 @@ Esta API implementa el principio de AUTONOMÍA: puede operar
 independientemente del servidor central.
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import List, Optional
 from datetime import datetime
-import httpx
+from contextlib import asynccontextmanager
+import asyncio
+import os
 import logging
-import json
+import uuid
+
+import pika
+
+from amqp_publisher import PooledPublisher
+from retry_engine import AsyncRetryScheduler, RequestRejected, RetryPolicy
+from outbox import BatchRejected, SaleOutbox, OutboxDrainer
+from sales_stats import SalesStats, RESOLUTIONS
+from inventory_engine import InsufficientStock, InventoryEngine, UnknownProduct, build_inventory
+from response_cache import VersionedResponseCache, inventario_rows
+from live_events import EventBroadcaster, InventoryFeed
+from exports import export_response, naive_local
+from branch_registry import HeartbeatSender
+import codec
+import sale_topology
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Formato de los mensajes de venta: SALE_CODEC=json|orjson|msgpack|sale-struct
+SALE_CODEC = codec.codec_from_env('SALE_CODEC')
+# Colas de venta: SALE_SHARDS=1 cola única; N>1 shards por product_id (ver sale_topology.py)
+SALE_SHARDS = sale_topology.shard_count()
+
+
+def declare_sale_topology(channel):
+    """Declara las colas de notificaciones de venta (una vez por conexión del publisher)."""
+    sale_topology.declare_sale_topology(channel, SALE_SHARDS)
+
+
+# Publisher compartido: conexiones persistentes propiedad del lifespan de la app.
+# Con publisher confirms: el outbox marca un lote como enviado solo tras el basic.ack
+sale_publisher = PooledPublisher(
+    setup_topology=declare_sale_topology,
+    pool_size=2,
+    name='sale-publisher',
+    confirm=True
+)
+
+# Reintentos HTTP no bloqueantes con un cliente keep-alive compartido
+http_notifier = AsyncRetryScheduler(timeout=5.0)
+
+HTTP_POLICIES = {
+    "http": RetryPolicy(max_attempts=1),
+    "http_retry": RetryPolicy(max_attempts=3, base_delay=1.0, multiplier=1.0),
+    "http_backoff": RetryPolicy(max_attempts=4, base_delay=2.0, multiplier=2.0, max_delay=16.0),
+}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if NOTIFY_METHOD == "rabbitmq":
+        # Con métodos HTTP no se abre conexión a RabbitMQ (se inicia si se cambia el método)
+        sale_publisher.start()
+    await http_notifier.start()
+    outbox_drainer.start()
+    live_events.start()
+    inventory_feed.start()
+    heartbeat_sender.start()
+    try:
+        yield
+    finally:
+        await heartbeat_sender.stop()
+        await inventory_feed.stop()
+        await outbox_drainer.stop()
+        await http_notifier.close()
+        sale_publisher.stop()
+
+
 app = FastAPI(
     title="EcoMarket Sucursal API",
     description="API de sucursal autónoma",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configuración de templates y archivos estáticos
@@ -43,17 +110,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-import time
-BRANCH_ID = "sucursal-001"
-CENTRAL_API_URL = "http://localhost:8000"
+BRANCH_ID = os.environ.get("BRANCH_ID", "sucursal-001")
+CENTRAL_API_URL = os.environ.get("CENTRAL_API_URL", "http://localhost:8000")
+# URL con la que el central (y su dashboard) llegan a esta sucursal
+BRANCH_PUBLIC_URL = os.environ.get("BRANCH_PUBLIC_URL", "http://localhost:8001")
+
+# Registro y latidos al central (HEARTBEAT_INTERVAL=0 los desactiva)
+heartbeat_sender = HeartbeatSender(
+    CENTRAL_API_URL, BRANCH_ID, BRANCH_PUBLIC_URL,
+    interval=float(os.environ.get("HEARTBEAT_INTERVAL", "5"))
+)
+
+# ===== OUTBOX LOCAL (WRITE-AHEAD) =====
+# Las notificaciones se persisten junto con el descuento de stock y se drenan en lotes
+sale_outbox = SaleOutbox(os.environ.get("OUTBOX_PATH", f"outbox_{BRANCH_ID}.db"))
 
 from fastapi import Form
 from fastapi.responses import RedirectResponse
-NOTIFY_METHOD = "rabbitmq"  # Valor inicial, se puede cambiar desde el dashboard
+# Valor inicial (NOTIFY_METHOD=rabbitmq|http|http_retry|http_backoff), se puede cambiar desde el dashboard
+NOTIFY_METHOD = os.environ.get("NOTIFY_METHOD", "rabbitmq")
 @app.post("/set-method", tags=["Configuración"])
 async def set_notify_method(method: str = Form(...)):
     global NOTIFY_METHOD
     NOTIFY_METHOD = method
+    if method == "rabbitmq":
+        sale_publisher.start()  # idempotente
     logger.info(f"🔄 Método de notificación cambiado a: {method}")
     return RedirectResponse(url="/dashboard", status_code=303)
 
@@ -80,15 +161,37 @@ class SaleResponse(BaseModel):
 
 # ===== INVENTARIO LOCAL (AUTONOMÍA) =====
 # CONCEPTO CLAVE: Cada sucursal mantiene su propia "verdad local"
-local_inventory: Dict[int, Product] = {
-    1: Product(id=1, name="Manzanas Orgánicas", price=2.50, stock=25),
-    2: Product(id=2, name="Pan Integral", price=1.80, stock=15),
-    3: Product(id=3, name="Leche Deslactosada", price=3.20, stock=8),
-    4: Product(id=4, name="Café Premium", price=8.90, stock=6),
-    5: Product(id=5, name="Quinoa", price=12.50, stock=3)
-}
+# Reservas de stock atómicas por producto: sin sobreventa aunque haya ventas concurrentes.
+# INVENTORY_BACKEND=shm comparte el stock entre workers (uvicorn --workers N)
+local_inventory = build_inventory((p.model_dump() for p in [
+    Product(id=1, name="Manzanas Orgánicas", price=2.50, stock=25),
+    Product(id=2, name="Pan Integral", price=1.80, stock=15),
+    Product(id=3, name="Leche Deslactosada", price=3.20, stock=8),
+    Product(id=4, name="Café Premium", price=8.90, stock=6),
+    Product(id=5, name="Quinoa", price=12.50, stock=3)
+]), name=f"ecomarket_inventory_{BRANCH_ID}")
+
+def inventory_products() -> List[Product]:
+    return [Product(**record) for record in local_inventory.snapshot()]
+
+# Respuestas de inventario serializadas una vez por versión (ETag / 304)
+inventory_cache = VersionedResponseCache(local_inventory, {
+    "inventory": list,
+    "inventario": inventario_rows,
+})
+
+# Cambios de inventario y ventas empujados al dashboard (GET /events). Con el inventario
+# compartido entre workers se consulta el feed de cambios: los de otros workers no llegan por listener
+live_events = EventBroadcaster()
+inventory_feed = InventoryFeed(
+    local_inventory, live_events,
+    poll_interval=None if isinstance(local_inventory, InventoryEngine) else 0.5
+)
 
+# Historial y agregados son por proceso: con --workers N cada worker ve sus propias ventas
 sales_history: List[SaleResponse] = []
+# Agregados incrementales: se actualizan en cada venta, consultarlos es O(1)
+sales_stats = SalesStats()
 
 # ===== ENDPOINTS =====
 
@@ -97,13 +200,18 @@ async def dashboard_root(request: Request):
     """Dashboard principal de la sucursal"""
     return templates.TemplateResponse("sucursal_dashboard.html", {
         "request": request,
-        "inventory": list(local_inventory.values()),
+        "inventory": inventory_products(),
         "total_products": len(local_inventory),
         "sales": sales_history[-10:],  # Últimas 10 ventas
         "branch_id": BRANCH_ID,
         "timestamp": datetime.now()
     })
 
+@app.get("/events", tags=["Visual"])
+async def dashboard_events(request: Request):
+    """Stream SSE para el dashboard: eventos `inventory` (cambios de producto) y `sale` (ventas de este worker)"""
+    return live_events.response(request)
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     """Servir favicon para evitar errores 404"""
@@ -130,7 +238,7 @@ async def api_root():
     }
 
 @app.get("/inventory", response_model=List[Product], tags=["Inventario"])
-async def get_local_inventory():
+async def get_local_inventory(request: Request):
     """
     CONCEPTO CLAVE: Consulta local instantánea
     
@@ -139,39 +247,45 @@ async def get_local_inventory():
     """
     logger.info("🏪 Consultando inventario LOCAL (operación autónoma)")
     try:
-        inventory_list = list(local_inventory.values())
-        return inventory_list
+        return inventory_cache.response("inventory", request)
     except Exception as e:
         logger.error(f"Error obteniendo inventario: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+# Feed de cambios para la sincronización por deltas del central (ver branch_sync.py)
+@app.get("/inventory/changes", tags=["Remoto"])
+async def get_inventory_changes(since: int = 0, epoch: Optional[str] = None):
+    """Productos cambiados después de la versión `since`; todos si la época no coincide (reinicio)"""
+    full = since <= 0 or (epoch is not None and epoch != local_inventory.epoch)
+    version, changes = local_inventory.changes_since(0 if full else since)
+    return {
+        "branch_id": BRANCH_ID,
+        "epoch": local_inventory.epoch,
+        "version": version,
+        "full": full,
+        "changes": changes
+    }
+
 @app.get("/inventario", tags=["Inventario"])
-async def get_inventario_sucursal():
+async def get_inventario_sucursal(request: Request):
     """Obtiene inventario de sucursal (endpoint en español)"""
     logger.info("🏪 Consultando inventario de sucursal en español")
-    products = []
-    for product in local_inventory.values():
-        products.append({
-            "id": product.id,
-            "nombre": product.name,  # Convertir name a nombre
-            "precio": product.price,  # Convertir price a precio
-            "stock": product.stock
-        })
-    return products
+    return inventory_cache.response("inventario", request)
 
 # Endpoint para consulta remota del inventario de sucursal
 @app.get("/remote-inventory", response_class=JSONResponse, tags=["Remoto"])
-async def get_remote_inventory():
+async def get_remote_inventory(request: Request):
     """Permite al servidor central consultar el inventario de la sucursal"""
-    return [product.model_dump() for product in local_inventory.values()]
+    return inventory_cache.response("inventory", request)
 
 # Endpoint para modificar inventario de sucursal desde central
 @app.put("/remote-inventory/{product_id}", response_class=JSONResponse, tags=["Remoto"])
 async def update_remote_inventory(product_id: int, updated: Product):
     """Permite al servidor central actualizar el inventario de la sucursal"""
-    if product_id not in local_inventory:
+    try:
+        local_inventory.update(product_id, updated.name, updated.price, updated.stock)
+    except UnknownProduct:
         raise HTTPException(status_code=404, detail="Producto no encontrado en sucursal")
-    local_inventory[product_id] = updated
     logger.info(f"📦 Inventario actualizado remotamente: {updated.name} (ID: {product_id})")
     return updated.model_dump()
 
@@ -184,7 +298,12 @@ async def update_product_stock(product_id: int, stock_data: dict):
     
     # Si solo se envía stock, actualizar solo el stock
     if "stock" in stock_data:
-        local_inventory[product_id].stock = stock_data["stock"]
+        try:
+            local_inventory.set_stock(product_id, int(stock_data["stock"]))
+        except UnknownProduct:
+            raise HTTPException(status_code=404, detail="Producto no encontrado en sucursal")
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="El stock debe ser un entero")
         logger.info(f"📦 Stock actualizado para producto {product_id}: {stock_data['stock']}")
         return {
             "status": "success",
@@ -199,37 +318,81 @@ async def get_sales():
     """Obtiene el historial de ventas de la sucursal"""
     return [sale.model_dump() for sale in sales_history]
 
+def _iter_sales(since: Optional[datetime], until: Optional[datetime]):
+    """Ventas del historial sin copiarlo; solo las existentes al empezar la exportación."""
+    end = len(sales_history)
+    # El historial está en orden de llegada: búsqueda binaria del primer `since`
+    lo, hi = 0, end
+    while since is not None and lo < hi:
+        mid = (lo + hi) // 2
+        if sales_history[mid].timestamp < since:
+            lo = mid + 1
+        else:
+            hi = mid
+    for index in range(lo, end):
+        sale = sales_history[index]
+        if until is not None and sale.timestamp > until:
+            break
+        yield sale.model_dump(mode='json')
+
+@app.get("/sales/export", tags=["Ventas"])
+async def export_sales(
+    fmt: str = Query("ndjson", alias="format", description="ndjson | csv"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False
+):
+    """Exporta el historial de ventas en streaming (NDJSON o CSV) para conciliación"""
+    # Los timestamps del historial son locales sin zona: comparar antes de empezar a enviar
+    since, until = naive_local(since), naive_local(until)
+    return export_response(
+        _iter_sales(since, until), fmt, list(SaleResponse.model_fields), f"ventas_{BRANCH_ID}", gzip=gzip
+    )
+
 @app.post("/sales", response_model=SaleResponse, tags=["Ventas"])
-async def process_sale(sale_request: SaleRequest, background_tasks: BackgroundTasks):
+async def process_sale(sale_request: SaleRequest):
     """
     CONCEPTO CLAVE: Procesamiento autónomo de ventas
     
     Este es el corazón de la autonomía:
     1. Verifica stock LOCAL inmediatamente
     2. Procesa la venta SIN esperar al servidor central  
-    3. Envía notificación al central de forma ASÍNCRONA
+    3. Registra la notificación en el outbox local; el drainer la envía
+       al central de forma ASÍNCRONA y en lotes
     """
     
-    # PASO 1: Verificación inmediata contra inventario local
-    if sale_request.product_id not in local_inventory:
+    # PASO 1: Reserva atómica contra inventario local (verifica y descuenta en un paso)
+    product = local_inventory.get(sale_request.product_id)
+    if product is None:
         raise HTTPException(status_code=404, detail="Producto no disponible")
-    
-    product = local_inventory[sale_request.product_id]
-    
-    if product.stock < sale_request.quantity:
+    try:
+        remaining_stock = local_inventory.reserve(sale_request.product_id, sale_request.quantity)
+    except UnknownProduct:
+        raise HTTPException(status_code=404, detail="Producto no disponible")
+    except InsufficientStock as e:
         raise HTTPException(
             status_code=400,
-            detail=f"Stock insuficiente. Disponible: {product.stock}"
+            detail=f"Stock insuficiente. Disponible: {e.available}"
         )
     
-    # PASO 2: Procesar la venta INMEDIATAMENTE
-    product.stock -= sale_request.quantity
+    # PASO 2: Procesar la venta INMEDIATAMENTE (stock + outbox en el mismo paso)
     sale_timestamp = datetime.now()
-    total_amount = product.price * sale_request.quantity
+    total_amount = product["price"] * sale_request.quantity
+    try:
+        sale_outbox.append(build_sale_notification(
+            sale_request.product_id,
+            sale_request.quantity,
+            sale_timestamp,
+            total_amount
+        ))
+    except Exception as e:
+        local_inventory.release(sale_request.product_id, sale_request.quantity)
+        logger.error(f"❌ No se pudo registrar la venta en el outbox: {e}")
+        raise HTTPException(status_code=500, detail="No se pudo registrar la venta")
     
     sale_response = SaleResponse(
         sale_id=f"{BRANCH_ID}_{sale_timestamp.isoformat()}",
-        product_name=product.name,
+        product_name=product["name"],
         quantity_sold=sale_request.quantity,
         total_amount=total_amount,
         timestamp=sale_timestamp,
@@ -237,45 +400,58 @@ async def process_sale(sale_request: SaleRequest, background_tasks: BackgroundTa
     )
     
     sales_history.append(sale_response)
+    sales_stats.record(product["id"], product["name"], sale_request.quantity, total_amount, sale_timestamp)
+    if live_events.has_clients:
+        live_events.publish('sale', {"sale": sale_response.model_dump(mode='json'), "stats": sales_stats.summary()})
     
     logger.info(
-        f"💰 Venta procesada LOCALMENTE: {sale_request.quantity}x {product.name} "
-        f"por ${total_amount:.2f}. Stock restante: {product.stock}"
+        f"💰 Venta procesada LOCALMENTE: {sale_request.quantity}x {product['name']} "
+        f"por ${total_amount:.2f}. Stock restante: {remaining_stock}"
     )
     
-    # PASO 3: Notificar al central de forma ASÍNCRONA
-    # Solo usa el método seleccionado
-    background_tasks.add_task(
-        notify_central_about_sale,
-        sale_request.product_id,
-        sale_request.quantity,
-        sale_timestamp,
-        total_amount,
-        NOTIFY_METHOD
-    )
+    # PASO 3: Despertar al drainer para notificar al central de forma ASÍNCRONA
+    outbox_drainer.wake()
     
     return sale_response
 
 @app.get("/sales/stats", tags=["Ventas"])
 async def get_sales_stats():
     """Estadísticas de ventas de la sucursal"""
-    if not sales_history:
-        return {"total_sales": 0, "total_revenue": 0, "average_sale": 0}
-    
-    total_revenue = sum(sale.total_amount for sale in sales_history)
+    return sales_stats.summary()
+
+@app.get("/sales/stats/by-product", tags=["Ventas"])
+async def get_sales_stats_by_product():
+    """Estadísticas de ventas acumuladas por producto"""
+    return sales_stats.by_product()
+
+@app.get("/sales/stats/timeseries", tags=["Ventas"])
+async def get_sales_stats_timeseries(resolution: str = "minute", limit: int = 60):
+    """Ventas agrupadas por minuto, hora o día (últimos `limit` intervalos)"""
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Resolución inválida. Opciones: {', '.join(RESOLUTIONS)}")
+    return sales_stats.timeseries(resolution, limit)
+
+@app.get("/outbox/stats", tags=["Comunicación"])
+async def get_outbox_stats():
+    """Estado del outbox local de notificaciones"""
     return {
-        "total_sales": len(sales_history),
-        "total_revenue": round(total_revenue, 2),
-        "average_sale": round(total_revenue / len(sales_history), 2)
+        **sale_outbox.stats(),
+        "batches_sent": outbox_drainer.batches_sent,
+        "delivered_total": outbox_drainer.delivered
     }
 
+@app.get("/notifications/retries", tags=["Comunicación"])
+async def get_retry_stats():
+    """Estado del motor de reintentos HTTP (reintentos en vuelo, antigüedad y circuitos)"""
+    return http_notifier.stats()
+
 # Interfaz visual básica para ventas
 @app.get("/dashboard", response_class=HTMLResponse, tags=["Visual"])
 async def dashboard(request: Request):
     """Dashboard de la sucursal con datos dinámicos"""
     return templates.TemplateResponse("sucursal_dashboard.html", {
         "request": request,
-        "inventory": list(local_inventory.values()),
+        "inventory": inventory_products(),
         "total_products": len(local_inventory),
         "sales": sales_history[-10:],  # Últimas 10 ventas
         "branch_id": BRANCH_ID,
@@ -283,106 +459,62 @@ async def dashboard(request: Request):
         "notify_method": NOTIFY_METHOD
     })
 
-async def notify_central_about_sale(
+def build_sale_notification(
     product_id: int,
     quantity_sold: int,
     timestamp: datetime,
-    sale_amount: float,
-    method: str = "rabbitmq"
-):
-    """
-    CONCEPTO CLAVE: Comunicación asíncrona resiliente
-    
-    Esta función se ejecuta en segundo plano.
-    Si falla, la venta ya está completada localmente.
-    """
-    notification = {
+    sale_amount: float
+) -> dict:
+    return {
         "branch_id": BRANCH_ID,
         "product_id": product_id,
         "quantity_sold": quantity_sold,
         "timestamp": timestamp.isoformat(),
         "sale_price": sale_amount
     }
-    if method == "http":
-        # HTTP Directo
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.post(f"{CENTRAL_API_URL}/sale-notification", json=notification)
-                if response.status_code == 200:
-                    logger.info("✅ Notificación enviada por HTTP directo")
-                else:
-                    logger.warning(f"⚠️ Error HTTP: {response.status_code}")
-        except Exception as e:
-            logger.error(f"❌ Error HTTP directo: {e}")
-    elif method == "http_retry":
-        # HTTP con reintentos simples
-        max_attempts = 3
-        for attempt in range(1, max_attempts+1):
-            try:
-                async with httpx.AsyncClient(timeout=5.0) as client:
-                    response = await client.post(f"{CENTRAL_API_URL}/sale-notification", json=notification)
-                    if response.status_code == 200:
-                        logger.info(f"✅ Notificación enviada por HTTP reintento {attempt}")
-                        break
-                    else:
-                        logger.warning(f"⚠️ Error HTTP reintento {attempt}: {response.status_code}")
-            except Exception as e:
-                logger.error(f"❌ Error HTTP reintento {attempt}: {e}")
-            time.sleep(1)
-    elif method == "http_backoff":
-        # HTTP con backoff exponencial
-        max_attempts = 4
-        for attempt in range(1, max_attempts+1):
-            try:
-                async with httpx.AsyncClient(timeout=5.0) as client:
-                    response = await client.post(f"{CENTRAL_API_URL}/sale-notification", json=notification)
-                    if response.status_code == 200:
-                        logger.info(f"✅ Notificación enviada por HTTP backoff {attempt}")
-                        break
-                    else:
-                        logger.warning(f"⚠️ Error HTTP backoff {attempt}: {response.status_code}")
-            except Exception as e:
-                logger.error(f"❌ Error HTTP backoff {attempt}: {e}")
-            time.sleep(2 ** attempt)
-    elif method == "rabbitmq":
-        # RabbitMQ
-        import pika
-        import uuid
-        notification["message_id"] = str(uuid.uuid4())
+
+async def send_outbox_batch(notifications: List[dict]) -> int:
+    """Envía un lote del outbox con el método activo; retorna cuántas se entregaron en orden."""
+    method = NOTIFY_METHOD
+    if method == "rabbitmq":
+        # N notificaciones en un solo mensaje AMQP; cada una conserva su message_id
+        # Con shards, un mensaje por shard; si alguno falla se reenvía el lote completo
+        # (el consumer descarta por message_id las ventas ya aplicadas)
+        futures = []
+        for shard_notifications in sale_topology.split_by_shard(notifications, SALE_SHARDS).values():
+            batch = {"message_id": str(uuid.uuid4()), "notifications": shard_notifications}
+            body, content_type = codec.encode(batch, SALE_CODEC)
+            exchange, routing_key = sale_topology.route(shard_notifications[0]["product_id"], SALE_SHARDS)
+            futures.append(asyncio.wrap_future(sale_publisher.publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                body=body,
+                properties=pika.BasicProperties(delivery_mode=2, content_type=content_type)
+            )))
+        await asyncio.gather(*futures)
+        return len(notifications)
+    if method in HTTP_POLICIES:
+        # Todo el lote en un solo POST al endpoint bulk del central
         try:
-            params = pika.ConnectionParameters(
-                host='localhost',
-                port=5672,
-                credentials=pika.PlainCredentials('ecomarket_user', 'ecomarket_password'),
-                heartbeat=600,
-                blocked_connection_timeout=300
-            )
-            connection = pika.BlockingConnection(params)
-            channel = connection.channel()
-            channel.queue_declare(
-                queue='sale_notifications',
-                durable=True,
-                arguments={
-                    'x-message-ttl': 86400000,
-                    'x-dead-letter-exchange': '',
-                    'x-dead-letter-routing-key': 'sale_notifications_dlq'
-                }
+            ok = await http_notifier.post(
+                f"{CENTRAL_API_URL}/sale-notifications/batch",
+                notifications,
+                HTTP_POLICIES[method],
+                label=method
             )
-            channel.basic_publish(
-                exchange='',
-                routing_key='sale_notifications',
-                body=json.dumps(notification),
-                properties=pika.BasicProperties(
-                    delivery_mode=2  # make message persistent
-                )
-            )
-            connection.close()
-            logger.info(f"📡 Notificación enviada a RabbitMQ: {notification}")
-        except Exception as e:
-            logger.error(f"❌ Error al notificar por RabbitMQ: {e}")
-            # IMPORTANTE: La venta YA está completada, esto es solo notificación
-    else:
-        logger.error(f"❌ Método de notificación desconocido: {method}")
+        except RequestRejected as e:
+            # 4xx: el central no lo aceptará nunca; el drainer aparta la fila rechazada
+            raise BatchRejected(str(e)) from e
+        return len(notifications) if ok else 0
+    logger.error(f"❌ Método de notificación desconocido: {method}")
+    return 0
+
+outbox_drainer = OutboxDrainer(
+    sale_outbox,
+    send_outbox_batch,
+    batch_size=int(os.environ.get("OUTBOX_BATCH_SIZE", "100")),
+    max_attempts=int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "3"))
+)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Verificación de dedup_store con un reloj simulado (sin esperas reales).
+
+- PRUEBA1: un id agregado justo antes de una rotación del filtro de Bloom debe seguir
+  siendo "visto" mientras el store lo recuerde (todo su TTL). Caso reportado: ttl=10,
+  id agregado en 1004.9 y consultado en 1010.2.
+- PRUEBA2: barrido de instantes de alta y de consulta dentro del TTL: el store con filtro
+  de Bloom responde siempre lo mismo que el store solo.
+- PRUEBA3: vencido el TTL, el id deja de ser duplicado (el filtro no lo retiene de más
+  frente al store).
+
+Run with the project's venv python: python tests/dedup_store_runner.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dedup_store  # noqa: E402
+from dedup_store import BloomFrontedStore, MemoryDedupStore  # noqa: E402
+
+
+class FakeClock:
+    """Reemplaza al módulo `time` dentro de dedup_store: time() y monotonic() controlados."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def advance(store, clock: FakeClock, until: float, step: float = 0.1):
+    """Avanza el reloj con tráfico de fondo: la rotación del filtro es perezosa y solo
+    ocurre cuando llegan consultas, como en un consumer con carga continua."""
+    while clock.now + step <= until:
+        clock.now += step
+        'trafico' in store
+    clock.now = until
+
+
+def build(clock: FakeClock, ttl: float):
+    """Misma composición que build_dedup_store con DEDUP_BACKEND=memory y DEDUP_BLOOM=1."""
+    os.environ.update({'DEDUP_BACKEND': 'memory', 'DEDUP_TTL_SECONDS': str(ttl), 'DEDUP_BLOOM': '1',
+                       'DEDUP_MAX_SIZE': '10000'})
+    dedup_store.time = clock
+    store = dedup_store.build_dedup_store()
+    assert isinstance(store, BloomFrontedStore) and isinstance(store.store, MemoryDedupStore)
+    return store
+
+
+def prueba1():
+    clock = FakeClock(1000.0)
+    store = build(clock, ttl=10)
+    advance(store, clock, 1004.9)
+    store.add('venta-1')
+    advance(store, clock, 1010.2)
+    fronted, backing = 'venta-1' in store, 'venta-1' in store.store
+    passed = fronted and backing
+    print(f"PRUEBA1: bloom={fronted} store={backing} -> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def prueba2(ttl=10.0, step=0.1):
+    mismatches = []
+    for i in range(int(3 * ttl / step)):
+        # Un store nuevo por id: el reloj simulado no puede retroceder
+        clock = FakeClock(1000.0)
+        store = build(clock, ttl=ttl)
+        added_at = 1000.0 + i * step
+        message_id = f"venta-{i}"
+        advance(store, clock, added_at)
+        store.add(message_id)
+        for fraction in (0.25, 0.5, 0.75, 0.99):
+            advance(store, clock, added_at + fraction * ttl)
+            if (message_id in store) != (message_id in store.store):
+                mismatches.append((round(added_at, 1), round(clock.now, 1)))
+    passed = not mismatches
+    print(f"PRUEBA2: consultas distintas al store={len(mismatches)} {mismatches[:3]} -> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def prueba3(ttl=10.0):
+    clock = FakeClock(1000.0)
+    store = build(clock, ttl=ttl)
+    store.add('venta-vieja')
+    advance(store, clock, 1000.0 + ttl + 0.5)
+    seen = 'venta-vieja' in store
+    print(f"PRUEBA3: visto tras el TTL={seen} -> {'OK' if not seen else 'FALLA'}")
+    return not seen
+
+
+def main():
+    results = [prueba1(), prueba2(), prueba3()]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
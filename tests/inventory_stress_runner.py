@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Stress test de concurrencia para inventory_engine (sin sobreventa).
+
+- PRUEBA1: muchos hilos reservan 1 unidad a la vez sobre pocos productos; la cantidad de
+  reservas exitosas debe ser exactamente el stock inicial y el stock final 0 (nunca negativo).
+- PRUEBA2: reservas + devoluciones + descuentos acotados + compare-and-set mezclados con
+  lectores de snapshot; el stock final debe cuadrar con el registro de operaciones.
+- PRUEBA3: 200 ventas concurrentes contra POST /sales de la sucursal (hilos + TestClient)
+  sobre un producto con 25 unidades: exactamente 25 deben completarse.
+- Referencia: el patrón anterior (verificar y luego descontar sobre un dict) bajo la misma
+  carga, para mostrar la sobreventa que el motor evita.
+
+Run with the project's venv python: python tests/inventory_stress_runner.py [--threads 32]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inventory_engine import InventoryEngine, InsufficientStock  # noqa: E402
+
+
+def run_threads(threads, target):
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        return target(index)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(worker, range(threads)))
+
+
+def prueba1(threads, stock):
+    engine = InventoryEngine([{"id": pid, "name": f"p{pid}", "price": 1.0, "stock": stock} for pid in range(1, 4)])
+    negative = []
+    engine.add_listener(lambda change: change.stock is not None and change.stock < 0 and negative.append(change))
+
+    def target(_):
+        ok = 0
+        for _ in range(stock):  # cada hilo intenta vender todo el stock de cada producto
+            for pid in (1, 2, 3):
+                try:
+                    engine.reserve(pid, 1)
+                    ok += 1
+                except InsufficientStock:
+                    pass
+        return ok
+
+    sold = sum(run_threads(threads, target))
+    final = [engine.stock(pid) for pid in (1, 2, 3)]
+    passed = sold == 3 * stock and final == [0, 0, 0] and not negative
+    print(f"PRUEBA1: vendidas={sold} esperadas={3 * stock} stock_final={final} -> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def prueba2(threads, iterations):
+    initial = 1000
+    engine = InventoryEngine([{"id": 1, "name": "p1", "price": 1.0, "stock": initial}])
+    stop = threading.Event()
+    snapshot_errors = []
+
+    def reader():
+        while not stop.is_set():
+            for record in engine.snapshot():
+                if record["stock"] < 0:
+                    snapshot_errors.append(record)
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for t in readers:
+        t.start()
+
+    def target(index):
+        rnd = random.Random(index)
+        delta = 0
+        for _ in range(iterations):
+            op = rnd.random()
+            qty = rnd.randint(1, 5)
+            if op < 0.5:
+                try:
+                    engine.reserve(1, qty)
+                    delta -= qty
+                except InsufficientStock:
+                    pass
+            elif op < 0.8:
+                engine.release(1, qty)
+                delta += qty
+            elif op < 0.9:
+                before, after = engine.decrement_clamped(1, qty)
+                delta -= before - after
+            else:
+                current = engine.stock(1)
+                if current >= qty and engine.compare_and_set(1, current, current - qty):
+                    delta -= qty
+        return delta
+
+    start = time.perf_counter()
+    deltas = run_threads(threads, target)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in readers:
+        t.join()
+    expected = initial + sum(deltas)
+    final = engine.stock(1)
+    passed = final == expected and final >= 0 and not snapshot_errors
+    ops = threads * iterations
+    print(f"PRUEBA2: stock_final={final} esperado={expected} ops={ops} ({ops / elapsed:,.0f} ops/s) "
+          f"-> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def prueba3(threads):
+    try:
+        from fastapi.testclient import TestClient
+        import sucursal_api
+    except Exception as e:  # dependencias del API no instaladas
+        print(f"PRUEBA3: omitida ({e!r})")
+        return True
+
+    sucursal_api.local_inventory.set_stock(1, 25)
+    sucursal_api.sale_outbox.append = lambda notification: notification.setdefault("message_id", "stress")
+    client = TestClient(sucursal_api.app)
+    attempts = 200
+
+    def target(index):
+        codes = []
+        for _ in range(attempts // threads + (1 if index < attempts % threads else 0)):
+            codes.append(client.post("/sales", json={"product_id": 1, "quantity": 1}).status_code)
+        return codes
+
+    codes = [code for batch in run_threads(threads, target) for code in batch]
+    completed = codes.count(200)
+    final = sucursal_api.local_inventory.stock(1)
+    passed = completed == 25 and final == 0 and codes.count(400) == attempts - 25
+    print(f"PRUEBA3: ventas_ok={completed} rechazadas={codes.count(400)} stock_final={final} "
+          f"-> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def referencia_dict(threads, stock):
+    inventory = {1: {"stock": stock}}
+    sold = []
+
+    def target(_):
+        for _ in range(stock):
+            product = inventory[1]
+            if product["stock"] >= 1:
+                time.sleep(0)  # cede el GIL entre verificar y descontar (como un await)
+                product["stock"] -= 1
+                sold.append(1)
+
+    run_threads(threads, target)
+    print(f"REFERENCIA (dict sin locks): vendidas={len(sold)} de {stock} stock_final={inventory[1]['stock']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    # Cambios de hilo muy frecuentes para maximizar las intercalaciones
+    sys.setswitchinterval(1e-6)
+    results = [
+        prueba1(args.threads, args.stock),
+        prueba2(args.threads, args.iterations),
+        prueba3(min(args.threads, 16)),
+    ]
+    referencia_dict(args.threads, args.stock)
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Verificación del endpoint bulk /sale-notifications/batch del central (sin red, TestClient).
+
+- PRUEBA1: el mismo lote enviado dos veces (reenvío del outbox tras un timeout) descuenta
+  el stock una sola vez; la segunda respuesta informa cada venta como "duplicate".
+- PRUEBA2: un message_id repetido dentro del mismo lote se aplica una sola vez.
+- PRUEBA3: `decrement_many` concurrente desde varios hilos, con lotes que cruzan las
+  mismas franjas en distinto orden: sin interbloqueos y sin descuentos perdidos.
+
+Run with the project's venv python: python tests/sale_batch_runner.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # templates/ y static/ son rutas relativas
+
+WORKDIR = tempfile.mkdtemp(prefix='sale_batch_')
+os.environ.update({
+    'CENTRAL_DB_PATH': os.path.join(WORKDIR, 'central_inventory.db'),
+    'CENTRAL_DEDUP_PATH': os.path.join(WORKDIR, 'central_dedup.db'),
+    'NOTIFICATIONS_ARCHIVE': os.path.join(WORKDIR, 'sale_notifications_archive.ndjson'),
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import central_api  # noqa: E402
+from inventory_engine import InventoryEngine  # noqa: E402
+
+
+def sale(product_id, quantity, message_id=None):
+    return {
+        "branch_id": "sucursal-runner",
+        "product_id": product_id,
+        "quantity_sold": quantity,
+        "timestamp": datetime.now().isoformat(),
+        "sale_price": 1.0,
+        "message_id": message_id or str(uuid.uuid4()),
+    }
+
+
+def prueba1(client):
+    before = {pid: central_api.central_inventory.stock(pid) for pid in (1, 2)}
+    batch = [sale(1, 2), sale(2, 3), sale(1, 1)]
+    first = client.post('/sale-notifications/batch', json=batch).json()
+    second = client.post('/sale-notifications/batch', json=batch).json()
+    after = {pid: central_api.central_inventory.stock(pid) for pid in (1, 2)}
+    statuses = [item['status'] for item in second['results']]
+    passed = (first['applied'] == 3 and second['applied'] == 0 and statuses == ['duplicate'] * 3
+              and after == {1: before[1] - 3, 2: before[2] - 3})
+    print(f"PRUEBA1: stock {before} -> {after}, reenvío={statuses} -> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def prueba2(client):
+    before = central_api.central_inventory.stock(3)
+    repeated = sale(3, 4)
+    response = client.post('/sale-notifications/batch', json=[repeated, repeated]).json()
+    after = central_api.central_inventory.stock(3)
+    statuses = [item['status'] for item in response['results']]
+    passed = statuses == ['applied', 'duplicate'] and after == before - 4
+    print(f"PRUEBA2: stock {before} -> {after}, estados={statuses} -> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def prueba3(threads=8, rounds=200):
+    products = [{"id": pid, "name": f"p{pid}", "price": 1.0, "stock": 1_000_000} for pid in range(32)]
+    engine = InventoryEngine(products, stripes=8)
+
+    def worker(offset):
+        ids = [pid for pid in range(32)]
+        # Cada hilo recorre los productos en otro orden: sin orden fijo de locks se trabarían
+        ids = ids[offset:] + ids[:offset]
+        for _ in range(rounds):
+            engine.decrement_many([(pid, 1) for pid in ids])
+
+    pool = [threading.Thread(target=worker, args=(i * 5,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join(30)
+    stuck = sum(thread.is_alive() for thread in pool)
+    expected = 1_000_000 - threads * rounds
+    wrong = [pid for pid in range(32) if engine.stock(pid) != expected]
+    passed = not stuck and not wrong
+    print(f"PRUEBA3: hilos trabados={stuck} stocks incorrectos={len(wrong)} -> {'OK' if passed else 'FALLA'}")
+    return passed
+
+
+def main():
+    with TestClient(central_api.app) as client:
+        results = [prueba1(client), prueba2(client), prueba3()]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,12 @@ Script mínimo para publicar eventos UsuarioCreado en RabbitMQ (exchange fanout
 Usa las mismas credenciales y parámetros que el proyecto existente.
 """
 import pika
-import json
 import uuid
 from datetime import datetime
 import argparse
 
+import codec
+
 
 def get_connection_params():
     return pika.ConnectionParameters(
@@ -34,11 +35,12 @@ def publish_usuario_creado(user_id: str, nombre: str, email: str):
         'created_at': datetime.utcnow().isoformat()
     }
 
+    event_codec = codec.codec_from_env('EVENT_CODEC')
     channel.basic_publish(
         exchange='user_events',
         routing_key='',
-        body=json.dumps(event),
-        properties=pika.BasicProperties(delivery_mode=2)  # persistent
+        body=event_codec.encode(event),
+        properties=pika.BasicProperties(delivery_mode=2, content_type=event_codec.content_type)  # persistent
     )
     connection.close()
     print("[PUBLISH] UsuarioCreado publicado:", event)
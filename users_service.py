@@ -2,23 +2,43 @@
 Servicio mínimo que expone un endpoint POST /users para crear usuarios (simulado)
 y publicar el evento UsuarioCreado en RabbitMQ usando `events.publish_user_created`.
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Request
+from contextlib import asynccontextmanager
+import asyncio
 import os
 from pydantic import BaseModel, ValidationError
 import json
-from typing import Optional
 import uuid
+import random
 import logging
 
-from events import publish_user_created
+from events import (
+    get_user_events_publisher,
+    shutdown_user_events_publisher,
+    user_created_message,
+    user_events_publisher_stats,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Instance identifier (set via Docker env INSTANCE_ID to distinguish logs per replica)
 INSTANCE_ID = os.getenv('INSTANCE_ID', 'local')
+# Fracción de requests cuyo body crudo se registra en INFO (0 = solo en DEBUG)
+BODY_LOG_SAMPLE_RATE = float(os.getenv('BODY_LOG_SAMPLE_RATE', '0'))
 
-app = FastAPI(title="UsuarioService (Taller4)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Una sola conexión AMQP por réplica, sin importar el volumen de requests
+    get_user_events_publisher()
+    try:
+        yield
+    finally:
+        # Apagado ordenado: vaciar la cola de envío y esperar confirmaciones
+        await asyncio.to_thread(shutdown_user_events_publisher, 10.0)
+
+
+app = FastAPI(title="UsuarioService (Taller4)", lifespan=lifespan)
 
 
 class UserCreate(BaseModel):
@@ -27,49 +47,73 @@ class UserCreate(BaseModel):
     email: str
 
 
-@app.post('/users')
-async def create_user(request: Request, background_tasks: BackgroundTasks):
-    """Lee el body crudo, lo registra para debugging, valida con Pydantic manualmente
-    y publica UsuarioCreado en background. Esto devuelve errores de validación
-    detallados para depuración (evita el 400 silencioso de validación automática).
-    """
-    body_bytes = await request.body()
-    # Log a UTF-8-replaced version for debugging (safe to log)
-    body_text_safe = body_bytes.decode('utf-8', errors='replace')
-    logger.info("[%s] Raw request body: %s", INSTANCE_ID, body_text_safe)
-
-    # First try Starlette/FastAPI JSON parsing (respects charset)
+def _parse_user_body_fallback(body_bytes: bytes) -> UserCreate:
+    """Camino lento: prueba varias codificaciones antes de json.loads (clientes con charset raro)."""
     data = None
-    try:
-        data = await request.json()
-    except Exception:
-        # Fallback: try several decodings then json.loads
-        for enc in ('utf-8', 'latin-1', 'utf-16le', 'cp1252'):
-            try:
-                text = body_bytes.decode(enc)
-                data = json.loads(text)
-                logger.info("Parsed body using encoding %s", enc)
-                break
-            except Exception:
-                continue
-
-    if data is None:
+    for enc in ('utf-8', 'latin-1', 'utf-16le', 'cp1252'):
+        try:
+            text = body_bytes.decode(enc)
+            data = json.loads(text)
+            logger.info("Parsed body using encoding %s", enc)
+            break
+        except Exception:
+            continue
+
+    if not isinstance(data, dict):
         logger.error("Failed to parse JSON body (encoding/format issue)")
         raise HTTPException(status_code=400, detail="Invalid JSON or unsupported encoding")
 
     try:
-        user = UserCreate(**data)
+        return UserCreate(**data)
     except ValidationError as ve:
         logger.error("Validation error parsing UserCreate: %s", ve.errors())
         raise HTTPException(status_code=400, detail=ve.errors())
 
+
+def parse_user_body(body_bytes: bytes) -> UserCreate:
+    """Camino rápido: una sola decodificación JSON directo al modelo tipado (parser nativo de pydantic).
+
+    Solo si el body no es JSON UTF-8 válido se recurre al bucle de codificaciones.
+    """
+    try:
+        return UserCreate.model_validate_json(body_bytes)
+    except ValidationError as ve:
+        errors = ve.errors()
+        if any(err['type'] == 'json_invalid' for err in errors):
+            return _parse_user_body_fallback(body_bytes)
+        logger.error("Validation error parsing UserCreate: %s", errors)
+        raise HTTPException(status_code=400, detail=errors)
+
+
+def _log_body(body_bytes: bytes) -> None:
+    # El body completo solo se registra en DEBUG o para una muestra de requests
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[%s] Raw request body: %s", INSTANCE_ID, body_bytes.decode('utf-8', errors='replace'))
+    elif BODY_LOG_SAMPLE_RATE and random.random() < BODY_LOG_SAMPLE_RATE:
+        logger.info("[%s] Raw request body (muestra): %s", INSTANCE_ID, body_bytes.decode('utf-8', errors='replace'))
+
+
+@app.post('/users')
+async def create_user(request: Request):
+    """Lee el body crudo, lo valida con Pydantic manualmente y encola UsuarioCreado
+    en el publisher de la réplica (no bloquea el endpoint).
+    Esto devuelve errores de validación detallados para depuración (evita el 400
+    silencioso de validación automática).
+    """
+    body_bytes = await request.body()
+    _log_body(body_bytes)
+    user = parse_user_body(body_bytes)
+
     # Simular persistencia
     new_id = str(uuid.uuid4())
     new_user = {"id": new_id, "nombre": user.nombre, "email": user.email}
     logger.info("[%s] Usuario creado localmente: %s", INSTANCE_ID, new_user)
 
-    # Publicar evento en background (no bloquear endpoint)
-    background_tasks.add_task(publish_user_created, new_user)
+    # Encolar evento en la cola acotada del publisher (no bloquear endpoint)
+    body, properties = user_created_message(new_user)
+    if not get_user_events_publisher().publish_nowait(body, properties=properties):
+        logger.error("[%s] Cola de eventos llena; UsuarioCreado no encolado: %s", INSTANCE_ID, new_id)
+        raise HTTPException(status_code=503, detail="Cola de eventos llena, reintente más tarde")
 
     # Devolver también el identificador de instancia para facilitar pruebas de balanceo
     return {"user_id": new_id, "instance": INSTANCE_ID}
@@ -80,7 +124,7 @@ async def health():
     """Endpoint de salud usado por Docker HEALTHCHECK y Nginx (pasivo).
     Devuelve 200 con JSON sencillo y el id de instancia.
     """
-    return {"status": "healthy", "instance": INSTANCE_ID}
+    return {"status": "healthy", "instance": INSTANCE_ID, "publisher": user_events_publisher_stats()}
 
 
 if __name__ == '__main__':